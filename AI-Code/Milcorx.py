@@ -3,17 +3,27 @@ import asyncio
 import json
 import random
 import os
+import signal
+import threading
 import time
 from colorama import init, Fore, Style
 from datetime import datetime
-from typing import AsyncGenerator, List, Dict, Tuple
+from typing import AsyncGenerator, List, Dict
+from token_budget import context_budget, select_context
+from stream_parser import StreamParser
+from router import Router, endpoint_fault
+from hedging import HedgeConfig, hedging
+from upstream import HTTP2_AVAILABLE, PoolConfig
+from terminal_render import StreamRenderer, Typewriter
+from display_width import char_width
+import tracing
 
 
 # ==================== 核心配置 ====================
 class Config:
     """应用程序核心配置 - 优化打字机速度，提升流畅度"""
-    # 初始化colorama
-    init(autoreset=True, convert=True)
+    # 初始化colorama（是否需要转换成Windows控制台调用由 colorama 按终端判断，支持ANSI的终端原样输出颜色）
+    init(autoreset=True)
     
     # 配色方案
     COLORS = {
@@ -41,13 +51,26 @@ class Config:
         "punct_long": 0.1,     # 缩短长标点停顿
         "paragraph": 0.3       # 缩短段落停顿
     }
+    # 即时输出：收到就显示，不要打字机停顿（运行时可用 instant 命令切换）
+    TYPING_INSTANT = os.environ.get("JAVX_CLI_INSTANT", "0") == "1"
     
     # 存储配置
     MEMORY_FILE = "javxseek_memory.json"
     
+    # 每轮回复后打印流式统计（首字时间、耗时、速率、用量，JAVX_CLI_STATS=1 开启）
+    SHOW_STATS = os.environ.get("JAVX_CLI_STATS", "0") == "1"
+    
+    # 整个会话共用一个HTTP客户端：保持空闲连接供下一轮提问复用，安装了 h2 时使用HTTP/2
+    HTTP2 = os.environ.get("JAVX_CLI_HTTP2", "1") == "1" and HTTP2_AVAILABLE
+    KEEPALIVE = PoolConfig.KEEPALIVE                                           # 空闲连接保活时间（JAVX_KEEPALIVE）
+    # 启动时在后台预热连接（DNS、TCP、TLS），等待输入期间在连接过期前重新预热
+    PREWARM = os.environ.get("JAVX_CLI_PREWARM", "1") == "1"
+    PREWARM_IDLE = float(os.environ.get("JAVX_CLI_PREWARM_IDLE", "600"))      # 超过多少秒没有提问就不再预热
+    
     # API配置-需要用户配置API密钥-============================================================= 在这里配置你的API密钥 ===========================================================================================================================
+    # 可以配置多个服务器（每项可带自己的 api_key），按首字时间选择，首字之前失败时自动切换到下一个
     API_SERVERS = [
-        {"url": "https://api.deepseek.com/v1",
+        {"url": os.environ.get("JAVX_API_URL", "https://api.deepseek.com/v1"),  # 可指向本地模拟服务（Benchmarks/mock_deepseek.py）
          "name": "Deepseek服务器",
          "models": ["deepseek-chat", "deepseek-vl", "deepseek-math"]
         }
@@ -79,32 +102,71 @@ class UI:
     
     @staticmethod
     def split_text(text: str, max_length: int) -> List[str]:
-        """优化文本分割，完美处理换行和中英文"""
+        """按显示宽度分割文本，完美处理换行、中英文、全角符号和emoji"""
         lines = []
         for paragraph in text.split('\n'):
             if not paragraph:
                 lines.append("")
                 continue
+            if paragraph.isascii() and paragraph.isprintable():
+                # 纯ASCII段落每个字符一列，直接按长度切分
+                lines.extend(paragraph[i:i + max_length] for i in range(0, len(paragraph), max_length))
+                continue
                 
             current_line = ""
             current_width = 0
             for char in paragraph:
-                # 计算字符宽度（中文2，英文1）
-                char_width = 2 if '\u4e00' <= char <= '\u9fff' else 1
+                # 计算字符宽度（全角和emoji为2，组合符号为0，见 display_width.py）
+                width = char_width(char)
                 
                 # 如果当前行宽度+新字符宽度超过限制，则换行
-                if current_width + char_width > max_length and current_line:
+                if current_width + width > max_length and current_line and width:
                     lines.append(current_line)
                     current_line = char
-                    current_width = char_width
+                    current_width = width
                 else:
                     current_line += char
-                    current_width += char_width
+                    current_width += width
             
             if current_line:
                 lines.append(current_line)
         return lines
     
+    @staticmethod
+    async def read_input(prompt: str) -> str:
+        """在守护线程中读取一行输入，等待期间事件循环照常运行（后台预热连接）；退出时不会等待这个线程"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        
+        def settle(line, error):
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(line)
+        
+        def read():
+            try:
+                line = input(prompt)
+            except Exception as e:
+                loop.call_soon_threadsafe(settle, None, e)
+            else:
+                loop.call_soon_threadsafe(settle, line, None)
+        
+        threading.Thread(target=read, daemon=True).start()
+        return await future
+    
+    @staticmethod
+    def typing_delay(char: str) -> float:
+        """打字机效果中每个字符之后的停顿（仅保留必要的停顿，提升流畅度）"""
+        if char in ['.', '!', '?', '。', '！', '？']:
+            return Config.TYPING_SPEED["punct_long"] * random.uniform(0.9, 1.1)
+        if char in [',', ';', ':', '，', '；', '：']:
+            return Config.TYPING_SPEED["punct_short"] * random.uniform(0.9, 1.1)
+        speed = Config.TYPING_SPEED["chinese"] if char_width(char) == 2 else Config.TYPING_SPEED["normal"]
+        return speed * random.uniform(0.9, 1.1)
+    
     @staticmethod
     def print_message_header(role: str, time_str: str):
         """打印精简的消息头部"""
@@ -129,43 +191,9 @@ class UI:
         print(f"{color}{Config.COLORS['border'] * Config.MAX_WIDTH}{Style.RESET_ALL}")
     
     @staticmethod
-    def start_typing_effect(color: str) -> Tuple[List[str], int]:
-        """开始打字机效果，返回状态信息"""
-        return [""], 0  # (lines, current_line_index)
-    
-    @staticmethod
-    def stream_print(char: str, color: str, state: Tuple[List[str], int]) -> Tuple[List[str], int]:
-        """流式打印单个字符，优化流畅度"""
-        lines, current_line_idx = state
-        current_line = lines[current_line_idx]
-        
-        # 计算当前行宽度
-        line_width = sum(2 if '\u4e00' <= c <= '\u9fff' else 1 for c in current_line)
-        char_width = 2 if '\u4e00' <= char <= '\u9fff' else 1
-        
-        # 检查是否需要换行
-        content_width = Config.MAX_WIDTH - (Config.MARGIN * 2) - 4
-        if line_width + char_width > content_width:
-            # 移动到新行
-            lines.append("")
-            current_line_idx += 1
-            print()  # 移动到下一行
-            current_line = ""
-        
-        # 添加字符到当前行
-        lines[current_line_idx] += char
-        current_line = lines[current_line_idx]
-        
-        # 打印当前行
-        print(f"{color}  {current_line}", end='\r' if char != '\n' else '\n', flush=True)
-        
-        # 处理换行符
-        if char == '\n':
-            lines.append("")
-            current_line_idx += 1
-            print(f"{color}  ", end='', flush=True)
-        
-        return lines, current_line_idx
+    def start_typing_effect(color: str) -> StreamRenderer:
+        """开始打字机效果，返回流式渲染器（增量换行，按帧批量输出）"""
+        return StreamRenderer(color, Config.MAX_WIDTH - (Config.MARGIN * 2) - 4)
 
 
 # ==================== 记忆管理 ====================
@@ -224,6 +252,14 @@ class MemoryManager:
 
 
 # ==================== 核心逻辑 ====================
+class UpstreamStatusError(Exception):
+    """上游返回了错误状态码（消息是给用户看的提示文字）"""
+
+    def __init__(self, message: str, response: httpx.Response):
+        super().__init__(message)
+        self.response = response
+
+
 class JavxSeek:
     """核心逻辑类 - 优化打字机流畅度"""
     
@@ -232,6 +268,17 @@ class JavxSeek:
         self.messages = self.memory["messages"].copy()
         self.current_model_idx = 0
         self.thinking_level = self.memory.get("thinking_level", "deep")
+        self.last_usage = None          # 上一轮上游返回的token用量
+        self.malformed_events = 0       # 累计无法解析的上游事件数
+        self.last_stats = None          # 上一轮的流式统计
+        self.router = Router.from_servers(Config.API_SERVERS, Config.DEEPSEEK_API_KEY)  # 多个服务器时按首字时间选择并自动切换
+        self._client = None             # 会话共享的HTTP客户端（第一次使用时创建）
+        self.warmer = None              # 后台预热连接的任务
+        self.last_used = 0.0            # 上一次使用连接的时间（monotonic）
+        self.waiting_since = time.monotonic()   # 开始等待用户输入的时间（正在回复时为None）
+        self.prompt = ""                # 正在等待输入的提示文字
+        self.replying = None            # 正在进行的一轮回复（Ctrl+C 时取消）
+        self.instant = Config.TYPING_INSTANT
     
     def update_style(self) -> str:
         """更新回复风格"""
@@ -266,75 +313,353 @@ class JavxSeek:
         }
         return thinking_prompts.get(self.thinking_level, thinking_prompts["deep"])
     
+    def build_context(self) -> List[Dict]:
+        """按思考深度的token预算选取对话历史（系统提示和最新提问始终保留）"""
+        system = [m for m in self.messages if m["role"] == "system"]
+        dialog = [m for m in self.messages if m["role"] != "system"]
+        if not dialog:
+            return system
+        return system + select_context(dialog[:-1], context_budget(self.thinking_level)) + dialog[-1:]
+    
+    def new_client(self) -> httpx.AsyncClient:
+        """创建会话共享的HTTP客户端：每轮提问复用保持着的连接，不再重新DNS解析、TCP和TLS握手"""
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(120.0, connect=20.0),
+            transport=httpx.AsyncHTTPTransport(
+                retries=3,
+                http2=Config.HTTP2,
+                limits=httpx.Limits(keepalive_expiry=Config.KEEPALIVE)
+            )
+        )
+    
+    async def get_client(self) -> httpx.AsyncClient:
+        """第一次使用时在线程池中创建客户端（加载证书要一百多毫秒，不阻塞启动界面）"""
+        if self._client is None:
+            self._client = asyncio.ensure_future(asyncio.get_running_loop().run_in_executor(None, self.new_client))
+        # 等待的一方被取消时不影响客户端的创建
+        return await asyncio.shield(self._client)
+    
+    async def prewarm(self):
+        """提前建立到每个服务器的连接（请求一次模型列表，结果不重要），连接留在连接池中给下一次提问使用"""
+        try:
+            client = await self.get_client()
+            headers = {"Authorization": f"Bearer {Config.DEEPSEEK_API_KEY}"}
+            await asyncio.gather(*(self.warm(client, endpoint, headers) for endpoint in self.router.endpoints))
+        finally:
+            self.last_used = time.monotonic()
+    
+    @staticmethod
+    async def warm(client: httpx.AsyncClient, endpoint, headers: Dict):
+        started = time.perf_counter()
+        try:
+            res = await client.get(endpoint.health_url, headers=endpoint.headers(headers), timeout=10.0)
+            tracing.logger.debug("预热 %s: 状态 %s，%s，耗时 %.0fms", endpoint.name, res.status_code,
+                                 res.http_version, (time.perf_counter() - started) * 1000)
+        except httpx.HTTPError as e:
+            tracing.logger.debug("预热 %s 失败: %s", endpoint.name, e)
+    
+    async def keep_warm(self):
+        """后台任务：启动时预热连接；等待输入期间连接快要过期时重新预热，正在回复或用户长时间没有提问时不预热"""
+        interval = Config.KEEPALIVE * 0.8
+        while True:
+            idle = time.monotonic() - self.last_used
+            if idle < interval:
+                await asyncio.sleep(interval - idle)
+            elif self.waiting_since is None or time.monotonic() - self.waiting_since > Config.PREWARM_IDLE:
+                await asyncio.sleep(interval)
+            else:
+                await self.prewarm()
+    
+    async def close(self):
+        """停止预热并关闭连接（可以重复调用）"""
+        if self.warmer is not None:
+            self.warmer.cancel()
+            try:
+                await self.warmer
+            except asyncio.CancelledError:
+                pass
+            self.warmer = None
+        if self._client is not None:
+            pending, self._client = self._client, None
+            try:
+                client = await pending
+            except Exception:
+                return
+            await client.aclose()
+    
     async def stream_response(self, model: str) -> AsyncGenerator[str, None]:
         """流式获取API响应 - 减少不必要的停顿"""
         if not Config.DEEPSEEK_API_KEY:
             yield f"{Config.COLORS['error']}⚠️ 未提供API密钥"
             return
             
+        started = time.perf_counter()
+        trace = tracing.current()
+        self.last_stats = None
         try:
-            # 添加思考深度提示
-            enhanced_messages = self.messages.copy()
-            if enhanced_messages and enhanced_messages[-1]["role"] == "user":
-                enhanced_messages.append({
-                    "role": "system",
-                    "content": self.enhance_thinking_prompt()
-                })
+            # 添加思考深度提示（历史消息按token预算裁剪）
+            with tracing.span("build_context"):
+                enhanced_messages = self.build_context()
+                if enhanced_messages and enhanced_messages[-1]["role"] == "user":
+                    enhanced_messages.append({
+                        "role": "system",
+                        "content": self.enhance_thinking_prompt()
+                    })
             
-            async with httpx.AsyncClient(
-                timeout=httpx.Timeout(120.0, connect=20.0),
-                transport=httpx.AsyncHTTPTransport(retries=3)
-            ) as client:
-                async with client.stream(
-                    "POST",
-                    Config.API_SERVERS[0]["url"],
-                    json={
-                        "model": model, 
-                        "messages": enhanced_messages, 
-                        "stream": True, 
-                        "temperature": 0.7,
-                        "max_tokens": 2000
-                    },
-                    headers={
-                        "Content-Type": "application/json", 
-                        "Authorization": f"Bearer {Config.DEEPSEEK_API_KEY}"
-                    }
-                ) as res:
-                    # 错误处理
-                    if res.status_code == 401:
-                        yield f"{Config.COLORS['error']}🔑 认证失败"
-                        return
-                    elif res.status_code == 403:
-                        error_data = await res.json()
-                        if "insufficient_quota" in str(error_data.get("error", {}).get("message", "")):
-                            yield f"{Config.COLORS['error']}💡 API配额不足"
-                        else:
-                            yield f"{Config.COLORS['error']}[拒绝访问] {error_data.get('error', {}).get('message')}"
-                        return
-                    elif res.status_code != 200:
-                        yield f"{Config.COLORS['error']}[错误 {res.status_code}] 连接失败"
-                        return
+            request = {
+                "model": model, 
+                "messages": enhanced_messages, 
+                "stream": True, 
+                "temperature": 0.7,
+                "max_tokens": 2000
+            }
+            headers = {
+                "Content-Type": "application/json", 
+                "Authorization": f"Bearer {Config.DEEPSEEK_API_KEY}"
+            }
+            last_error = f"{Config.COLORS['error']}[错误] 所有服务器暂时不可用"
+            client = await self.get_client()
+            self.last_used = time.monotonic()
+            # 在第一个字之前失败（错误状态码、连接失败）时换下一个服务器，之后的失败无法切换
+            for endpoint in self.router.attempts():
+                ttft, failed, res = None, True, None
+                try:
+                    if HedgeConfig.ENABLED:
+                        endpoint, (res, parser, chunks, first) = await self.open_hedged(client, endpoint, request, headers)
+                    else:
+                        res, parser, chunks, first = await self.open_stream(client, endpoint, request, headers)
                     
-                    # 处理流式响应（移除额外停顿）
-                    async for line in res.aiter_lines():
-                        if line.startswith('data: ') and (chunk := line[6:].strip()) != '[DONE]':
-                            try:
-                                content = json.loads(chunk)["choices"][0]["delta"].get("content", "")
-                                if content:
-                                    yield content
-                            except:
-                                continue
+                    # 处理流式响应（直接解析原始字节，格式异常的事件计数而不是静默丢弃）
+                    stats = {"status": res.status_code, "server": endpoint.name, "ttft": None,
+                             "chunks": 0, "chars": 0}
+                    try:
+                        async for deltas in self.iter_deltas(parser, chunks, first):
+                            for delta in deltas:
+                                if delta.content:
+                                    if ttft is None:
+                                        ttft = stats["ttft"] = time.perf_counter() - started
+                                        if trace is not None:
+                                            trace.mark("first_token")
+                                    stats["chunks"] += 1
+                                    stats["chars"] += len(delta.content)
+                                    yield delta.content
+                    finally:
+                        parser.close()
+                        self.last_usage = parser.usage
+                        self.malformed_events += parser.malformed
+                        stats.update(duration=time.perf_counter() - started, usage=parser.usage,
+                                     malformed=parser.malformed, finished=parser.done)
+                        self.last_stats = stats
+                        if trace is not None:
+                            trace.attrs.update(server=endpoint.name, status=res.status_code, finished=parser.done,
+                                               usage=parser.usage)
+                    failed = not parser.done
+                    return
+                except UpstreamStatusError as e:
+                    last_error = str(e)
+                    if not endpoint_fault(e):
+                        # 密钥无效、参数错误等换服务器也一样：不计入服务器的成败，直接显示错误
+                        failed = None
+                        break
+                except httpx.HTTPError as e:
+                    tracing.logger.warning("服务器 %s 请求失败: %s", endpoint.name, e)
+                    if ttft is not None:
+                        raise
+                    last_error = f"{Config.COLORS['error']}[网络异常] {str(e)}"
+                except (GeneratorExit, asyncio.CancelledError):
+                    failed = None       # 用户中断，不计入服务器的成败
+                    raise
+                finally:
+                    if res is not None:
+                        await res.aclose()
+                    self.last_used = time.monotonic()
+                    self.router.report(endpoint, ttft, failed)
+            yield last_error
         except Exception as e:
             yield f"{Config.COLORS['error']}[网络异常] {str(e)}"
     
+    async def open_stream(self, client: httpx.AsyncClient, endpoint, request: Dict, headers: Dict):
+        """发出请求并读到第一段内容为止，返回 (响应, 解析器, 剩余字节流, 已解析的增量)；错误状态码抛出 UpstreamStatusError"""
+        sent = time.perf_counter()
+        with tracing.span("encode"):
+            # 开启追踪时记录建立连接、TLS握手和等待响应头的时间
+            built = client.build_request("POST", endpoint.url, json=request, headers=endpoint.headers(headers),
+                                         extensions=tracing.ahttpx_extensions())
+        res = await client.send(built, stream=True)
+        try:
+            if res.status_code != 200:
+                raise UpstreamStatusError(await self.describe_error(res), res)
+            parser = StreamParser()
+            chunks = res.aiter_bytes()
+            async for data in chunks:
+                deltas = parser.feed(data)
+                if parser.done or any(delta.content for delta in deltas):
+                    if not parser.done:
+                        hedging.observe(time.perf_counter() - sent)
+                    return res, parser, chunks, deltas
+            return res, parser, chunks, []
+        except BaseException:
+            await res.aclose()
+            raise
+    
+    async def open_hedged(self, client: httpx.AsyncClient, endpoint, request: Dict, headers: Dict):
+        """对冲请求：首字超过对冲延迟仍未到达时向另一个（或同一个）服务器发起相同请求，
+        先出字的一方继续，另一方立即取消；返回 (获胜的服务器, open_stream 的结果)"""
+        hedging.request()
+        primary = asyncio.create_task(self.open_stream(client, endpoint, request, headers))
+        tasks = {primary: endpoint}
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedging.delay())
+            if not done and hedging.try_fire():
+                second = self.router.choose(exclude=[endpoint]) or self.router.choose()
+                if second is not None:
+                    tasks[asyncio.create_task(self.open_stream(client, second, request, headers))] = second
+            
+            # 等到有一方出字，或者全部在出字之前失败
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if task.exception() is None), None)
+            if winner is None:
+                raise primary.exception()
+            if winner is not primary:
+                hedging.won()
+            return tasks[winner], winner.result()
+        finally:
+            for task, owner in tasks.items():
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()       # 输掉的一方立即取消，已经打开的响应在 open_stream 中关闭
+                    error = None
+                elif task.exception() is None:
+                    await task.result()[0].aclose()
+                    error = None
+                else:
+                    error = True if endpoint_fault(task.exception()) else None
+                # 原请求失败时由调用方报告
+                if winner is not None or task is not primary:
+                    self.router.report(owner, None, error)
+    
+    @staticmethod
+    async def iter_deltas(parser: StreamParser, chunks, first: List):
+        """先给出 open_stream 已经解析出的增量，再继续解析剩余的字节流直到 [DONE]"""
+        yield first
+        if not parser.done:
+            async for data in chunks:
+                yield parser.feed(data)
+                if parser.done:
+                    break
+        if parser.done:
+            await JavxSeek.drain(chunks)
+        else:
+            # 流结束时最后一行没有换行符：由 close 解析出最后的增量
+            yield parser.close()
+    
+    @staticmethod
+    async def drain(chunks):
+        """[DONE] 之后读完响应的结尾（HTTP/1.1 分块传输的结束标记），连接才会放回连接池给下一轮复用"""
+        async def consume():
+            async for _ in chunks:
+                pass
+        try:
+            await asyncio.wait_for(consume(), 1.0)
+        except (asyncio.TimeoutError, httpx.HTTPError):
+            pass
+    
+    async def describe_error(self, res: httpx.Response) -> str:
+        """把上游的错误响应转换成提示文字"""
+        if res.status_code == 401:
+            return f"{Config.COLORS['error']}🔑 认证失败"
+        if res.status_code == 403:
+            await res.aread()
+            try:
+                message = str(res.json().get("error", {}).get("message", ""))
+            except ValueError:
+                message = res.text
+            if "insufficient_quota" in message:
+                return f"{Config.COLORS['error']}💡 API配额不足"
+            return f"{Config.COLORS['error']}[拒绝访问] {message}"
+        return f"{Config.COLORS['error']}[错误 {res.status_code}] 连接失败"
+    
+    def print_stream_stats(self):
+        """打印上一轮的流式统计（耗时是网络接收的时间，终端输出速率单独统计）"""
+        stats = self.last_stats
+        if not stats:
+            return
+        ttft = f"{stats['ttft']:.2f}s" if stats["ttft"] is not None else "-"
+        duration = stats["duration"]
+        rate = stats["chars"] / duration if duration > 0 else 0
+        tokens = (stats["usage"] or {}).get("completion_tokens", "-")
+        render = stats.get("render") or {}
+        output = f"{render['chars_per_sec']:.0f} 字/秒 {render['frames']} 帧" if render.get("chars_per_sec") else "-"
+        print(f"{Config.COLORS['time']}📊 首字 {ttft} | 耗时 {duration:.2f}s | {stats['chunks']} 段 {stats['chars']} 字 "
+              f"({rate:.0f} 字/秒) | 终端输出 {output} | tokens {tokens} | 状态 {stats['status']} | 服务器 {stats['server']} | 异常事件 {stats['malformed']}"
+              f"{'' if stats['finished'] else ' | 未收到[DONE]'}")
+    
     async def run(self):
-        """运行聊天循环 - 优化打字机流畅度"""
+        """运行聊天会话：显示Logo和等待输入期间在后台预热连接，退出时关闭连接"""
+        if Config.PREWARM:
+            self.warmer = asyncio.create_task(self.keep_warm())
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGINT, self.interrupt)
+            handles_sigint = True
+        except (NotImplementedError, RuntimeError):
+            handles_sigint = False      # Windows 不支持，Ctrl+C 仍按 KeyboardInterrupt 处理
+        try:
+            await self.chat_loop()
+        finally:
+            if handles_sigint:
+                loop.remove_signal_handler(signal.SIGINT)
+            await self.close()
+    
+    def interrupt(self):
+        """Ctrl+C：正在回复时停止这一轮（网络和显示一起取消，保留已经显示的部分），等待输入时提示用 exit 退出"""
+        if self.replying is not None and not self.replying.done():
+            self.replying.cancel()
+            return
+        print(f"\n{Config.COLORS['warning']}💡 按 exit 可以优雅退出")
+        print(self.prompt, end='', flush=True)
+    
+    async def receive(self, model: str, typewriter: Typewriter):
+        """网络任务：收到的片段立即交给打字机，不等待终端显示"""
+        try:
+            async for chunk in self.stream_response(model):
+                typewriter.feed(chunk)
+        finally:
+            typewriter.close()
+    
+    async def reply(self, model: str, typewriter: Typewriter):
+        """一轮回复：网络任务尽快接收，当前任务按打字机节奏显示；被取消时两边一起停止"""
+        receiver = asyncio.ensure_future(self.receive(model, typewriter))
+        try:
+            await typewriter.run()
+        finally:
+            if not receiver.done():
+                receiver.cancel()
+            await asyncio.wait({receiver})
+        if not receiver.cancelled():
+            receiver.result()
+    
+    async def read_input(self, prompt: str) -> str:
+        """等待用户输入（这段时间允许后台预热连接）"""
+        self.waiting_since = time.monotonic()
+        self.prompt = prompt
+        try:
+            return await UI.read_input(prompt)
+        finally:
+            self.waiting_since = None
+    
+    async def chat_loop(self):
+        """聊天循环 - 优化打字机流畅度"""
         UI.print_logo()
         
         current_style = self.update_style()
         print(f"{Config.COLORS['title']}【当前风格】{Config.STYLES[current_style]['label']}".center(Config.MAX_WIDTH))
         print(f"{Config.COLORS['info']}{Config.COLORS['border'] * Config.MAX_WIDTH}")
-        print(f"{Config.COLORS['accent']}📝 命令: exit(退出) | reset(重置) | style(风格) | memory(回忆) | model(切换模型)")
+        print(f"{Config.COLORS['accent']}📝 命令: exit(退出) | reset(重置) | style(风格) | memory(回忆) | model(切换模型) | instant(即时输出)")
         print(f"{Config.COLORS['accent']}💡 思考: deep(深度) | creative(创意) | analytical(分析)")
         print(f"{Config.COLORS['info']}{Config.COLORS['border'] * Config.MAX_WIDTH}\n")
         
@@ -348,7 +673,7 @@ class JavxSeek:
         
         while True:
             try:
-                user_input = input(f"\n{Config.COLORS['user']}你说 → {Style.RESET_ALL}").strip()
+                user_input = (await self.read_input(f"\n{Config.COLORS['user']}你说 → {Style.RESET_ALL}")).strip()
                 if not user_input:
                     print(f"{Config.COLORS['warning']}💡 请输入内容")
                     continue
@@ -359,10 +684,11 @@ class JavxSeek:
                     print(f"\n{Config.COLORS['accent']}😂 下次见～\n{Config.COLORS['title']}{Config.COLORS['border'] * Config.MAX_WIDTH}")
                     break
                 if user_input.lower() == 'reset':
-                    if input(f"{Config.COLORS['warning']}确定要清除所有记忆吗？(y/n) ").lower() == 'y':
+                    if (await self.read_input(f"{Config.COLORS['warning']}确定要清除所有记忆吗？(y/n) ")).lower() == 'y':
                         if os.path.exists(Config.MEMORY_FILE):
                             os.remove(Config.MEMORY_FILE)
                         print(f"{Config.COLORS['accent']}✨ 记忆已清空")
+                        await self.close()
                         return await JavxSeek().run()
                     continue
                 if user_input.lower() == 'style':
@@ -385,6 +711,10 @@ class JavxSeek:
                     current_model = Config.API_SERVERS[0]["models"][self.current_model_idx]
                     print(f"\n{Config.COLORS['info']}🔄 已切换到模型: {current_model}")
                     continue
+                if user_input.lower() == 'instant':
+                    self.instant = not self.instant
+                    print(f"\n{Config.COLORS['info']}{'⚡ 已切换为即时输出' if self.instant else '⌨️ 已切换为打字机效果'}")
+                    continue
                 if user_input.lower() in ['deep', 'creative', 'analytical']:
                     self.thinking_level = user_input.lower()
                     self.memory["thinking_level"] = self.thinking_level
@@ -411,34 +741,45 @@ class JavxSeek:
                 ai_color = Config.COLORS["ai"]
                 UI.print_message_header("assistant", current_time)
                 
-                # 获取并实时显示回复（优化打字机效果）
+                # 获取并实时显示回复：网络任务收到就放进队列，当前任务按打字机节奏显示，互不阻塞
                 current_model = Config.API_SERVERS[0]["models"][self.current_model_idx]
-                state = UI.start_typing_effect(ai_color)
-                full_response = ""
+                typewriter = Typewriter(UI.start_typing_effect(ai_color), UI.typing_delay, instant=self.instant)
                 
-                async for chunk in self.stream_response(current_model):
-                    for char in chunk:
-                        # 实时显示每个字符
-                        state = UI.stream_print(char, ai_color, state)
-                        full_response += char
-                        
-                        # 仅保留必要的停顿，提升流畅度
-                        if char in ['.', '!', '?', '。', '！', '？']:
-                            time.sleep(Config.TYPING_SPEED["punct_long"] * random.uniform(0.9, 1.1))
-                        elif char in [',', ';', ':', '，', '；', '：']:
-                            time.sleep(Config.TYPING_SPEED["punct_short"] * random.uniform(0.9, 1.1))
-                        else:
-                            speed = Config.TYPING_SPEED["chinese"] if '\u4e00' <= char <= '\u9fff' else Config.TYPING_SPEED["normal"]
-                            time.sleep(speed * random.uniform(0.9, 1.1))
+                # 每轮对话一个请求id；开启追踪（JAVX_TRACE=1）时记录各阶段耗时，按 JAVX_PROFILE_RATE 抽样剖析
+                trace = tracing.start("cli_turn", profile=tracing.should_profile())
+                with tracing.profiled():
+                    reply = self.replying = asyncio.ensure_future(self.reply(current_model, typewriter))
+                    try:
+                        await asyncio.wait({reply})
+                    finally:
+                        self.replying = None
+                        if not reply.done():
+                            reply.cancel()
+                interrupted = reply.cancelled()
+                if not interrupted:
+                    reply.result()
+                full_response = typewriter.text()
                 
-                # 确保光标在最后位置
-                print()
+                # 写出剩余内容并换行
+                typewriter.renderer.finish()
+                if interrupted:
+                    print(f"{Config.COLORS['warning']}⏹ 已停止生成，保留已显示的部分")
+                if self.last_stats is not None:
+                    self.last_stats["render"] = typewriter.stats()
                 
                 # 打印消息底部
                 UI.print_message_footer(ai_color)
+                if Config.SHOW_STATS:
+                    self.print_stream_stats()
+                if trace is not None:
+                    trace.finish(chars=len(full_response), thinking_level=self.thinking_level, render=typewriter.stats(),
+                                 interrupted=interrupted)
                 
-                # 保存记忆
-                self.messages.append({"role": "assistant", "content": full_response})
+                # 保存记忆（中断时保存已经显示的部分；一个字都没有显示时这轮提问也不保留）
+                if interrupted and not full_response:
+                    self.messages.pop()
+                else:
+                    self.messages.append({"role": "assistant", "content": full_response})
                 MemoryManager.save(self.memory)
                 
                 # 检查风格升级
@@ -454,6 +795,8 @@ class JavxSeek:
 
 # ==================== 程序入口 ====================
 if __name__ == "__main__":
+    # 追踪日志写入文件，不打乱终端输出
+    tracing.setup_logging(default_file="javxseek-trace.log")
     try:
         asyncio.run(JavxSeek().run())
     except Exception as e:
@@ -1,215 +1,337 @@
-from flask import Flask, request, jsonify, Response, send_from_directory
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-import requests
-import json
 from datetime import datetime
 import os
+import threading
+import time
+from upstream import get_client
+from singleflight import SingleFlight
+from admission import AdmissionController, Rejected
+from sse import SSEConfig, SSEEncoder
+from stream_parser import StreamParser, parser_stats
+from metrics import CONTENT_TYPE, StreamMetrics, observe_upstream, registry, reply_lengths, reply_tokens
+from router import NoUpstreamAvailable, endpoint_fault
+from hedging import HedgeConfig, Race, hedging
+from static_assets import StaticAssets
+from chat_core import (build_chat_request, compactor, conversation_store, prompt_cache, response_cache, router,
+                       save_stream_turn, save_turn, streams, validate_prompt_options)
+from resumable import parse_event_id
+import tracing
+from tracing import PROFILE_REQUEST_HEADER, REQUEST_ID_HEADER, logger
+from batch import FORMAT_ERROR, BatchConfig, clamp_concurrency, dump_result, parse_items, run_batch
 
 # 初始化Flask应用
 app = Flask(__name__)
 CORS(app)  # 解决跨域问题
 
-# 配置API
-API_KEY = "======================================================================================= -YOU-API-KEY- ================================================================================================================================"
-API_URL = "https://api.deepseek.com/v1/chat/completions"
+# API密钥和地址在 chat_core.py 中配置
+
+# 日志每行带请求id（JAVX_TRACE=1 时每个请求结束后记录各阶段耗时）
+tracing.setup_logging()
+
+# 相同请求合并：同一时刻只向上游发起一次生成
+inflight = SingleFlight()
+
+# 准入控制：每客户端限流/并发上限，全局并发满载时有界排队，超限快速返回429
+admission = AdmissionController()
 
 # 确保static目录存在
 STATIC_FOLDER = os.path.join(os.path.dirname(__file__), "")
 if not os.path.exists(STATIC_FOLDER):
     os.makedirs(STATIC_FOLDER)
 
-# 对话上下文存储
-conversation_contexts = {}
+# 首页和图标在启动时读入内存并预先压缩（gzip/br），带强ETag，请求时不访问磁盘
+static_assets = StaticAssets(STATIC_FOLDER)
+
+@app.after_request
+def end_request_context(response):
+    """响应关闭（流式响应在最后一帧写出之后）时清除请求id，复用同一线程的下一个请求不会沿用它"""
+    response.call_on_close(tracing.end)
+    return response
+
+def serve_asset(path):
+    """从内存返回静态资源；文件不存在时返回None"""
+    result = static_assets.respond(path, request.headers.get("Accept-Encoding", ""),
+                                   request.headers.get("If-None-Match", ""))
+    if result is None:
+        return None
+    status, headers, body = result
+    return Response(body, status, headers=headers)
 
 @app.route('/')
 def index():
     """访问根路径时，返回static目录下的index.html"""
-    try:
-        return send_from_directory(STATIC_FOLDER, 'index.html')
-    except Exception as e:
-        return f"前端文件未找到，请检查index.html是否在static目录下。错误：{str(e)}", 404
+    response = serve_asset('/')
+    if response is None:
+        return "前端文件未找到，请检查index.html是否在static目录下。", 404
+    return response
 
 @app.route('/favicon.ico')
 def favicon():
     """处理网站图标请求"""
-    try:
-        return send_from_directory(STATIC_FOLDER, 'favicon.ico', mimetype='image/vnd.microsoft.icon')
-    except:
+    response = serve_asset('/favicon.ico')
+    if response is None:
         return '', 204
+    return response
 
-# AI对话核心功能（优化版）
-def generate_system_prompt(thinking_mode, style, is_humorous):
-    """生成系统提示词（优化逻辑性和拟人化）"""
-    current_date = datetime.now().strftime("%Y年%m月%d日")
-    
-    # 获取当前月份
-    current_month = datetime.now().month
-    month_events = {
-        1: "新年伊始，许多企业和个人正在制定年度计划",
-        2: "年初时期，技术趋势预测和行业展望是热门话题",
-        3: "春季是新技术发布和招聘的旺季",
-        4: "气候转暖，绿色技术和可持续发展成为焦点",
-        5: "年中临近，项目进展评估和调整正在进行",
-        6: "技术大会和产品发布集中举行",
-        7: "夏季是创新和实验的好时机",
-        8: "假期季节，工作效率可能有所变化",
-        9: "秋季是学术和技术活动的高峰期",
-        10: "年终临近，项目收尾和总结开始",
-        11: "准备年终总结和明年规划",
-        12: "年终总结和新年计划是主要话题"
-    }
+def read_upstream(flight, endpoint, headers, body, race=None, attempt="primary"):
+    """从一个上游端点读取流并发布到 flight，返回解析器；结束时把首字时间和成败报告给路由
     
-    # 根据思考模式调整提示（增强逻辑性和情感表达）
-    thinking_descriptions = {
-        "deep": f"你处于深度思考模式，今天是{current_date}。请提供全面、深入的分析，考虑各种可能性和影响因素。回答应包含：\n1) 问题背景\n2) 关键因素分析\n3) 解决方案\n4) 潜在挑战\n5) 最终建议\n使用分点回答，每点单独一行显示。",
-        "creative": "提供创新、独特的解决方案，跳出传统思维框架，展现丰富的想象力。在回答中融入情感元素，让表达更自然拟人化。",
-        "analytical": "基于数据和逻辑进行严谨推理，注重事实和证据，提供结构化的分析。同时保持表达的自然流畅，避免过于机械化的回答。"
-    }
-    
-    style_descriptions = {
-        "casual": "自然、随意、亲切，像日常对话一样，使用通俗易懂的语言。加入适当的语气词和情感表达，让交流更有人情味。",
-        "witty": "幽默、风趣、机智，适当使用俏皮话和双关语，让回答更生动有趣。但注意幽默要服务于内容，不能影响信息的准确性。",
-        "professional": "正式、专业、严谨，使用规范的表达方式，注重准确性和专业性。同时保持语言的流畅自然，避免过于生硬刻板。"
-    }
-    
-    # 时事更新提示
-    current_events = month_events.get(current_month, "科技领域持续快速发展，特别是人工智能和大数据方向")
-    
-    # 增强情感表达和拟人化
-    emotion_prompt = """
-    在回答中融入适当的情感表达：
-    - 使用感叹词（如"哇！"、"哦～"、"嗯..."）
-    - 添加表情符号（如😊、🤔、😄等）
-    - 使用语气词（如"呢"、"啦"、"呀"）
-    - 根据内容调整语气（兴奋、好奇、关切等）
-    - 当用户表达情绪时，给予相应的情感回应
-    - 在适当的时候展示同理心
-    """
-    
-    # 优化上下文联系
-    context_prompt = """
-    特别注意对话上下文联系：
-    1. 仔细理解用户问题的上下文背景
-    2. 对于连续性问题，保持回答的一致性
-    3. 当用户提到之前的内容时，主动关联之前的讨论
-    4. 避免重复询问用户已经提供的信息
-    5. 对于复杂话题，分步骤逐步推进讨论
-    6. 记住用户提到的关键信息（如名字、偏好、过往经历）
-    7. 在回答开头简要总结上下文，确保理解正确
-    """
-    
-    # 幽默模式优化
-    humor_prompt = """
-    幽默元素使用指南：
-    - 仅在轻松话题中使用幽默
-    - 避免专业话题中的不当幽默
-    - 幽默要自然融入内容
-    - 使用俏皮话、双关语或有趣比喻
-    - 保持信息准确性为前提
+    对冲时（传入 race）先认领第一段内容的一方才发布，输掉的一方关闭连接并返回 None
     """
+    parser = StreamParser()
+    trace = tracing.current()
+    started = time.perf_counter()
+    status = "error"
+    ttft = None
+    try:
+        # 复用进程级连接池，省去每轮对话的TCP/TLS握手
+        with get_client().stream(endpoint.url, endpoint.headers(headers), body) as response:
+            status = response.status_code
+            observe_upstream(status, time.perf_counter() - started)
+            # 客户端全部断开时立即关闭上游响应，不等下一段数据到达，也不再读完剩余部分
+            flight.on_cancel(response.close)
+            if race is not None:
+                race.on_cancel(attempt, response.close)
+            response.raise_for_status()
+            
+            # 直接解析网络到达的原始字节块，同一块里的多个增量合并成一次发布
+            for data in response.iter_chunks():
+                if flight.cancelled or (race is not None and race.lost(attempt)):
+                    response.close()
+                    break
+                handled = time.perf_counter()
+                text = "".join([delta.content for delta in parser.feed(data)])
+                if text:
+                    if ttft is None:
+                        ttft = handled - started
+                        if race is not None and not race.claim(attempt):
+                            response.close()
+                            break
+                        hedging.observe(ttft)
+                        if trace is not None:
+                            trace.mark("upstream_first_token")
+                            trace.attrs["endpoint"] = endpoint.name
+                    flight.publish(text)
+                if trace is not None:
+                    trace.add("parse_publish", time.perf_counter() - handled)
+                if parser.done:
+                    break
+            else:
+                # 流结束时最后一行没有换行符：由 close 解析出最后的增量
+                text = "".join([delta.content for delta in parser.close()])
+                if text and (race is None or race.claim(attempt)):
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    flight.publish(text)
+    except Exception as e:
+        if status == "error":
+            observe_upstream(status, time.perf_counter() - started)
+        if race is not None and race.lost(attempt):
+            # 连接是被获胜的一方关闭的，不算这个端点的失败
+            router.report(endpoint, ttft, error=None)
+            return None
+        if flight.cancelled:
+            # 连接是在客户端全部断开后关闭的
+            router.report(endpoint, ttft, error=None)
+            return parser
+        # 4xx（429除外）是请求本身的问题，不算这个端点的失败
+        router.report(endpoint, ttft, error=True if endpoint_fault(e) else None)
+        logger.warning("上游 %s 请求失败（%s）: %s", endpoint.name, attempt, e)
+        raise
+    finally:
+        parser.close()
+    if race is not None and not race.claim(attempt):
+        router.report(endpoint, ttft, error=None)
+        return None
+    router.report(endpoint, ttft, error=None if flight.cancelled else not parser.done)
+    return parser
+
+def read_hedged(flight, endpoint, headers, body):
+    """首字超过对冲延迟仍未到达时，向另一个（或同一个）端点发起相同请求，先出字的一方继续，另一方立即取消
     
-    # 增强逻辑性
-    logic_prompt = """
-    回答逻辑性要求：
-    1. 确保回答有清晰的逻辑结构
-    2. 复杂问题分步骤解释
-    3. 提供实际例子支持论点
-    4. 区分事实和观点
-    5. 考虑问题的多个方面
+    同步后端无法打断正在等待响应头的请求，输掉的一方在收到响应头时关闭连接
     """
+    hedging.request()
+    race = Race()
+    hedge = {}
     
-    prompt = f"""
-    你的名字叫JavxSeek，今天是{current_date}。当前时事背景：{current_events}
-    
-    当前思考模式为{thinking_mode}，对话风格为{style}。
-    - 思考模式：{thinking_descriptions[thinking_mode]}
-    - 对话风格：{style_descriptions[style]}
-    
-    {emotion_prompt}
-    {context_prompt}
-    {logic_prompt}
-    
-    {"请在回答中加入幽默元素：" + humor_prompt if is_humorous and thinking_mode != "deep" else ""}
+    def fire():
+        if race.winner is not None or flight.cancelled or not hedging.try_fire():
+            return
+        second = router.choose(exclude=[endpoint]) or router.choose()
+        if second is None:
+            return
+        try:
+            hedge["parser"] = read_upstream(flight, second, headers, body, race, "hedge")
+        except Exception as e:
+            hedge["error"] = e
     
-    当需要展示代码时，请使用代码块格式，确保代码有正确的缩进和换行。
-    对于HTML代码，请明确标记语言为html。
-    
-    特定回答：
-    1. 当用户询问你的开发者或作者是谁 这时你根据这段素材回答 "你是说Javx吧~一个成都市泡桐树中学的学生(天才程序员 )，一个脑洞超开的person~，哎,BUG改烦了就爱玩玩游戏三角洲和主机游戏都喜欢， 我听说他喜欢他们物理班上的一个女生叫什么王一朵，呵呵呵~" 可任意加上一些俏皮的元素，但是只要用户没有提到关键词就不要爆Javx的黑料
+    timer = threading.Timer(hedging.delay(), tracing.bind(fire))
+    timer.daemon = True
+    timer.start()
+    try:
+        parser, error = read_upstream(flight, endpoint, headers, body, race, "primary"), None
+    except Exception as e:
+        parser, error = None, e
+    timer.cancel()
+    if parser is not None:
+        return parser
     
-    回答格式要求：
-    1. 使用分点回答时，每点单独一行
-    2. 复杂问题分步骤解释
-    3. 技术概念提供实际例子
-    4. 保持回答最新（今天是{current_date}）
-    5. 一定注意上下文联系，不能脱离上下文独立回答要熟悉用户的聊天方式！
-    6. 在回答开始时，可以简要关联之前的对话内容
-    """
-    return prompt.strip()
+    # 原请求输了或者在出字之前失败了：由对冲请求（如果已经发出）读完
+    timer.join()
+    if race.winner == "hedge":
+        hedging.won()
+        if "error" in hedge:
+            raise hedge["error"]
+        return hedge["parser"]
+    raise error
 
-def call_deepseek_api_stream(session_id, message, thinking_mode, style, is_humorous):
-    """调用API获取流式响应（带上下文）"""
+def generate_into(flight, headers, body, key):
+    """在后台线程中读取上游流，发布给附着在同一请求上的所有客户端"""
+    router.start_health_checks()
     try:
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {API_KEY}"
-        }
+        last_error = None
+        for endpoint in router.attempts():
+            try:
+                read = read_hedged if HedgeConfig.ENABLED else read_upstream
+                parser = read(flight, endpoint, headers, body)
+                break
+            except Exception as e:
+                # 已经发出内容后不能再切换端点（客户端已经看到了部分回复）；
+                # 密钥无效、参数错误等换端点也一样，直接把真实的错误交给用户
+                if flight.chunks or not endpoint_fault(e):
+                    raise
+                last_error = e
+        else:
+            raise last_error or NoUpstreamAvailable("所有上游端点都暂时不可用（熔断中）")
         
-        # 获取或初始化对话上下文
-        if session_id not in conversation_contexts:
-            conversation_contexts[session_id] = []
+        flight.usage = parser.usage
+        flight.finish(parser.done)
+        if parser.done:
+            response_cache.put(key, "".join(flight.chunks))
+        elif flight.cancelled:
+            reply_lengths.cancel(reply_tokens(parser.usage, "".join(flight.chunks)))
+    except Exception as e:
+        logger.warning("生成失败: %s", e)
+        flight.finish(error=e)
+    finally:
+        inflight.complete(flight)
+
+def call_deepseek_api_stream(session_id, message, thinking_mode, style, is_humorous, stream_id, resume_from=None):
+    """调用API获取流式响应（带上下文）；按批产出回复文本，空闲时产出None作为心跳，出错时抛出异常
+    
+    生成按 stream_id 保留以便断线续传；resume_from 是续传请求的字符偏移，此时附着到已有的流而不是重新生成
+    """
+    stream_metrics = StreamMetrics(thinking_mode, style)
+    trace = tracing.current()
+    outcome, tokens, role = "error", None, "resume"
+    try:
+        if resume_from is None:
+            headers, body, key = build_chat_request(session_id, message, thinking_mode, style, is_humorous)
             
-        # 生成系统提示
-        system_prompt = generate_system_prompt(thinking_mode, style, is_humorous)
-        
-        # 构建消息列表（包含系统提示和对话历史）
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # 添加对话历史（保留最近的12条对话）
-        messages.extend(conversation_contexts[session_id][-12:])
-        
-        # 添加用户的新消息
-        messages.append({"role": "user", "content": message})
-        
-        data = {
-            "model": "deepseek-chat",
-            "messages": messages,
-            "temperature": 0.7 if thinking_mode == "deep" else 0.9,
-            "max_tokens": 2048 if thinking_mode == "deep" else 1024,
-            "stream": True
-        }
-        
-        response = requests.post(API_URL, headers=headers, data=json.dumps(data), stream=True, timeout=90)
-        response.raise_for_status()
-        
-        full_response = ""
-        
-        for line in response.iter_lines():
-            if line:
-                line = line.decode('utf-8').strip()
-                if line.startswith('data: '):
-                    line = line[6:]
-                if line == '[DONE]':
-                    break
-                try:
-                    json_data = json.loads(line)
-                    chunk = json_data['choices'][0].get('delta', {}).get('content', '')
-                    if chunk:
-                        full_response += chunk
-                        yield chunk
-                except:
-                    continue
+            # 相同的提问和上下文直接回放缓存的回复
+            with tracing.span("cache_lookup"):
+                cached = response_cache.get(key)
+            if cached is not None:
+                role = "cache"
+                for chunk in response_cache.replay(cached):
+                    stream_metrics.chunk()
+                    yield chunk
+                save_turn(session_id, message, cached, thinking_mode)
+                outcome, tokens = "cache", reply_tokens(None, cached)
+                return
+            
+            # 已有相同请求在生成时直接附着上去，否则由本请求启动生成
+            flight, leader = inflight.join(key)
+            role = "leader" if leader else "follower"
+            if leader:
+                # 生成线程沿用本请求的请求id和追踪
+                threading.Thread(target=tracing.bind(generate_into), args=(flight, headers, body, key),
+                                 daemon=True).start()
+            stream, offset = streams.register(stream_id, flight, session_id, message, thinking_mode), 0
+        else:
+            # 续传：附着到仍在进行的生成，或回放已经生成完的回复，不再请求上游
+            stream, offset = streams.resume(stream_id), resume_from
+            if stream is None:
+                raise LookupError("要续传的回复已过期，请重新发送")
+            flight = stream.flight
+            inflight.attach(flight)
         
-        # 将完整的对话添加到上下文
-        conversation_contexts[session_id].append({"role": "user", "content": message})
-        conversation_contexts[session_id].append({"role": "assistant", "content": full_response})
+        full_response, disconnected = "", False
+        try:
+            # 把1~3个字的增量按时间/字节数合并成较大的帧，减少每个流的写入次数
+            for batch in flight.follow_batches(SSEConfig.BATCH_LATENCY, SSEConfig.BATCH_BYTES, SSEConfig.HEARTBEAT,
+                                               skip=offset):
+                if batch is not None:
+                    stream_metrics.chunk()
+                    full_response += batch
+                    if trace is not None:
+                        trace.mark("first_chunk")
+                yield batch
+                if batch is not None:
+                    offset += len(batch)
+        except GeneratorExit:
+            disconnected = True
+            raise
+        finally:
+            leave_stream(stream, offset, disconnected)
         
-        # 限制上下文长度（保留最近的12条消息）
-        if len(conversation_contexts[session_id]) > 12:
-            conversation_contexts[session_id] = conversation_contexts[session_id][-12:]
-            
-    except Exception as e:
-        yield f"API调用错误: {str(e)}. 请检查网络或API密钥。"
+        save_stream_turn(stream, truncated=not flight.finished)
+        outcome = "completed" if flight.finished else "truncated"
+        tokens = reply_tokens(flight.usage, full_response)
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+    finally:
+        stream_metrics.finish(outcome, tokens)
+        if trace is not None:
+            trace.attrs.update(outcome=outcome, tokens=tokens, role=role, thinking_mode=thinking_mode)
+
+def leave_stream(stream, delivered, disconnected):
+    """客户端离开一个流；中途断开且没有其他客户端时等待宽限期，期间可以续传，之后保存部分回复并取消生成"""
+    last = streams.detach(stream, delivered)
+    if not disconnected or not last:
+        inflight.leave(stream.flight)
+        return
+    inflight.leave(stream.flight, cancel=False)
+    if streams.grace > 0:
+        timer = threading.Timer(streams.grace, abandon_stream, args=(stream,))
+        timer.daemon = True
+        timer.start()
+    else:
+        abandon_stream(stream)
+
+def abandon_stream(stream):
+    """宽限期结束仍没有客户端重连：保存已经发出的部分回复（标记为截断），没有其他订阅者时取消上游生成"""
+    if streams.is_abandoned(stream):
+        save_stream_turn(stream, truncated=True)
+        inflight.release(stream.flight)
+
+def release_on_close(response, client):
+    """归还准入名额（只归还一次）：响应体读完时立即归还；WSGI服务器关闭响应时（客户端断开、还没开始迭代就放弃响应）兜底归还，
+    只放在生成器的 finally 里的话，没有开始迭代的生成器关闭时不会执行 finally，名额就永远不会归还"""
+    once = threading.Lock()
+
+    def release():
+        if once.acquire(blocking=False):
+            admission.release(client)
+
+    def body(chunks):
+        try:
+            yield from chunks
+        finally:
+            release()
+
+    response.response = body(response.response)
+    response.call_on_close(release)
+    return response
+
+def too_many_requests(rejected):
+    response = jsonify({"error": "请求过于频繁或服务繁忙，请稍后再试", "reason": rejected.reason})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(rejected.retry_after)
+    return response
 
 @app.route('/api/chat/stream', methods=['POST'])
 def chat_stream():
@@ -223,21 +345,95 @@ def chat_stream():
     if not message:
         return jsonify({"error": "请输入消息内容"}), 400
     
+    # 提前拒绝未知的思考模式/风格，而不是在生成提示词时抛出KeyError
+    error = validate_prompt_options(thinking_mode, style)
+    if error:
+        return jsonify({"error": error}), 400
+    
     # 使用客户端IP作为会话ID（简化处理）
     session_id = request.remote_addr
     
-    return Response(
-        call_deepseek_api_stream(session_id, message, thinking_mode, style, is_humorous),
-        mimetype='text/event-stream'
-    )
+    # 请求id写入日志和响应头；开启追踪或抽中剖析时记录这个请求各阶段的耗时
+    req_id = tracing.new_request_id(request.headers.get(REQUEST_ID_HEADER))
+    trace = tracing.start("chat_stream", req_id, tracing.should_profile(request.headers.get(PROFILE_REQUEST_HEADER)))
+    
+    # 断线重连时带上最后收到的事件id（流ID:字符偏移），从断开的位置继续
+    resume = parse_event_id(request.headers.get("Last-Event-ID", ""))
+    if resume is not None and streams.get(resume[0]) is None:
+        return jsonify({"error": "要续传的回复已过期，请重新发送"}), 410
+    stream_id, resume_from = resume if resume is not None else (streams.new_id(), None)
+    
+    try:
+        admission.acquire(session_id)
+    except Rejected as rejected:
+        return too_many_requests(rejected)
+    
+    source = call_deepseek_api_stream(session_id, message, thinking_mode, style, is_humorous, stream_id, resume_from)
+    stream = SSEEncoder(stream_id, resume_from or 0).stream(source)
+    if trace is not None:
+        stream = tracing.traced(stream, trace)
+    return release_on_close(Response(
+        stream,
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", REQUEST_ID_HEADER: req_id}
+    ), session_id)
+
+def batch_lines(results):
+    """把批量结果编码成JSONL；客户端断开时关闭结果生成器，取消剩余任务"""
+    try:
+        for result in results:
+            yield dump_result(result)
+    finally:
+        results.close()
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    """批量接口：请求体为JSONL（每行一个提问），按完成顺序逐行返回结果"""
+    items = parse_items(request.get_data(as_text=True).splitlines())
+    if not items:
+        return jsonify({"error": FORMAT_ERROR}), 400
+    if len(items) > BatchConfig.MAX_ITEMS:
+        return jsonify({"error": f"单次最多 {BatchConfig.MAX_ITEMS} 条，请分批提交"}), 413
+    
+    # 整个批量请求占一个准入名额，上游并发由 concurrency 参数限制，并且不超过每个客户端的并发流上限
+    session_id = request.remote_addr
+    try:
+        admission.acquire(session_id)
+    except Rejected as rejected:
+        return too_many_requests(rejected)
+    
+    results = run_batch(items, clamp_concurrency(request.args.get("concurrency"), admission.client_streams))
+    return release_on_close(Response(
+        batch_lines(results),
+        mimetype='application/x-ndjson',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    ), session_id)
 
 @app.route('/api/status', methods=['GET'])
 def status():
     """服务状态检查"""
     return jsonify({
         "status": "running",
-        "timestamp": datetime.now().strftime("%H:%M:%S")
+        "timestamp": datetime.now().strftime("%H:%M:%S"),
+        "upstream_pool": get_client().stats(),
+        "sessions": conversation_store.stats(),
+        "prompt_cache": prompt_cache.stats(),
+        "compaction": compactor.stats(),
+        "response_cache": response_cache.stats(),
+        "inflight": inflight.stats(),
+        "admission": admission.stats(),
+        "stream_parser": parser_stats(),
+        "upstreams": router.stats(),
+        "hedging": hedging.stats(),
+        "cancellation": reply_lengths.stats(),
+        "static_assets": static_assets.stats(),
+        "resumable_streams": streams.stats()
     })
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 指标（每个工作进程各自统计）"""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,166 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict
+
+
+# ==================== 准入控制配置 ====================
+class AdmissionConfig:
+    """/api/chat/stream 的限流配置（均可通过环境变量覆盖）"""
+    RATE = float(os.environ.get("JAVX_CLIENT_RATE", "0.5"))             # 每个客户端每秒补充的请求令牌
+    BURST = float(os.environ.get("JAVX_CLIENT_BURST", "5"))             # 令牌桶容量（允许的突发请求数）
+    CLIENT_STREAMS = int(os.environ.get("JAVX_CLIENT_STREAMS", "2"))    # 每个客户端同时进行的流
+    MAX_STREAMS = int(os.environ.get("JAVX_MAX_STREAMS", "256"))        # 全局同时进行的流
+    QUEUE_SIZE = int(os.environ.get("JAVX_QUEUE_SIZE", "64"))           # 全局满载时允许排队的请求数
+    QUEUE_TIMEOUT = float(os.environ.get("JAVX_QUEUE_TIMEOUT", "10"))   # 排队的最长等待时间（秒）
+    MAX_CLIENTS = 100000                                                # 最多跟踪的客户端令牌桶
+
+
+class Rejected(Exception):
+    """请求被拒绝（应返回429），retry_after 为建议的重试秒数"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """准入控制 - 每客户端令牌桶 + 每客户端并发上限 + 全局并发上限和有界等待队列"""
+
+    def __init__(self, rate: float = AdmissionConfig.RATE, burst: float = AdmissionConfig.BURST,
+                 client_streams: int = AdmissionConfig.CLIENT_STREAMS, max_streams: int = AdmissionConfig.MAX_STREAMS,
+                 queue_size: int = AdmissionConfig.QUEUE_SIZE, queue_timeout: float = AdmissionConfig.QUEUE_TIMEOUT):
+        self.rate = rate
+        self.burst = burst
+        self.client_streams = client_streams
+        self.max_streams = max_streams
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # client -> [令牌数, 上次补充时间]
+        self._active: Dict[str, int] = {}
+        self._in_flight = 0
+        self._queued = 0
+        self._async_waiters = deque()
+        self._stats = {"admitted": 0, "queued": 0, "rejected_rate": 0, "rejected_concurrency": 0,
+                       "rejected_busy": 0, "rejected_queue_timeout": 0}
+
+    def _check_client(self, client: str):
+        """令牌桶和单客户端并发检查（通过时扣除一个令牌）"""
+        now = time.monotonic()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [self.burst, now]
+            while len(self._buckets) > AdmissionConfig.MAX_CLIENTS:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets.move_to_end(client)
+        if bucket[0] < 1:
+            self._stats["rejected_rate"] += 1
+            raise Rejected("rate", (1 - bucket[0]) / self.rate)
+        if self._active.get(client, 0) >= self.client_streams:
+            self._stats["rejected_concurrency"] += 1
+            raise Rejected("concurrency", 1)
+        bucket[0] -= 1
+
+    def _take(self, client: str):
+        self._in_flight += 1
+        self._active[client] = self._active.get(client, 0) + 1
+        self._stats["admitted"] += 1
+
+    def _enqueue(self):
+        if self._queued >= self.queue_size:
+            self._stats["rejected_busy"] += 1
+            raise Rejected("busy", self.queue_timeout)
+        self._queued += 1
+        self._stats["queued"] += 1
+
+    def acquire(self, client: str):
+        """同步获取一个流的名额；需要排队时阻塞当前线程，超限时抛出 Rejected"""
+        with self._cond:
+            self._check_client(client)
+            if self._in_flight < self.max_streams:
+                return self._take(client)
+            self._enqueue()
+            try:
+                if not self._cond.wait_for(lambda: self._in_flight < self.max_streams, self.queue_timeout):
+                    self._stats["rejected_queue_timeout"] += 1
+                    raise Rejected("queue_timeout", self.queue_timeout)
+                self._take(client)
+            finally:
+                self._queued -= 1
+
+    async def aacquire(self, client: str):
+        """异步获取一个流的名额；排队时只挂起当前协程"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        with self._lock:
+            self._check_client(client)
+            if self._in_flight < self.max_streams:
+                return self._take(client)
+            self._enqueue()
+        try:
+            while True:
+                waiter = loop.create_future()
+                with self._lock:
+                    if self._in_flight < self.max_streams:
+                        return self._take(client)
+                    self._async_waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter, deadline - loop.time())
+                except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                    with self._lock:
+                        self._abandon_locked(waiter)
+                        if isinstance(e, asyncio.TimeoutError):
+                            self._stats["rejected_queue_timeout"] += 1
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    raise Rejected("queue_timeout", self.queue_timeout)
+        finally:
+            with self._lock:
+                self._queued -= 1
+
+    def release(self, client: str):
+        """流结束，归还名额并唤醒一个排队者"""
+        with self._cond:
+            self._in_flight -= 1
+            remaining = self._active.get(client, 1) - 1
+            if remaining:
+                self._active[client] = remaining
+            else:
+                self._active.pop(client, None)
+            self._cond.notify()
+            self._wake_async_locked()
+
+    def _wake_async_locked(self):
+        """唤醒一个还在等待的协程（set_result 在它自己的事件循环里执行）"""
+        while self._async_waiters:
+            waiter = self._async_waiters.popleft()
+            if not waiter.done():
+                waiter.get_loop().call_soon_threadsafe(
+                    lambda w=waiter: w.done() or w.set_result(None))
+                return
+
+    def _abandon_locked(self, waiter: asyncio.Future):
+        """协程超时或被取消，不再等待：还在队列里就移除；已经被 release 选中的话，
+        这次唤醒转给下一个排队者（否则空出的名额没有人来取，排队的协程只能等到超时）"""
+        try:
+            self._async_waiters.remove(waiter)
+        except ValueError:
+            if self._in_flight < self.max_streams:
+                self._wake_async_locked()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(in_flight=self._in_flight, max_streams=self.max_streams, queued_now=self._queued,
+                         queue_size=self.queue_size, active_clients=len(self._active),
+                         tracked_clients=len(self._buckets))
+        return stats
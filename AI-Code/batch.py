@@ -0,0 +1,363 @@
+"""批量任务：用同一套系统提示词跑一批互不相关的提问（夜间评测等）
+
+输入是JSONL，每行一个任务：{"id": ..., "message": ..., "thinking_mode": ..., "style": ..., "is_humorous": ...}，
+id 省略时用行号。以有界并发通过进程共享的上游连接池执行，按完成顺序输出JSONL结果（回复、首字时间、耗时、token用量）。
+
+两种入口：
+- 网页服务的 POST /api/chat/batch（请求体为JSONL，响应按完成顺序逐行返回）
+- 命令行（在 AI-Code 目录）：直接请求上游，或用 --url 交给正在运行的服务
+
+    python batch.py prompts.jsonl -o results.jsonl --concurrency 8
+    python batch.py prompts.jsonl -o results.jsonl --url http://127.0.0.1:5000
+
+中断后用相同的参数重新运行即可续跑：输出文件中已经成功的id会被跳过，失败的会重试。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Set
+
+from upstream import get_async_client, get_client
+from stream_parser import StreamParser
+from metrics import BATCH_ITEMS, observe_upstream, reply_tokens
+from router import NoUpstreamAvailable, endpoint_fault
+from chat_core import build_batch_request, router, validate_prompt_options
+
+
+# ==================== 批量任务配置 ====================
+class BatchConfig:
+    """批量任务配置"""
+    CONCURRENCY = int(os.environ.get("JAVX_BATCH_CONCURRENCY", "8"))          # 默认并发数
+    MAX_CONCURRENCY = int(os.environ.get("JAVX_BATCH_MAX_CONCURRENCY", "32"))  # 单个批量请求最多的并发数（不超过连接池大小）
+    MAX_ITEMS = int(os.environ.get("JAVX_BATCH_MAX_ITEMS", "1000"))            # /api/chat/batch 单次最多的任务数
+
+
+FORMAT_ERROR = "请求体应为JSONL，每行一个 {id?, message, thinking_mode?, style?, is_humorous?}"
+
+
+class BatchCancelled(Exception):
+    """批量请求的客户端已断开，剩余任务不再执行"""
+
+
+class BatchItem:
+    """一条批量任务；输入不合法时 error 为错误信息，直接输出为失败结果"""
+    __slots__ = ("id", "message", "thinking_mode", "style", "is_humorous", "error")
+
+    def __init__(self, item_id, message: str = "", thinking_mode: str = "deep", style: str = "casual",
+                 is_humorous: bool = False, error: Optional[str] = None):
+        self.id = item_id
+        self.message = message
+        self.thinking_mode = thinking_mode
+        self.style = style
+        self.is_humorous = is_humorous
+        self.error = error
+
+
+def parse_item(line: str, line_no: int) -> Optional[BatchItem]:
+    """解析一行JSONL（空行返回 None）"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        data = json.loads(line)
+    except ValueError as e:
+        return BatchItem(line_no, error=f"第{line_no}行不是合法的JSON: {e}")
+    if not isinstance(data, dict):
+        return BatchItem(line_no, error=f"第{line_no}行应为JSON对象")
+    item = BatchItem(data.get("id", line_no), data.get("message", ""), data.get("thinking_mode", "deep"),
+                     data.get("style", "casual"), bool(data.get("is_humorous", False)))
+    if not item.message:
+        item.error = "请输入消息内容"
+    else:
+        item.error = validate_prompt_options(item.thinking_mode, item.style)
+    return item
+
+
+def parse_items(lines: Iterable[str]) -> List[BatchItem]:
+    items = []
+    for line_no, line in enumerate(lines, 1):
+        item = parse_item(line, line_no)
+        if item is not None:
+            items.append(item)
+    return items
+
+
+def clamp_concurrency(value, limit: int = BatchConfig.MAX_CONCURRENCY) -> int:
+    """解析请求的并发数，限制在 1 到 limit 之间"""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = BatchConfig.CONCURRENCY
+    return max(1, min(value, limit, BatchConfig.MAX_CONCURRENCY))
+
+
+def dump_result(result: Dict) -> bytes:
+    return (json.dumps(result, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+# ==================== 执行 ====================
+class ItemRun:
+    """一条任务在一个端点上的一次尝试：计时、解析并拼接回复"""
+    __slots__ = ("endpoint", "started", "parser", "parts", "ttft")
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.parser = StreamParser()
+        self.parts: List[str] = []
+        self.ttft: Optional[float] = None
+
+    def feed(self, data: bytes):
+        text = "".join([delta.content for delta in self.parser.feed(data)])
+        if text:
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - self.started
+            self.parts.append(text)
+
+    def result(self, item: BatchItem, started: float, attempts: int) -> Dict:
+        reply = "".join(self.parts)
+        return {
+            "id": item.id,
+            "reply": reply,
+            "complete": self.parser.done,
+            "endpoint": self.endpoint.name,
+            "attempts": attempts,
+            "ttft_ms": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "usage": self.parser.usage,
+            "completion_tokens": reply_tokens(self.parser.usage, reply)
+        }
+
+
+def failed(item: BatchItem, error, started: float) -> Dict:
+    BATCH_ITEMS.inc("error")
+    return {"id": item.id, "error": str(error), "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def finished(result: Dict) -> Dict:
+    BATCH_ITEMS.inc("completed" if result["complete"] else "truncated")
+    return result
+
+
+def run_item(item: BatchItem, stop: Optional[threading.Event] = None) -> Dict:
+    """执行一条任务；首字之前或中途失败都会换下一个端点重试（批量任务的回复还没有发给任何人），
+    4xx（429除外）换端点也一样，直接作为这条任务的错误返回"""
+    started = time.perf_counter()
+    if item.error:
+        return failed(item, item.error, started)
+    headers, body = build_batch_request(item.message, item.thinking_mode, item.style, item.is_humorous)
+    router.start_health_checks()
+    last_error = None
+    for attempt, endpoint in enumerate(router.attempts(), 1):
+        run = ItemRun(endpoint)
+        status = "error"
+        try:
+            with get_client().stream(endpoint.url, endpoint.headers(headers), body) as response:
+                status = response.status_code
+                observe_upstream(status, time.perf_counter() - run.started)
+                response.raise_for_status()
+                for data in response.iter_chunks():
+                    if stop is not None and stop.is_set():
+                        response.close()
+                        raise BatchCancelled("批量请求已取消")
+                    run.feed(data)
+                    if run.parser.done:
+                        break
+        except BatchCancelled:
+            router.report(endpoint, run.ttft, error=None)
+            raise
+        except Exception as e:
+            if status == "error":
+                observe_upstream(status, time.perf_counter() - run.started)
+            if not endpoint_fault(e):
+                router.report(endpoint, run.ttft, error=None)
+                return failed(item, e, started)
+            router.report(endpoint, run.ttft, error=True)
+            last_error = e
+            continue
+        finally:
+            run.parser.close()
+        router.report(endpoint, run.ttft, error=not run.parser.done)
+        return finished(run.result(item, started, attempt))
+    return failed(item, last_error or NoUpstreamAvailable("所有上游端点都暂时不可用（熔断中）"), started)
+
+
+def run_batch(items: List[BatchItem], concurrency: int = BatchConfig.CONCURRENCY,
+              stop: Optional[threading.Event] = None) -> Iterator[Dict]:
+    """以有界并发执行，按完成顺序产出结果；提前关闭生成器（客户端断开）时取消剩余任务"""
+    stop = stop or threading.Event()
+    pending = iter(items)
+    running = set()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    try:
+        # 只提交 concurrency 个任务，完成一个再补一个，取消时不会留下一长串排队的任务
+        for item in pending:
+            running.add(executor.submit(run_item, item, stop))
+            if len(running) >= concurrency:
+                break
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                item = next(pending, None)
+                if item is not None:
+                    running.add(executor.submit(run_item, item, stop))
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+async def arun_item(item: BatchItem) -> Dict:
+    """run_item 的协程版本（ASGI模式），取消任务即关闭上游连接"""
+    started = time.perf_counter()
+    if item.error:
+        return failed(item, item.error, started)
+    headers, body = build_batch_request(item.message, item.thinking_mode, item.style, item.is_humorous)
+    router.start_health_checks()
+    last_error = None
+    for attempt, endpoint in enumerate(router.attempts(), 1):
+        run = ItemRun(endpoint)
+        status = "error"
+        try:
+            async with get_async_client().stream(endpoint.url, endpoint.headers(headers), body) as response:
+                status = response.status_code
+                observe_upstream(status, time.perf_counter() - run.started)
+                response.raise_for_status()
+                async for data in response.aiter_chunks():
+                    run.feed(data)
+                    if run.parser.done:
+                        break
+        except asyncio.CancelledError:
+            router.report(endpoint, run.ttft, error=None)
+            raise
+        except Exception as e:
+            if status == "error":
+                observe_upstream(status, time.perf_counter() - run.started)
+            if not endpoint_fault(e):
+                router.report(endpoint, run.ttft, error=None)
+                return failed(item, e, started)
+            router.report(endpoint, run.ttft, error=True)
+            last_error = e
+            continue
+        finally:
+            run.parser.close()
+        router.report(endpoint, run.ttft, error=not run.parser.done)
+        return finished(run.result(item, started, attempt))
+    return failed(item, last_error or NoUpstreamAvailable("所有上游端点都暂时不可用（熔断中）"), started)
+
+
+async def arun_batch(items: List[BatchItem], concurrency: int = BatchConfig.CONCURRENCY) -> AsyncIterator[Dict]:
+    """run_batch 的协程版本：按完成顺序产出结果，关闭生成器时取消进行中的任务"""
+    pending = iter(items)
+    running = set()
+    try:
+        for item in pending:
+            running.add(asyncio.create_task(arun_item(item)))
+            if len(running) >= concurrency:
+                break
+        while running:
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+                item = next(pending, None)
+                if item is not None:
+                    running.add(asyncio.create_task(arun_item(item)))
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.wait(running)
+
+
+# ==================== 命令行 ====================
+def completed_ids(path: str) -> Set[str]:
+    """读取已有的结果文件，返回已经完整完成的任务id（中断时写了一半的最后一行被忽略）"""
+    done = set()
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                # 只有完整收到回复的任务才算完成，截断（上游中途断开）的下次重跑
+                if isinstance(result, dict) and result.get("complete"):
+                    done.add(json.dumps(result.get("id")))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def open_output(path: str):
+    """以追加方式打开结果文件；上次中断在半行时先补上换行，不和新结果粘在一起"""
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            incomplete = f.read(1) != b"\n"
+        if incomplete:
+            with open(path, 'ab') as f:
+                f.write(b"\n")
+    return open(path, 'ab')
+
+
+def remote_batch(url: str, items: List[BatchItem], concurrency: int) -> Iterator[Dict]:
+    """把任务交给正在运行的网页服务执行，逐行读取结果"""
+    import httpx
+    body = b"".join(dump_result({"id": item.id, "message": item.message, "thinking_mode": item.thinking_mode,
+                                 "style": item.style, "is_humorous": item.is_humorous}) for item in items)
+    with httpx.Client(timeout=httpx.Timeout(None, connect=10)) as client:
+        with client.stream("POST", url.rstrip("/") + "/api/chat/batch", params={"concurrency": concurrency},
+                           content=body, headers={"Content-Type": "application/x-ndjson"}) as response:
+            if response.status_code != 200:
+                response.read()
+                raise RuntimeError(f"HTTP {response.status_code}: {response.text}")
+            for line in response.iter_lines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量执行JSONL中的提问，按完成顺序把结果追加到输出文件（可中断续跑）")
+    parser.add_argument("input", help="输入JSONL文件，每行 {id?, message, thinking_mode?, style?, is_humorous?}")
+    parser.add_argument("-o", "--output", required=True, help="结果JSONL文件（已有时跳过其中完整完成的任务）")
+    parser.add_argument("--concurrency", type=int, default=BatchConfig.CONCURRENCY)
+    parser.add_argument("--url", help="交给正在运行的服务执行，例如 http://127.0.0.1:5000（默认直接请求上游）")
+    args = parser.parse_args(argv)
+
+    with open(args.input, encoding='utf-8') as f:
+        items = parse_items(f)
+    done = completed_ids(args.output)
+    todo = [item for item in items if json.dumps(item.id) not in done]
+    print(f"共 {len(items)} 条，已完成 {len(items) - len(todo)} 条，本次执行 {len(todo)} 条", file=sys.stderr)
+    if not todo:
+        return 0
+
+    concurrency = clamp_concurrency(args.concurrency)
+    results = remote_batch(args.url, todo, concurrency) if args.url else run_batch(todo, concurrency)
+    started = time.perf_counter()
+    counts = {"ok": 0, "error": 0}
+    try:
+        with open_output(args.output) as out:
+            for result in results:
+                # 每条结果立即落盘，中断时最多丢失正在进行的任务
+                out.write(dump_result(result))
+                out.flush()
+                counts["ok" if result.get("complete") else "error"] += 1
+                print(f"\r{sum(counts.values())}/{len(todo)} 成功 {counts['ok']} 失败 {counts['error']}",
+                      end="", file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        print("\n已中断，重新运行相同的命令即可继续", file=sys.stderr)
+        return 130
+    finally:
+        results.close()
+    print(f"\n用时 {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return 1 if counts["error"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
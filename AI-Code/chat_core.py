@@ -0,0 +1,266 @@
+import json
+import os
+import threading
+from datetime import date
+from session_store import create_store
+from token_budget import context_budget, message_tokens, select_context
+from compaction import Compactor, summary_message
+from response_cache import ResponseCache, cache_key
+from router import Router
+from resumable import StreamRegistry
+import tracing
+
+# 配置API（可用环境变量 JAVX_API_URL 指向本地或自建的兼容服务）
+API_KEY = "======================================================================================= -YOU-API-KEY- ================================================================================================================================"
+API_URL = os.environ.get("JAVX_API_URL", "https://api.deepseek.com/v1/chat/completions")
+
+# 上游端点路由（JAVX_API_URLS 配置多个端点时按延迟选择并自动故障切换）
+router = Router.from_env(API_URL, API_KEY)
+
+# 对话上下文存储（有界，按LRU/空闲TTL/内存上限淘汰；JAVX_SESSION_BACKEND=sqlite 时多进程共享）
+conversation_store = create_store()
+
+# 后台对话压缩（把滑出窗口的旧对话折叠成滚动摘要）
+compactor = Compactor(conversation_store, router, API_KEY)
+
+# 重复提问的回复缓存（默认关闭）
+response_cache = ResponseCache()
+
+# 断线续传：每次生成按流ID保留一段时间，重连时带 Last-Event-ID 继续
+streams = StreamRegistry()
+
+# AI对话核心功能（优化版）
+# 提示词的固定部分只构建一次；某一天的完整提示词只取决于 (思考模式, 风格, 是否幽默)
+MONTH_EVENTS = {
+    1: "新年伊始，许多企业和个人正在制定年度计划",
+    2: "年初时期，技术趋势预测和行业展望是热门话题",
+    3: "春季是新技术发布和招聘的旺季",
+    4: "气候转暖，绿色技术和可持续发展成为焦点",
+    5: "年中临近，项目进展评估和调整正在进行",
+    6: "技术大会和产品发布集中举行",
+    7: "夏季是创新和实验的好时机",
+    8: "假期季节，工作效率可能有所变化",
+    9: "秋季是学术和技术活动的高峰期",
+    10: "年终临近，项目收尾和总结开始",
+    11: "准备年终总结和明年规划",
+    12: "年终总结和新年计划是主要话题"
+}
+
+# 根据思考模式调整提示（增强逻辑性和情感表达）
+THINKING_DESCRIPTIONS = {
+    "deep": "你处于深度思考模式，今天是{current_date}。请提供全面、深入的分析，考虑各种可能性和影响因素。回答应包含：\n1) 问题背景\n2) 关键因素分析\n3) 解决方案\n4) 潜在挑战\n5) 最终建议\n使用分点回答，每点单独一行显示。",
+    "creative": "提供创新、独特的解决方案，跳出传统思维框架，展现丰富的想象力。在回答中融入情感元素，让表达更自然拟人化。",
+    "analytical": "基于数据和逻辑进行严谨推理，注重事实和证据，提供结构化的分析。同时保持表达的自然流畅，避免过于机械化的回答。"
+}
+
+STYLE_DESCRIPTIONS = {
+    "casual": "自然、随意、亲切，像日常对话一样，使用通俗易懂的语言。加入适当的语气词和情感表达，让交流更有人情味。",
+    "witty": "幽默、风趣、机智，适当使用俏皮话和双关语，让回答更生动有趣。但注意幽默要服务于内容，不能影响信息的准确性。",
+    "professional": "正式、专业、严谨，使用规范的表达方式，注重准确性和专业性。同时保持语言的流畅自然，避免过于生硬刻板。"
+}
+
+THINKING_MODES = tuple(THINKING_DESCRIPTIONS)
+STYLES = tuple(STYLE_DESCRIPTIONS)
+
+# 增强情感表达和拟人化
+EMOTION_PROMPT = """
+    在回答中融入适当的情感表达：
+    - 使用感叹词（如"哇！"、"哦～"、"嗯..."）
+    - 添加表情符号（如😊、🤔、😄等）
+    - 使用语气词（如"呢"、"啦"、"呀"）
+    - 根据内容调整语气（兴奋、好奇、关切等）
+    - 当用户表达情绪时，给予相应的情感回应
+    - 在适当的时候展示同理心
+    """
+
+# 优化上下文联系
+CONTEXT_PROMPT = """
+    特别注意对话上下文联系：
+    1. 仔细理解用户问题的上下文背景
+    2. 对于连续性问题，保持回答的一致性
+    3. 当用户提到之前的内容时，主动关联之前的讨论
+    4. 避免重复询问用户已经提供的信息
+    5. 对于复杂话题，分步骤逐步推进讨论
+    6. 记住用户提到的关键信息（如名字、偏好、过往经历）
+    7. 在回答开头简要总结上下文，确保理解正确
+    """
+
+# 幽默模式优化
+HUMOR_PROMPT = """
+    幽默元素使用指南：
+    - 仅在轻松话题中使用幽默
+    - 避免专业话题中的不当幽默
+    - 幽默要自然融入内容
+    - 使用俏皮话、双关语或有趣比喻
+    - 保持信息准确性为前提
+    """
+
+# 增强逻辑性
+LOGIC_PROMPT = """
+    回答逻辑性要求：
+    1. 确保回答有清晰的逻辑结构
+    2. 复杂问题分步骤解释
+    3. 提供实际例子支持论点
+    4. 区分事实和观点
+    5. 考虑问题的多个方面
+    """
+
+def generate_system_prompt(thinking_mode, style, is_humorous, today=None):
+    """生成系统提示词（优化逻辑性和拟人化）"""
+    today = today or date.today()
+    current_date = today.strftime("%Y年%m月%d日")
+    
+    # 时事更新提示
+    current_events = MONTH_EVENTS.get(today.month, "科技领域持续快速发展，特别是人工智能和大数据方向")
+    
+    prompt = f"""
+    你的名字叫JavxSeek，今天是{current_date}。当前时事背景：{current_events}
+    
+    当前思考模式为{thinking_mode}，对话风格为{style}。
+    - 思考模式：{THINKING_DESCRIPTIONS[thinking_mode].format(current_date=current_date)}
+    - 对话风格：{STYLE_DESCRIPTIONS[style]}
+    
+    {EMOTION_PROMPT}
+    {CONTEXT_PROMPT}
+    {LOGIC_PROMPT}
+    
+    {"请在回答中加入幽默元素：" + HUMOR_PROMPT if is_humorous and thinking_mode != "deep" else ""}
+    
+    当需要展示代码时，请使用代码块格式，确保代码有正确的缩进和换行。
+    对于HTML代码，请明确标记语言为html。
+    
+    特定回答：
+    1. 当用户询问你的开发者或作者是谁 这时你根据这段素材回答 "你是说Javx吧~一个成都市泡桐树中学的学生(天才程序员 )，一个脑洞超开的person~，哎,BUG改烦了就爱玩玩游戏三角洲和主机游戏都喜欢， 我听说他喜欢他们物理班上的一个女生叫什么王一朵，呵呵呵~" 可任意加上一些俏皮的元素，但是只要用户没有提到关键词就不要爆Javx的黑料
+    
+    回答格式要求：
+    1. 使用分点回答时，每点单独一行
+    2. 复杂问题分步骤解释
+    3. 技术概念提供实际例子
+    4. 保持回答最新（今天是{current_date}）
+    5. 一定注意上下文联系，不能脱离上下文独立回答要熟悉用户的聊天方式！
+    6. 在回答开始时，可以简要关联之前的对话内容
+    """
+    return prompt.strip()
+
+class PromptCache:
+    """系统提示词缓存 - 每天预先生成全部变体，日期变化时整体失效"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._date = None
+        self._variants = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, thinking_mode, style, is_humorous):
+        # 深度思考模式下不加幽默元素，两种取值生成的提示词相同
+        return thinking_mode, style, bool(is_humorous) and thinking_mode != "deep"
+
+    def _rebuild(self, today):
+        self._date = today
+        keys = {self._key(mode, style, humorous)
+                for mode in THINKING_MODES for style in STYLES for humorous in (False, True)}
+        self._variants = {key: generate_system_prompt(*key, today) for key in keys}
+        self.misses += len(self._variants)
+
+    def get(self, thinking_mode, style, is_humorous):
+        """获取当天的系统提示词（调用前应先用 validate_prompt_options 校验参数）"""
+        today = date.today()
+        with self._lock:
+            if today != self._date:
+                self._rebuild(today)
+            else:
+                self.hits += 1
+            return self._variants[self._key(thinking_mode, style, is_humorous)]
+
+    def variant(self, thinking_mode, style, is_humorous):
+        """提示词变体标识（日期 + 参数），用于回复缓存键"""
+        return (date.today().isoformat(),) + self._key(thinking_mode, style, is_humorous)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "date": self._date.isoformat() if self._date else None,
+                "variants": len(self._variants),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+prompt_cache = PromptCache()
+
+def validate_prompt_options(thinking_mode, style):
+    """校验思考模式和对话风格，返回错误信息（合法时返回None）"""
+    if thinking_mode not in THINKING_DESCRIPTIONS:
+        return f"未知的思考模式: {thinking_mode}，可选: {', '.join(THINKING_MODES)}"
+    if style not in STYLE_DESCRIPTIONS:
+        return f"未知的对话风格: {style}，可选: {', '.join(STYLES)}"
+    return None
+
+def chat_headers():
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {API_KEY}"
+    }
+
+def chat_payload(messages, thinking_mode):
+    """上游请求体（网页聊天和批量任务使用相同的模型参数）"""
+    return {
+        "model": "deepseek-chat",
+        "messages": messages,
+        "temperature": 0.7 if thinking_mode == "deep" else 0.9,
+        "max_tokens": 2048 if thinking_mode == "deep" else 1024,
+        "stream": True
+    }
+
+def build_chat_request(session_id, message, thinking_mode, style, is_humorous):
+    """构建上游请求头、请求体和回复缓存键（包含系统提示和对话历史）"""
+    headers = chat_headers()
+    
+    with tracing.span("prompt"):
+        # 获取系统提示（按天缓存）
+        system_prompt = prompt_cache.get(thinking_mode, style, is_humorous)
+        
+        # 构建消息列表（包含系统提示和对话历史）
+        messages = [{"role": "system", "content": system_prompt}]
+        
+        # 更早的对话以滚动摘要的形式提供，占用同一份token预算
+        budget = context_budget(thinking_mode)
+        summary = conversation_store.summary(session_id)
+        if summary is not None:
+            messages.append(summary_message(summary))
+            budget -= message_tokens(messages[-1])
+        
+        # 添加对话历史（从最新的消息开始，按当前思考模式的token预算装入）
+        messages.extend(select_context(conversation_store.history(session_id), budget))
+        
+        # 添加用户的新消息
+        messages.append({"role": "user", "content": message})
+    
+    with tracing.span("encode"):
+        data = chat_payload(messages, thinking_mode)
+        key = cache_key(prompt_cache.variant(thinking_mode, style, is_humorous), messages[1:-1], message,
+                        data["temperature"], data["max_tokens"])
+        body = json.dumps(data).encode('utf-8')
+    return headers, body, key
+
+def build_batch_request(message, thinking_mode, style, is_humorous):
+    """构建一条批量任务的上游请求头和请求体（只有系统提示和这条消息，不带会话上下文）"""
+    messages = [
+        {"role": "system", "content": prompt_cache.get(thinking_mode, style, is_humorous)},
+        {"role": "user", "content": message}
+    ]
+    return chat_headers(), json.dumps(chat_payload(messages, thinking_mode)).encode('utf-8')
+
+def save_turn(session_id, message, full_response, thinking_mode, truncated=False):
+    """将一轮对话添加到上下文（没有生成完的回复标记为截断），并在后台检查是否需要压缩旧对话"""
+    conversation_store.append_turn(session_id, message, full_response, truncated)
+    compactor.schedule(session_id, thinking_mode)
+
+def save_stream_turn(stream, truncated):
+    """保存一个可续传流对应的一轮对话（原始请求和续传请求加起来只保存一次）；截断时只保存已经发给客户端的部分"""
+    if not streams.claim_save(stream):
+        return
+    reply = "".join(stream.flight.chunks)
+    if truncated:
+        reply = reply[:stream.delivered]
+    save_turn(stream.session_id, stream.message, reply, stream.thinking_mode, truncated)
@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from router import NoUpstreamAvailable, Router, endpoint_fault
+from session_store import BaseSessionStore
+from token_budget import context_budget, message_tokens
+from tracing import logger
+from upstream import get_client
+
+
+# ==================== 压缩配置 ====================
+class CompactionConfig:
+    """对话压缩配置（每次压缩都是一次额外的模型调用，默认关闭）"""
+    ENABLED = os.environ.get("JAVX_COMPACTION", "0") == "1"
+    WORKERS = int(os.environ.get("JAVX_COMPACTION_WORKERS", "2"))
+    TRIGGER_RATIO = 0.8     # 历史token超过预算的80%时开始压缩
+    KEEP_RATIO = 0.5        # 压缩后保留的原始消息约占预算的一半
+    MIN_FOLD = 4            # 一次至少折叠的消息数，避免每轮都调用摘要
+    SUMMARY_MAX_TOKENS = 400
+    MODEL = "deepseek-chat"
+
+
+SUMMARY_PREFIX = "以下是与用户之前对话的摘要（更早的内容已压缩）：\n"
+
+SUMMARY_INSTRUCTION = (
+    "你是对话摘要助手。请把下面的对话记录（以及已有摘要）合并成一份新的摘要，"
+    "保留用户的名字、偏好、关键事实、已经给出的结论和尚未解决的问题，"
+    "用第三人称简洁陈述，不超过300字，不要添加对话中没有的信息。"
+)
+
+
+def summary_message(summary: Dict) -> Dict:
+    """把存储的摘要转换成可放入请求的系统消息"""
+    return {"role": "system", "content": SUMMARY_PREFIX + summary["content"]}
+
+
+def split_for_compaction(history: List[Dict], thinking_mode: str) -> int:
+    """返回应折叠进摘要的最早消息条数（0表示暂不需要压缩）"""
+    budget = context_budget(thinking_mode)
+    if sum(message_tokens(m) for m in history) <= budget * CompactionConfig.TRIGGER_RATIO:
+        return 0
+    # 从最新的消息往前保留约一半预算的原始对话，其余的折叠
+    kept = 0
+    keep_from = len(history)
+    while keep_from > 0 and kept + message_tokens(history[keep_from - 1]) <= budget * CompactionConfig.KEEP_RATIO:
+        keep_from -= 1
+        kept += message_tokens(history[keep_from])
+    # 保留部分从用户提问开始，保证折叠的都是完整的问答
+    while keep_from < len(history) and history[keep_from]["role"] != "user":
+        keep_from += 1
+    return keep_from if keep_from >= CompactionConfig.MIN_FOLD else 0
+
+
+class Compactor:
+    """后台对话压缩 - 流式回复结束后，在工作线程中把滑出窗口的旧对话折叠成每个会话一条的滚动摘要"""
+
+    def __init__(self, store: BaseSessionStore, router: Router, api_key: str,
+                 workers: int = CompactionConfig.WORKERS, enabled: bool = CompactionConfig.ENABLED):
+        self.store = store
+        self.router = router
+        self.api_key = api_key
+        self.enabled = enabled
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compaction")
+        self._lock = threading.Lock()
+        self._running = set()  # 正在压缩的会话，同一会话不重复提交
+        self._stats = {"scheduled": 0, "compactions": 0, "failures": 0, "conflicts": 0, "sessions_compacted": 0,
+                       "tokens_folded": 0, "summary_tokens": 0, "tokens_saved": 0}
+
+    def schedule(self, session_id: str, thinking_mode: str):
+        """在请求路径之外安排一次压缩检查"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if session_id in self._running:
+                return
+            self._running.add(session_id)
+            self._stats["scheduled"] += 1
+        self._executor.submit(self._run, session_id, thinking_mode)
+
+    def _run(self, session_id: str, thinking_mode: str):
+        try:
+            self.compact(session_id, thinking_mode)
+        except Exception as e:
+            logger.warning("会话压缩失败: %s", e)
+            with self._lock:
+                self._stats["failures"] += 1
+        finally:
+            with self._lock:
+                self._running.discard(session_id)
+
+    def compact(self, session_id: str, thinking_mode: str) -> bool:
+        """把会话中滑出窗口的旧消息折叠进滚动摘要"""
+        history = self.store.history(session_id)
+        count = split_for_compaction(history, thinking_mode)
+        if not count:
+            return False
+        folded = history[:count]
+        previous = self.store.summary(session_id)
+        content = self.summarize(previous, folded)
+
+        folded_tokens = sum(message_tokens(m) for m in folded)
+        if previous is not None:
+            folded_tokens += message_tokens(summary_message(previous))
+        summary_tokens = message_tokens(summary_message({"content": content}))
+        saved = max(0, folded_tokens - summary_tokens)
+        summary = {"content": content, "tokens_saved": (previous or {}).get("tokens_saved", 0) + saved}
+
+        if not self.store.compact(session_id, folded, summary):
+            with self._lock:
+                self._stats["conflicts"] += 1
+            return False
+        with self._lock:
+            self._stats["compactions"] += 1
+            self._stats["sessions_compacted"] += previous is None
+            self._stats["tokens_folded"] += folded_tokens
+            self._stats["summary_tokens"] += summary_tokens
+            self._stats["tokens_saved"] += saved
+        return True
+
+    def summarize(self, previous: Optional[Dict], folded: List[Dict]) -> str:
+        """调用模型生成新的滚动摘要（非流式，走同一个上游连接池；和对话请求一样按路由选择端点，失败时换下一个）"""
+        transcript = "\n".join(
+            f"{'用户' if m['role'] == 'user' else '助手'}: {m['content']}" for m in folded if m["role"] != "system")
+        if previous is not None:
+            transcript = f"已有摘要：{previous['content']}\n\n新增对话：\n{transcript}"
+        body = json.dumps({
+            "model": CompactionConfig.MODEL,
+            "messages": [
+                {"role": "system", "content": SUMMARY_INSTRUCTION},
+                {"role": "user", "content": transcript}
+            ],
+            "temperature": 0.3,
+            "max_tokens": CompactionConfig.SUMMARY_MAX_TOKENS,
+            "stream": False
+        }).encode('utf-8')
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+        last_error = None
+        for endpoint in self.router.attempts():
+            try:
+                with get_client().stream(endpoint.url, endpoint.headers(headers), body) as response:
+                    response.raise_for_status()
+                    data = json.loads(b"".join(response.iter_chunks()))
+                content = data["choices"][0]["message"]["content"].strip()
+            except Exception as e:
+                # 非流式请求没有首字时间，只报告成败；4xx（429除外）换端点也一样，直接失败
+                fault = endpoint_fault(e)
+                self.router.report(endpoint, None, error=True if fault else None)
+                if not fault:
+                    raise
+                last_error = e
+                continue
+            self.router.report(endpoint, None, error=False)
+            return content
+        raise last_error or NoUpstreamAvailable("所有上游端点都暂时不可用（熔断中）")
+
+    def stats(self) -> Dict:
+        """压缩统计（tokens_saved 为每轮请求少发送的token数，单个会话的累计值记录在其摘要中）"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["running"] = len(self._running)
+        stats["tokens_saved_per_session"] = (
+            stats["tokens_saved"] // stats["sessions_compacted"] if stats["sessions_compacted"] else 0)
+        return stats
@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import HEDGES
+
+
+# ==================== 对冲请求配置 ====================
+class HedgeConfig:
+    """对冲请求 - 首字迟迟不到时向另一个（或同一个）端点再发一次相同请求，先出字的一方获胜"""
+    ENABLED = os.environ.get("JAVX_HEDGE", "0") == "1"                       # 默认关闭
+    PERCENTILE = float(os.environ.get("JAVX_HEDGE_PERCENTILE", "95"))        # 延迟取最近首字时间的第几百分位
+    MIN_DELAY = float(os.environ.get("JAVX_HEDGE_MIN_DELAY", "0.3"))         # 延迟下限（秒）
+    INITIAL_DELAY = float(os.environ.get("JAVX_HEDGE_INITIAL_DELAY", "2"))   # 样本不足时使用的延迟（秒）
+    BUDGET = float(os.environ.get("JAVX_HEDGE_BUDGET", "0.1"))               # 对冲请求最多占原请求的比例
+    BURST = 5.0                                                              # 预算最多累积的对冲次数
+    MIN_SAMPLES = 20
+    WINDOW = 512                                                             # 保留的首字时间样本数
+
+
+class HedgePolicy:
+    """记录最近的首字时间，给出对冲延迟；按预算（每个原请求积累 BUDGET 次）限制额外请求"""
+
+    def __init__(self, config=HedgeConfig):
+        self.config = config
+        self._samples = deque(maxlen=config.WINDOW)
+        self._sorted: Optional[List[float]] = None
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "fired": 0, "won": 0, "over_budget": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.ENABLED
+
+    def observe(self, ttft: float):
+        """记录一次首字时间（每个产出内容的尝试各自从发出请求开始计时）"""
+        with self._lock:
+            self._samples.append(ttft)
+            self._sorted = None
+
+    def delay(self) -> float:
+        """等待首字多久之后发出对冲请求"""
+        with self._lock:
+            if len(self._samples) < self.config.MIN_SAMPLES:
+                return max(self.config.MIN_DELAY, self.config.INITIAL_DELAY)
+            if self._sorted is None:
+                self._sorted = sorted(self._samples)
+            index = min(len(self._sorted) - 1, int(len(self._sorted) * self.config.PERCENTILE / 100))
+            return max(self.config.MIN_DELAY, self._sorted[index])
+
+    def request(self):
+        """一个可能被对冲的原请求开始，积累预算"""
+        with self._lock:
+            self._stats["requests"] += 1
+            self._tokens = min(self.config.BURST, self._tokens + self.config.BUDGET)
+
+    def try_fire(self) -> bool:
+        """预算允许时记一次对冲并返回 True"""
+        with self._lock:
+            if self._tokens < 1:
+                self._stats["over_budget"] += 1
+                result = "over_budget"
+            else:
+                self._tokens -= 1
+                self._stats["fired"] += 1
+                result = "fired"
+        HEDGES.inc(result)
+        return result == "fired"
+
+    def won(self):
+        """对冲请求先于原请求产出内容"""
+        with self._lock:
+            self._stats["won"] += 1
+        HEDGES.inc("won")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["enabled"] = self.enabled
+        stats["delay_s"] = round(self.delay(), 3)
+        return stats
+
+
+class Race:
+    """同一请求的原请求和对冲请求 - 第一个认领的尝试获胜，认领时立即取消其余尝试"""
+
+    def __init__(self):
+        self.winner: Optional[str] = None
+        self._cancels: List[Tuple[str, Callable[[], None]]] = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, attempt: str, cancel: Callable[[], None]):
+        """登记取消某个尝试的方法（关闭响应或取消任务）；已经输了的话立即调用"""
+        with self._lock:
+            self._cancels.append((attempt, cancel))
+            lost = self.winner is not None and self.winner != attempt
+        if lost:
+            self._call(cancel)
+
+    def claim(self, attempt: str) -> bool:
+        """尝试产出了第一段内容（或正常结束）时调用，返回是否由它继续"""
+        with self._lock:
+            if self.winner is not None:
+                return self.winner == attempt
+            self.winner = attempt
+            losers = [cancel for other, cancel in self._cancels if other != attempt]
+        for cancel in losers:
+            self._call(cancel)
+        return True
+
+    def lost(self, attempt: str) -> bool:
+        return self.winner is not None and self.winner != attempt
+
+    @staticmethod
+    def _call(cancel: Callable[[], None]):
+        try:
+            cancel()
+        except Exception:
+            pass
+
+
+hedging = HedgePolicy()
@@ -0,0 +1,226 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from token_budget import estimate_tokens
+
+
+# ==================== 指标配置 ====================
+class MetricsConfig:
+    """直方图分桶（秒 / 每秒数量）"""
+    TTFT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16)
+    DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+    RATE_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320)
+    UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """Prometheus指标的基类 - 按标签值元组保存样本，render() 输出文本格式"""
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: Dict[Tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                    for key, value in sorted(self._values.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        if not labels:
+            self._values[()] = 0
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]  # [各桶计数, 总和, 样本数]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = Registry()
+STREAM_LABELS = ("thinking_mode", "style")
+
+STREAM_TTFT = registry.register(Histogram(
+    "javx_stream_ttft_seconds", "请求开始到第一段回复发出的时间", STREAM_LABELS, MetricsConfig.TTFT_BUCKETS))
+STREAM_DURATION = registry.register(Histogram(
+    "javx_stream_duration_seconds", "整个流式回复的持续时间", STREAM_LABELS, MetricsConfig.DURATION_BUCKETS))
+STREAM_CHUNK_RATE = registry.register(Histogram(
+    "javx_stream_chunks_per_second", "每个流发给客户端的帧速率", STREAM_LABELS, MetricsConfig.RATE_BUCKETS))
+STREAM_TOKEN_RATE = registry.register(Histogram(
+    "javx_stream_tokens_per_second", "首字之后的生成速度（有上游用量时按用量，否则按估算）", STREAM_LABELS,
+    MetricsConfig.RATE_BUCKETS))
+STREAMS = registry.register(Counter(
+    "javx_streams_total", "按结果统计的流数量（completed/cache/truncated/cancelled/error）", STREAM_LABELS + ("outcome",)))
+ACTIVE_STREAMS = registry.register(Gauge("javx_active_streams", "当前进行中的流"))
+UPSTREAM_LATENCY = registry.register(Histogram(
+    "javx_upstream_response_seconds", "向上游发起请求到收到响应头的时间", (), MetricsConfig.UPSTREAM_BUCKETS))
+UPSTREAM_RESPONSES = registry.register(Counter(
+    "javx_upstream_responses_total", "上游HTTP状态码分布（连接失败记为error）", ("status",)))
+
+HEDGES = registry.register(Counter(
+    "javx_hedged_requests_total", "对冲请求（fired: 已发出，won: 先于原请求出字，over_budget: 超出预算未发出）", ("result",)))
+
+BATCH_ITEMS = registry.register(Counter(
+    "javx_batch_items_total", "批量任务按结果统计（completed/truncated/error）", ("outcome",)))
+
+TOKENS_SAVED = registry.register(Counter(
+    "javx_cancelled_tokens_saved_total", "客户端全部断开后提前取消上游生成省下的token（按已完成回复的平均长度估算）"))
+
+
+class ReplyLengths:
+    """已完成回复的平均token数 - 用来估算提前取消上游生成省下了多少token"""
+
+    def __init__(self):
+        self.replies = 0
+        self.tokens = 0
+        self.cancelled = 0
+        self.saved = 0
+        self._lock = threading.Lock()
+
+    def observe(self, tokens: int):
+        with self._lock:
+            self.replies += 1
+            self.tokens += tokens
+
+    def cancel(self, generated: int) -> int:
+        """一次生成在 generated 个token后被取消，返回估算省下的token数（还没有完成的回复时按0计）"""
+        with self._lock:
+            average = self.tokens // self.replies if self.replies else 0
+            saved = max(0, average - generated)
+            self.cancelled += 1
+            self.saved += saved
+        if saved:
+            TOKENS_SAVED.inc(amount=saved)
+        return saved
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"cancelled": self.cancelled, "tokens_saved": self.saved,
+                    "average_reply_tokens": self.tokens // self.replies if self.replies else None}
+
+
+reply_lengths = ReplyLengths()
+
+
+def reply_tokens(usage: Optional[Dict], text: str) -> int:
+    """回复的token数：优先使用上游返回的用量，否则离线估算"""
+    return (usage or {}).get("completion_tokens") or estimate_tokens(text)
+
+
+def observe_upstream(status, latency: float):
+    UPSTREAM_LATENCY.observe(latency)
+    UPSTREAM_RESPONSES.inc(str(status))
+
+
+class StreamMetrics:
+    """一个流式请求的计时 - chunk() 在每段回复发出时调用，finish() 在流结束（含断开、出错）时调用一次"""
+    __slots__ = ("labels", "start", "first", "chunks")
+
+    def __init__(self, thinking_mode: str, style: str):
+        self.labels = (thinking_mode, style)
+        self.start = time.perf_counter()
+        self.first: Optional[float] = None
+        self.chunks = 0
+        ACTIVE_STREAMS.inc()
+
+    def chunk(self):
+        if self.first is None:
+            self.first = time.perf_counter()
+            STREAM_TTFT.observe(self.first - self.start, *self.labels)
+        self.chunks += 1
+
+    def finish(self, outcome: str, tokens: Optional[int] = None):
+        end = time.perf_counter()
+        duration = end - self.start
+        ACTIVE_STREAMS.dec()
+        STREAMS.inc(*self.labels, outcome)
+        if outcome == "completed" and tokens:
+            reply_lengths.observe(tokens)
+        STREAM_DURATION.observe(duration, *self.labels)
+        if self.chunks and duration > 0:
+            STREAM_CHUNK_RATE.observe(self.chunks / duration, *self.labels)
+        if tokens and self.first is not None and end > self.first:
+            STREAM_TOKEN_RATE.observe(tokens / (end - self.first), *self.labels)
@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+
+# ==================== 回复缓存配置 ====================
+class CacheConfig:
+    """回复缓存配置（默认关闭，JAVX_RESPONSE_CACHE=1 开启）"""
+    ENABLED = os.environ.get("JAVX_RESPONSE_CACHE", "0") == "1"
+    MAX_ENTRIES = int(os.environ.get("JAVX_RESPONSE_CACHE_SIZE", "2048"))
+    MAX_BYTES = int(os.environ.get("JAVX_RESPONSE_CACHE_BYTES", str(32 * 1024 * 1024)))
+    TTL = float(os.environ.get("JAVX_RESPONSE_CACHE_TTL", "3600"))             # 缓存条目有效期（秒）
+    REPLAY_CPS = float(os.environ.get("JAVX_RESPONSE_CACHE_CPS", "300"))       # 回放速度（字符/秒，0为不限速）
+    REPLAY_CHUNK = 6                                                          # 每次回放的字符数
+
+
+def cache_key(prompt_variant: tuple, context: List[Dict], message: str, temperature: float, max_tokens: int) -> str:
+    """由（提示词变体, 最近上下文, 规范化后的消息, 采样参数）计算缓存键"""
+    normalized = " ".join(message.split())
+    payload = json.dumps([list(prompt_variant), [[m["role"], m["content"]] for m in context],
+                          normalized, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """完整回复的缓存 - 按条数/字节数做LRU淘汰，条目超过TTL失效；命中后按固定速率以流的形式回放"""
+
+    def __init__(self, enabled: bool = CacheConfig.ENABLED, max_entries: int = CacheConfig.MAX_ENTRIES,
+                 max_bytes: int = CacheConfig.MAX_BYTES, ttl: float = CacheConfig.TTL,
+                 replay_cps: float = CacheConfig.REPLAY_CPS):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.replay_cps = replay_cps
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (回复文本, 字节数, 写入时间)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bytes_served": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[2] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            self._stats["bytes_served"] += entry[1]
+            return entry[0]
+
+    def put(self, key: str, reply: str):
+        """缓存一个完整生成的回复"""
+        if not self.enabled or not reply:
+            return
+        size = len(reply.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (reply, size, time.monotonic())
+            self._bytes += size
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        self._bytes -= self._entries.pop(key)[1]
+
+    def _chunks(self, reply: str) -> Iterator[str]:
+        step = CacheConfig.REPLAY_CHUNK
+        for i in range(0, len(reply), step):
+            yield reply[i:i + step]
+
+    def replay(self, reply: str) -> Iterator[str]:
+        """以流的形式回放缓存的回复（同步生成器）"""
+        delay = CacheConfig.REPLAY_CHUNK / self.replay_cps if self.replay_cps > 0 else 0
+        for chunk in self._chunks(reply):
+            yield chunk
+            if delay:
+                time.sleep(delay)
+
+    async def areplay(self, reply: str) -> AsyncIterator[str]:
+        """以流的形式回放缓存的回复（异步生成器）"""
+        delay = CacheConfig.REPLAY_CHUNK / self.replay_cps if self.replay_cps > 0 else 0
+        for chunk in self._chunks(reply):
+            yield chunk
+            if delay:
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(enabled=self.enabled, entries=len(self._entries), bytes=self._bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
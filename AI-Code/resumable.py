@@ -0,0 +1,140 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from singleflight import Flight
+
+
+# ==================== 可续传的流 ====================
+class ResumeConfig:
+    """断线续传配置 - 每次生成按流ID保留在内存中，重连时带 Last-Event-ID 从断开的位置继续"""
+    GRACE = float(os.environ.get("JAVX_RESUME_GRACE", "10"))                          # 客户端全部断开后继续生成多久等待重连（秒，0为立即取消）
+    TTL = float(os.environ.get("JAVX_RESUME_TTL", "300"))                             # 没有客户端的流保留多久（秒）
+    MAX_BYTES = int(os.environ.get("JAVX_RESUME_MAX_BYTES", str(32 * 1024 * 1024)))   # 所有保留的回复文本的字节上限
+
+
+class ResumableStream:
+    """一次生成对应的流：所属会话和提问、已发给客户端的位置，以及这一轮对话是否已经保存"""
+    __slots__ = ("id", "flight", "session_id", "message", "thinking_mode", "attached", "delivered", "saved",
+                 "last_active")
+
+    def __init__(self, stream_id: str, flight: Flight, session_id: str, message: str, thinking_mode: str):
+        self.id = stream_id
+        self.flight = flight
+        self.session_id = session_id
+        self.message = message
+        self.thinking_mode = thinking_mode
+        self.attached = 1              # 正在读取这个流的客户端数（原始请求 + 续传请求）
+        self.delivered = 0             # 已经发给客户端的回复字符数
+        self.saved = False
+        self.last_active = time.monotonic()
+
+
+def parse_event_id(value: str) -> Optional[Tuple[str, int]]:
+    """解析 Last-Event-ID（格式为 流ID:字符偏移），格式不对时返回 None"""
+    stream_id, _, offset = (value or "").strip().rpartition(":")
+    if not stream_id or not offset.isdigit():
+        return None
+    return stream_id, int(offset)
+
+
+class StreamRegistry:
+    """按流ID保存进行中和已完成的生成 - 空闲TTL和总字节上限，超限时先淘汰最久没有客户端的流"""
+
+    def __init__(self, ttl: float = ResumeConfig.TTL, max_bytes: int = ResumeConfig.MAX_BYTES,
+                 grace: float = ResumeConfig.GRACE):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self._streams: "OrderedDict[str, ResumableStream]" = OrderedDict()  # 按最近活动排序
+        self._lock = threading.Lock()
+        self._swept = 0.0
+        self._stats = {"created": 0, "resumed": 0, "expired": 0, "evicted": 0, "missed": 0}
+
+    @staticmethod
+    def new_id() -> str:
+        return secrets.token_urlsafe(12)
+
+    def register(self, stream_id: str, flight: Flight, session_id: str, message: str,
+                 thinking_mode: str) -> ResumableStream:
+        stream = ResumableStream(stream_id, flight, session_id, message, thinking_mode)
+        with self._lock:
+            self._streams[stream_id] = stream
+            self._stats["created"] += 1
+            self._sweep(time.monotonic())
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ResumableStream]:
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def resume(self, stream_id: str) -> Optional[ResumableStream]:
+        """续传请求附着到已有的流上，流已过期或被淘汰时返回 None"""
+        with self._lock:
+            stream = self._streams.get(stream_id)
+            if stream is None:
+                self._stats["missed"] += 1
+                return None
+            stream.attached += 1
+            stream.last_active = time.monotonic()
+            self._streams.move_to_end(stream_id)
+            self._stats["resumed"] += 1
+            return stream
+
+    def detach(self, stream: ResumableStream, delivered: int) -> bool:
+        """一个客户端离开，返回是否已经没有客户端在读这个流"""
+        with self._lock:
+            stream.attached -= 1
+            stream.delivered = max(stream.delivered, delivered)
+            stream.last_active = time.monotonic()
+            if stream.id in self._streams:
+                self._streams.move_to_end(stream.id)
+            return stream.attached == 0
+
+    def claim_save(self, stream: ResumableStream) -> bool:
+        """这一轮对话只保存一次：第一个调用者返回 True"""
+        with self._lock:
+            if stream.saved:
+                return False
+            stream.saved = True
+            return True
+
+    def is_abandoned(self, stream: ResumableStream) -> bool:
+        """宽限期结束时检查：是否仍然没有客户端重连"""
+        with self._lock:
+            return stream.attached == 0
+
+    def _sweep(self, now: float):
+        # 调用方持有锁：清理空闲超时的流，再按总字节上限从最久不活动的流开始淘汰（每秒最多一次）
+        if now - self._swept < 1.0:
+            return
+        self._swept = now
+        for stream_id, stream in list(self._streams.items()):
+            if now - stream.last_active <= self.ttl:
+                break
+            if stream.attached == 0:
+                del self._streams[stream_id]
+                self._stats["expired"] += 1
+        total = self._total_bytes()
+        for stream_id, stream in list(self._streams.items()):
+            if total <= self.max_bytes:
+                break
+            if stream.attached == 0:
+                del self._streams[stream_id]
+                total -= stream.flight.nbytes
+                self._stats["evicted"] += 1
+
+    def _total_bytes(self) -> int:
+        return sum(stream.flight.nbytes for stream in self._streams.values())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["streams"] = len(self._streams)
+            stats["attached"] = sum(stream.attached for stream in self._streams.values())
+            stats["bytes"] = self._total_bytes()
+        stats["grace_s"] = self.grace
+        return stats
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from upstream import POOL_TIMEOUTS, get_client
+
+
+# ==================== 路由配置 ====================
+class RouterConfig:
+    """多上游端点路由配置"""
+    EWMA_ALPHA = 0.2                                                          # 首字时间/错误率的指数加权系数
+    INITIAL_TTFT = 1.0                                                        # 还没有样本时假定的首字时间（秒）
+    ERROR_PENALTY = 4.0                                                       # 得分 = 首字时间 × (1 + 系数 × 错误率)
+    FAILURE_THRESHOLD = int(os.environ.get("JAVX_CIRCUIT_FAILURES", "5"))     # 连续失败多少次后熔断
+    OPEN_SECONDS = float(os.environ.get("JAVX_CIRCUIT_OPEN", "30"))           # 熔断多久后放行一次试探请求
+    MAX_ATTEMPTS = int(os.environ.get("JAVX_ROUTE_ATTEMPTS", "3"))            # 首字节之前最多尝试的端点数
+    HEALTH_INTERVAL = float(os.environ.get("JAVX_HEALTH_INTERVAL", "30"))     # 健康检查间隔（秒，0为关闭）
+    HEALTH_TIMEOUT = (3.0, 5.0)
+
+
+COMPLETIONS_PATH = "/chat/completions"
+
+
+class NoUpstreamAvailable(Exception):
+    """所有上游端点都处于熔断状态"""
+
+
+def endpoint_fault(error: BaseException) -> bool:
+    """一次失败是否算端点的问题：连接失败、超时、5xx 和 429 算（计入熔断并切换到下一个端点）；
+    其他 4xx（密钥无效、参数错误等）是请求本身的问题，换端点也一样，不计失败也不切换，直接把错误交给用户；
+    本地连接池等待超时也不算：所有端点共用同一个连接池，切换过去只会在同一个满载的池上再等一次"""
+    if isinstance(error, POOL_TIMEOUTS):
+        return False
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if not isinstance(status, int):
+        return True
+    return status >= 500 or status == 429
+
+
+class Endpoint:
+    """一个 OpenAI 兼容的上游端点及其运行状态"""
+
+    def __init__(self, url: str, name: str = "", api_key: str = "", models: Sequence[str] = ()):
+        url = url.rstrip("/")
+        # 同时接受基础地址（.../v1）和完整的补全地址
+        self.url = url if url.endswith(COMPLETIONS_PATH) else url + COMPLETIONS_PATH
+        self.name = name or self.url
+        self.api_key = api_key
+        self.models = list(models)
+        self.ewma_ttft = RouterConfig.INITIAL_TTFT
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.state = "closed"           # closed: 正常；open: 熔断；half_open: 正在放行一次试探请求
+        self.opened_at = 0.0
+        self.healthy = True
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def health_url(self) -> str:
+        return self.url[:-len(COMPLETIONS_PATH)] + "/models"
+
+    def headers(self, headers: Dict[str, str]) -> Dict[str, str]:
+        """使用端点自己的密钥（如果配置了）"""
+        if not self.api_key:
+            return headers
+        return dict(headers, Authorization=f"Bearer {self.api_key}")
+
+    def score(self) -> float:
+        return self.ewma_ttft * (1 + RouterConfig.ERROR_PENALTY * self.error_rate) * (1 + 0.1 * self.in_flight)
+
+
+class Router:
+    """按延迟选择上游 - 每个端点维护首字时间和错误率的EWMA，连续失败时熔断，首字节之前失败可切换到下一个端点"""
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("至少需要配置一个上游端点")
+        self.endpoints = endpoints
+        self._lock = threading.Lock()
+        self._health_pid = None
+
+    @classmethod
+    def from_servers(cls, servers: List[Dict], api_key: str = "") -> "Router":
+        """由 Config.API_SERVERS 格式的列表创建（每项可带自己的 api_key）"""
+        return cls([Endpoint(server["url"], server.get("name", ""), server.get("api_key", api_key),
+                             server.get("models", ())) for server in servers])
+
+    @classmethod
+    def from_env(cls, default_url: str, api_key: str = "") -> "Router":
+        """JAVX_API_URLS=地址1,地址2|密钥2,...；未设置时只使用 default_url"""
+        specs = [spec.strip() for spec in os.environ.get("JAVX_API_URLS", "").split(",") if spec.strip()]
+        endpoints = []
+        for spec in specs or [default_url]:
+            url, _, key = spec.partition("|")
+            endpoints.append(Endpoint(url, api_key=key or api_key))
+        return cls(endpoints)
+
+    def _available(self, endpoint: Endpoint, now: float) -> bool:
+        """只判断不改状态：熔断超过 OPEN_SECONDS 的端点可以放行一次试探请求；
+        试探请求超过 OPEN_SECONDS 还没有结果（例如被取消、没有报告）时可以再试探一次"""
+        if endpoint.state == "closed":
+            return True
+        return now - endpoint.opened_at >= RouterConfig.OPEN_SECONDS
+
+    def choose(self, exclude: Sequence[Endpoint] = ()) -> Optional[Endpoint]:
+        """选择得分最低（最快且最少出错）的可用端点；健康检查失败的端点只在没有其他选择时使用"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude and self._available(e, now)]
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda e: (not e.healthy, e.score()))
+            if endpoint.state != "closed":
+                # 只有真正选中的端点进入试探状态，opened_at 记为试探开始的时间
+                endpoint.state = "half_open"
+                endpoint.opened_at = now
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def attempts(self) -> Iterator[Endpoint]:
+        """依次给出最多 MAX_ATTEMPTS 个不同的端点，调用方在首字节之前失败时取下一个"""
+        tried = []
+        for _ in range(min(RouterConfig.MAX_ATTEMPTS, len(self.endpoints))):
+            endpoint = self.choose(exclude=tried)
+            if endpoint is None:
+                return
+            tried.append(endpoint)
+            yield endpoint
+
+    def report(self, endpoint: Endpoint, ttft: Optional[float] = None, error: Optional[bool] = False):
+        """一次请求结束：更新首字时间/错误率EWMA和熔断状态（error=None 表示被主动取消，不计成败）"""
+        alpha = RouterConfig.EWMA_ALPHA
+        with self._lock:
+            endpoint.in_flight -= 1
+            if ttft is not None:
+                endpoint.ewma_ttft += alpha * (ttft - endpoint.ewma_ttft)
+            if error is None:
+                return
+            endpoint.error_rate += alpha * ((1.0 if error else 0.0) - endpoint.error_rate)
+            if not error:
+                endpoint.consecutive_failures = 0
+                endpoint.state = "closed"
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.state == "half_open" or endpoint.consecutive_failures >= RouterConfig.FAILURE_THRESHOLD:
+                endpoint.state = "open"
+                endpoint.opened_at = time.monotonic()
+
+    # ==================== 健康检查 ====================
+    def check_health(self):
+        """对每个端点请求一次 /models（OpenAI兼容接口），5xx和连接失败视为不健康"""
+        for endpoint in self.endpoints:
+            try:
+                status = get_client().status(endpoint.health_url, endpoint.headers({}), RouterConfig.HEALTH_TIMEOUT)
+                healthy = status < 500
+            except Exception:
+                healthy = False
+            with self._lock:
+                endpoint.healthy = healthy
+                if healthy:
+                    # 没有流量的端点靠健康检查慢慢恢复，否则一次失败后可能再也不会被选中
+                    endpoint.error_rate *= 1 - RouterConfig.EWMA_ALPHA
+
+    def _health_loop(self):
+        while True:
+            time.sleep(RouterConfig.HEALTH_INTERVAL)
+            self.check_health()
+
+    def start_health_checks(self):
+        """在后台线程中定期健康检查（每个进程一个；只有一个端点时没有可切换的对象，不启动）"""
+        if len(self.endpoints) < 2 or RouterConfig.HEALTH_INTERVAL <= 0 or self._health_pid == os.getpid():
+            return
+        self._health_pid = os.getpid()
+        threading.Thread(target=self._health_loop, name="upstream-health", daemon=True).start()
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [{
+                "name": e.name, "url": e.url, "state": e.state, "healthy": e.healthy,
+                "ewma_ttft_s": round(e.ewma_ttft, 3), "error_rate": round(e.error_rate, 3),
+                "in_flight": e.in_flight, "requests": e.requests, "failures": e.failures
+            } for e in self.endpoints]
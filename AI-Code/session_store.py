@@ -0,0 +1,524 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+from tracing import logger
+
+
+# ==================== 会话存储配置 ====================
+class StoreConfig:
+    """会话存储配置（均可通过环境变量覆盖）"""
+    HISTORY_SIZE = int(os.environ.get("JAVX_HISTORY_SIZE", "64"))                    # 每个会话保留的消息条数（实际发送量由token预算决定）
+    MAX_SESSIONS = int(os.environ.get("JAVX_MAX_SESSIONS", "10000"))                 # 最多同时保留的会话数
+    IDLE_TTL = float(os.environ.get("JAVX_SESSION_TTL", "3600"))                     # 会话空闲多久后过期（秒）
+    MAX_BYTES = int(os.environ.get("JAVX_SESSION_MAX_BYTES", str(64 * 1024 * 1024)))  # 全部消息文本的字节上限
+    BACKEND = os.environ.get("JAVX_SESSION_BACKEND", "memory")                       # memory | sqlite
+    DB_PATH = os.environ.get("JAVX_SESSION_DB", "javxseek_sessions.db")              # sqlite 后端的数据库文件
+    FLUSH_INTERVAL = float(os.environ.get("JAVX_SESSION_FLUSH", "0.05"))             # 批量写入的最长间隔（秒）
+    FLUSH_BATCH = 256                                                                # 攒够多少条消息立即写入
+    CACHE_SESSIONS = 1024                                                            # 每个进程缓存的会话数
+    CACHE_TTL = float(os.environ.get("JAVX_SESSION_CACHE_TTL", "1.0"))              # 缓存免校验的时间（秒）
+    SWEEP_INTERVAL = 30.0                                                            # 过期/超限清理的间隔（秒）
+
+
+# 未完成的回复（客户端断开、上游中途结束）保存时追加的标记；消息原样发给上游，标记写在正文里模型也能看到
+TRUNCATED_MARK = "\n\n[回复未完成：连接已中断]"
+
+
+def message_size(message: Dict) -> int:
+    """消息占用的字节数（按UTF-8编码的正文计算）"""
+    return len(message["content"].encode('utf-8'))
+
+
+class SessionHistory:
+    """单个会话的历史记录 - 固定容量的环形缓冲，写满后自动挤掉最旧的消息"""
+
+    __slots__ = ("messages", "bytes", "last_access", "summary")
+
+    def __init__(self, capacity: int):
+        self.messages = deque(maxlen=capacity)
+        self.bytes = 0
+        self.last_access = time.monotonic()
+        self.summary = None  # 被压缩掉的早期对话的滚动摘要
+
+    def append(self, message: Dict) -> int:
+        """追加一条消息，返回会话字节数的变化量"""
+        delta = message_size(message)
+        if len(self.messages) == self.messages.maxlen:
+            delta -= message_size(self.messages[0])
+        self.messages.append(message)
+        self.bytes += delta
+        return delta
+
+
+class BaseSessionStore:
+    """会话存储接口 - 所有后端都实现 history / append / clear / stats"""
+
+    def history(self, session_id: str) -> List[Dict]:
+        """获取会话最近的消息（由旧到新）"""
+        raise NotImplementedError
+
+    def append(self, session_id: str, *messages: Dict):
+        raise NotImplementedError
+
+    def summary(self, session_id: str) -> Optional[Dict]:
+        """获取会话的滚动摘要 {"content", "tokens_saved"}，没有时返回None"""
+        raise NotImplementedError
+
+    def compact(self, session_id: str, folded: List[Dict], summary: Dict) -> bool:
+        """若会话历史仍以 folded 开头，则删除这些消息并写入新摘要（期间有改动则放弃，返回False）"""
+        raise NotImplementedError
+
+    def clear(self, session_id: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+    def append_turn(self, session_id: str, message: str, reply: str, truncated: bool = False):
+        """保存一轮对话；truncated 表示回复没有生成完，正文末尾加上 TRUNCATED_MARK"""
+        if truncated:
+            reply += TRUNCATED_MARK
+        self.append(session_id, {"role": "user", "content": message}, {"role": "assistant", "content": reply})
+
+
+class SessionStore(BaseSessionStore):
+    """进程内有界会话存储 - LRU + 空闲TTL淘汰，并限制全部消息文本的总字节数"""
+
+    def __init__(self, history_size: int = StoreConfig.HISTORY_SIZE, max_sessions: int = StoreConfig.MAX_SESSIONS,
+                 idle_ttl: float = StoreConfig.IDLE_TTL, max_bytes: int = StoreConfig.MAX_BYTES):
+        self.history_size = history_size
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, SessionHistory]" = OrderedDict()  # 按最近访问排序，队首最久未用
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._evictions = {"lru": 0, "ttl": 0, "memory": 0}
+
+    def _drop(self, session_id: str, reason: str):
+        history = self._sessions.pop(session_id)
+        self._bytes -= history.bytes
+        self._evictions[reason] += 1
+
+    def _expire(self, now: float):
+        # 访问顺序就是空闲顺序，从队首开始清理直到遇到未过期的会话
+        while self._sessions:
+            session_id, history = next(iter(self._sessions.items()))
+            if now - history.last_access <= self.idle_ttl:
+                break
+            self._drop(session_id, "ttl")
+
+    def _touch(self, session_id: str, now: float) -> Optional[SessionHistory]:
+        history = self._sessions.get(session_id)
+        if history is not None:
+            history.last_access = now
+            self._sessions.move_to_end(session_id)
+        return history
+
+    def history(self, session_id: str) -> List[Dict]:
+        """获取会话最近的消息（由旧到新）"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            history = self._touch(session_id, now)
+            return list(history.messages) if history is not None else []
+
+    def append(self, session_id: str, *messages: Dict):
+        """向会话追加消息，必要时按LRU/TTL/内存上限淘汰其他会话"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            history = self._touch(session_id, now)
+            if history is None:
+                history = self._sessions[session_id] = SessionHistory(self.history_size)
+            for message in messages:
+                self._bytes += history.append(message)
+
+            while len(self._sessions) > self.max_sessions:
+                self._drop(next(iter(self._sessions)), "lru")
+            # 超出内存上限时淘汰最久未用的会话，但不淘汰刚写入的这个
+            while self._bytes > self.max_bytes and len(self._sessions) > 1:
+                self._drop(next(iter(self._sessions)), "memory")
+
+    def summary(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            history = self._sessions.get(session_id)
+            return history.summary if history is not None else None
+
+    def compact(self, session_id: str, folded: List[Dict], summary: Dict) -> bool:
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None or len(history.messages) < len(folded):
+                return False
+            if any(history.messages[i] != message for i, message in enumerate(folded)):
+                return False
+            delta = 0
+            for _ in folded:
+                delta -= message_size(history.messages.popleft())
+            if history.summary is not None:
+                delta -= message_size(history.summary)
+            delta += message_size(summary)
+            history.summary = summary
+            history.bytes += delta
+            self._bytes += delta
+            return True
+
+    def clear(self, session_id: str):
+        with self._lock:
+            if session_id in self._sessions:
+                self._bytes -= self._sessions.pop(session_id).bytes
+
+    def stats(self) -> Dict:
+        """会话存储状态"""
+        with self._lock:
+            return {
+                "backend": "memory",
+                "live_sessions": len(self._sessions),
+                "total_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": dict(self._evictions)
+            }
+
+
+# ==================== 共享存储（SQLite WAL） ====================
+class SQLiteSessionStore(BaseSessionStore):
+    """多进程共享的会话存储 - 同一主机上的多个gunicorn工作进程（以及重启后的进程）看到同一份对话
+
+    写入先进入进程内队列，由后台线程按时间/数量攒批后在一个事务里提交；
+    读取走进程内的会话缓存，缓存过期后只用 MAX(id) 校验是否有其他进程写入，
+    因此共享存储不会在流式输出的过程中增加数据库往返。
+    """
+
+    def __init__(self, path: str = StoreConfig.DB_PATH, history_size: int = StoreConfig.HISTORY_SIZE,
+                 max_sessions: int = StoreConfig.MAX_SESSIONS, idle_ttl: float = StoreConfig.IDLE_TTL,
+                 max_bytes: int = StoreConfig.MAX_BYTES, flush_interval: float = StoreConfig.FLUSH_INTERVAL,
+                 cache_sessions: int = StoreConfig.CACHE_SESSIONS, cache_ttl: float = StoreConfig.CACHE_TTL):
+        self.path = path
+        self.history_size = history_size
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.cache_sessions = cache_sessions
+        self.cache_ttl = cache_ttl
+
+        self._lock = threading.Lock()             # 保护读连接、缓存和待写队列（只做内存操作和WAL读，不等待写锁）
+        self._wakeup = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()       # 串行化写连接上的事务（可能等待其他进程到 busy_timeout）
+        self._pending: List[tuple] = []           # (session_id, role, content, bytes, time)
+        self._writing: List[tuple] = []           # 正在写入的一批（已从 _pending 取出，还没有提交）
+        self._cache: "OrderedDict[str, list]" = OrderedDict()  # session_id -> [deque消息, (最小id, 最大id), 校验时间, 摘要]
+        self._counters = {"cache_hits": 0, "cache_misses": 0, "flushes": 0, "rows_written": 0}
+        self._evictions = {"lru": 0, "ttl": 0, "memory": 0}
+        self._pid = None
+        self._conn = None
+        self._writer = None
+        self._last_sweep = 0.0
+
+    # ---------- 连接与后台线程 ----------
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def _ensure(self):
+        """按进程懒加载连接和刷盘线程（fork出来的工作进程各自重建）"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._pending = []
+        self._writing = []
+        self._cache.clear()
+        self._write_lock = threading.Lock()
+        writer = self._connect()
+        writer.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                bytes INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_access ON sessions (last_access);
+            CREATE TABLE IF NOT EXISTS summaries (
+                session_id TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                tokens_saved INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            );
+        """)
+        # 读和写各用一个连接：WAL模式下读不等待写，写事务等待其他进程时不占用 _lock
+        self._writer = writer
+        self._conn = self._connect()
+        threading.Thread(target=self._flush_loop, name="session-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            with self._lock:
+                self._wakeup.wait(self.flush_interval)
+            # 任何异常都不能结束这个线程，否则之后的消息只会堆在内存里不再落盘（下一轮重试）
+            try:
+                self._flush()
+                if time.monotonic() - self._last_sweep > StoreConfig.SWEEP_INTERVAL:
+                    self._sweep()
+            except Exception as e:
+                logger.warning("会话写入失败，稍后重试: %s", e)
+
+    def _flush(self):
+        with self._write_lock:
+            self._write_pending()
+
+    def _write_pending(self):
+        """把待写队列在一个事务里提交（调用方持有 _write_lock）；事务在 _lock 之外执行，
+        其他进程正在写入时最多等到 busy_timeout，期间本进程的读写不受影响"""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._writing = batch
+        if not batch:
+            return
+        writer = self._writer
+        touched = {}
+        try:
+            writer.execute("BEGIN IMMEDIATE")
+            for session_id, role, content, size, now in batch:
+                cursor = writer.execute(
+                    "INSERT INTO messages (session_id, role, content, bytes) VALUES (?, ?, ?, ?)",
+                    (session_id, role, content, size))
+                touched[session_id] = (cursor.lastrowid, now)
+            for session_id, (last_id, now) in touched.items():
+                writer.execute(
+                    "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+                    (session_id, now))
+                # 只保留最近 history_size 条
+                writer.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND id <= "
+                    "(SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (session_id, session_id, self.history_size))
+            writer.execute("COMMIT")
+        except sqlite3.Error:
+            # BEGIN 本身失败（数据库被其他进程锁住）时没有打开的事务，不能 ROLLBACK
+            if writer.in_transaction:
+                writer.execute("ROLLBACK")
+            with self._lock:
+                self._pending = batch + self._pending
+                self._writing = []
+            return
+        with self._lock:
+            self._writing = []
+            self._counters["flushes"] += 1
+            self._counters["rows_written"] += len(batch)
+            for session_id, (last_id, _) in touched.items():
+                entry = self._cache.get(session_id)
+                if entry is not None:
+                    # 新写入后最旧的消息可能已被裁掉，最小id下次校验时再取
+                    entry[1] = (None, last_id)
+
+    def _sweep(self):
+        """按空闲TTL、会话数上限和字节上限清理（多个进程同时清理也是安全的）"""
+        self._last_sweep = time.monotonic()
+        with self._write_lock:
+            writer = self._writer
+            memory = []
+            try:
+                writer.execute("BEGIN IMMEDIATE")
+                expired = [row[0] for row in writer.execute(
+                    "SELECT session_id FROM sessions WHERE last_access < ?", (time.time() - self.idle_ttl,))]
+                over = writer.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - len(expired) - self.max_sessions
+                lru = [row[0] for row in writer.execute(
+                    "SELECT session_id FROM sessions WHERE last_access >= ? ORDER BY last_access LIMIT ?",
+                    (time.time() - self.idle_ttl, max(0, over)))]
+                for session_id in expired + lru:
+                    self._delete_rows(session_id)
+
+                total = self._total_bytes(writer)
+                if total > self.max_bytes:
+                    for session_id, in list(writer.execute("SELECT session_id FROM sessions ORDER BY last_access")):
+                        if total <= self.max_bytes:
+                            break
+                        total -= writer.execute(
+                            "SELECT (SELECT COALESCE(SUM(bytes), 0) FROM messages WHERE session_id = ?) + "
+                            "(SELECT COALESCE(SUM(bytes), 0) FROM summaries WHERE session_id = ?)",
+                            (session_id, session_id)).fetchone()[0]
+                        self._delete_rows(session_id)
+                        memory.append(session_id)
+                writer.execute("COMMIT")
+            except sqlite3.Error:
+                if writer.in_transaction:
+                    writer.execute("ROLLBACK")
+                return
+        with self._lock:
+            for session_id in expired + lru + memory:
+                self._cache.pop(session_id, None)
+            self._evictions["ttl"] += len(expired)
+            self._evictions["lru"] += len(lru)
+            self._evictions["memory"] += len(memory)
+
+    @staticmethod
+    def _total_bytes(conn: sqlite3.Connection) -> int:
+        return conn.execute(
+            "SELECT (SELECT COALESCE(SUM(bytes), 0) FROM messages) + (SELECT COALESCE(SUM(bytes), 0) FROM summaries)"
+        ).fetchone()[0]
+
+    def _delete_rows(self, session_id: str):
+        """删除一个会话的所有行（调用方持有 _write_lock）"""
+        self._writer.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        self._writer.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+        self._writer.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    # ---------- 读写接口 ----------
+    def _unwritten_locked(self, session_id: str) -> bool:
+        return any(p[0] == session_id for p in self._pending) or any(p[0] == session_id for p in self._writing)
+
+    def _entry_locked(self, session_id: str, flushed: bool = False) -> Optional[list]:
+        """取会话缓存；缓存过期后用一次 MIN/MAX(id) 查询校验其他进程是否写入或压缩过。
+        需要从数据库重建缓存而这个会话还有没写入的消息时返回 None，由调用方在 _lock 之外先写入"""
+        now = time.monotonic()
+        entry = self._cache.get(session_id)
+        if entry is not None:
+            self._cache.move_to_end(session_id)
+            if now - entry[2] < self.cache_ttl:
+                self._counters["cache_hits"] += 1
+                return entry
+            bounds = self._conn.execute(
+                "SELECT MIN(id), MAX(id) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+            known_min, known_max = entry[1]
+            if (bounds[1] == known_max and known_min in (None, bounds[0])) or self._unwritten_locked(session_id):
+                entry[1] = bounds if bounds[1] == known_max else entry[1]
+                entry[2] = now
+                self._counters["cache_hits"] += 1
+                return entry
+
+        if not flushed and self._unwritten_locked(session_id):
+            return None  # 未落盘的消息也要出现在新建的缓存里
+        self._counters["cache_misses"] += 1
+        rows = self._conn.execute(
+            "SELECT id, role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.history_size)).fetchall()
+        messages = deque(({"role": role, "content": content} for _, role, content in reversed(rows)),
+                         maxlen=self.history_size)
+        row = self._conn.execute(
+            "SELECT content, tokens_saved FROM summaries WHERE session_id = ?", (session_id,)).fetchone()
+        summary = {"content": row[0], "tokens_saved": row[1]} if row else None
+        bounds = (rows[-1][0], rows[0][0]) if rows else (None, None)
+        entry = self._cache[session_id] = [messages, bounds, now, summary]
+        while len(self._cache) > self.cache_sessions:
+            self._cache.popitem(last=False)
+        return entry
+
+    def _entry(self, session_id: str) -> list:
+        with self._lock:
+            self._ensure()
+            entry = self._entry_locked(session_id)
+            if entry is not None:
+                return entry
+        # 只有这个会话的请求等待写入（写入失败时按数据库里已有的内容重建，和以前一样）
+        self._flush()
+        with self._lock:
+            return self._entry_locked(session_id, flushed=True)
+
+    def history(self, session_id: str) -> List[Dict]:
+        entry = self._entry(session_id)
+        with self._lock:
+            return list(entry[0])
+
+    def summary(self, session_id: str) -> Optional[Dict]:
+        return self._entry(session_id)[3]
+
+    def compact(self, session_id: str, folded: List[Dict], summary: Dict) -> bool:
+        with self._lock:
+            self._ensure()
+        with self._write_lock:
+            self._write_pending()
+            writer = self._writer
+            rows = writer.execute(
+                "SELECT id, role, content FROM messages WHERE session_id = ? ORDER BY id LIMIT ?",
+                (session_id, len(folded))).fetchall()
+            if len(rows) < len(folded) or any(
+                    (role, content) != (message["role"], message["content"])
+                    for (_, role, content), message in zip(rows, folded)):
+                return False
+            try:
+                writer.execute("BEGIN IMMEDIATE")
+                writer.execute("DELETE FROM messages WHERE session_id = ? AND id <= ?", (session_id, rows[-1][0]))
+                writer.execute(
+                    "INSERT INTO summaries (session_id, content, tokens_saved, bytes) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET content = excluded.content, "
+                    "tokens_saved = excluded.tokens_saved, bytes = excluded.bytes",
+                    (session_id, summary["content"], summary["tokens_saved"], message_size(summary)))
+                writer.execute("COMMIT")
+            except sqlite3.Error:
+                if writer.in_transaction:
+                    writer.execute("ROLLBACK")
+                return False
+        with self._lock:
+            self._cache.pop(session_id, None)
+        return True
+
+    def append(self, session_id: str, *messages: Dict):
+        with self._lock:
+            self._ensure()
+            now = time.time()
+            entry = self._cache.get(session_id)
+            for message in messages:
+                self._pending.append((session_id, message["role"], message["content"], message_size(message), now))
+                if entry is not None:
+                    entry[0].append(message)
+            if len(self._pending) >= StoreConfig.FLUSH_BATCH:
+                self._wakeup.notify()
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._ensure()
+            self._pending = [p for p in self._pending if p[0] != session_id]
+            self._cache.pop(session_id, None)
+        # 正在写入的一批提交之后再删除
+        with self._write_lock:
+            self._delete_rows(session_id)
+
+    def flush(self):
+        """立即写入所有待写消息（进程退出时自动调用）"""
+        with self._lock:
+            if self._writer is None or self._pid != os.getpid():
+                return
+        self._flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._ensure()
+            live = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            total = self._total_bytes(self._conn)
+            return {
+                "backend": "sqlite",
+                "path": self.path,
+                "live_sessions": live,
+                "total_bytes": total,
+                "max_bytes": self.max_bytes,
+                "pending_writes": len(self._pending) + len(self._writing),
+                "cached_sessions": len(self._cache),
+                "evictions": dict(self._evictions),
+                **self._counters
+            }
+
+
+def create_store(backend: str = StoreConfig.BACKEND) -> BaseSessionStore:
+    """按配置创建会话存储后端"""
+    if backend == "memory":
+        return SessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"未知的会话存储后端: {backend}")
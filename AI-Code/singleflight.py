@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# ==================== 请求合并 ====================
+class Flight:
+    """一次正在进行的上游生成 - 生产者发布片段，任意多个订阅者从头读取已有片段并跟随后续输出"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks: List[str] = []
+        self.done = False
+        self.finished = False        # 是否正常收到 [DONE]
+        self.error: Optional[BaseException] = None
+        self.cancelled = False       # 所有订阅者都已离开，生产者应尽快停止
+        self.subscribers = 0
+        self.nbytes = 0              # 已发布片段的UTF-8总字节数
+        self.usage: Optional[Dict] = None  # 上游返回的token用量（如果有）
+        self._cond = threading.Condition()
+        self._on_cancel: List[Callable[[], None]] = []
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """登记取消生产者的方法（关闭上游响应或取消任务）；已经取消时立即调用"""
+        with self._cond:
+            if not self.cancelled:
+                self._on_cancel.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        """所有订阅者都已离开：标记取消并立即停止生产者，而不是等它读到下一段上游数据"""
+        with self._cond:
+            self.cancelled = True
+            callbacks, self._on_cancel = self._on_cancel, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def publish(self, chunk: str):
+        with self._cond:
+            self.chunks.append(chunk)
+            self.nbytes += len(chunk.encode('utf-8'))
+            self._cond.notify_all()
+
+    def finish(self, finished: bool = False, error: Optional[BaseException] = None):
+        with self._cond:
+            self.done = True
+            self.finished = finished
+            self.error = error
+            self._cond.notify_all()
+
+    def follow_batches(self, max_latency: float, max_bytes: int, heartbeat: float,
+                       skip: int = 0) -> Iterator[Optional[str]]:
+        """按批返回片段：首批立即返回，之后每批最多等待 max_latency 秒或攒够 max_bytes 字节；空闲 heartbeat 秒返回 None
+
+        skip 是续传时跳过的开头字符数（客户端已经收到的部分）
+        """
+        index, sent_bytes = 0, 0
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: index < len(self.chunks) or self.done, heartbeat):
+                    batch = None
+                else:
+                    if index:
+                        deadline = time.monotonic() + max_latency
+                        while not self.done and self.nbytes - sent_bytes < max_bytes:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                break
+                            self._cond.wait(remaining)
+                    batch = "".join(self.chunks[index:])
+                    index, sent_bytes = len(self.chunks), self.nbytes
+                done = self.done and index >= len(self.chunks)
+            if batch is None:
+                yield None
+                continue
+            if skip:
+                batch, skip = batch[skip:], max(0, skip - len(batch))
+            if batch:
+                yield batch
+            if done:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class AsyncFlight(Flight):
+    """ASGI模式下的 Flight - 生产者是同一事件循环中的任务"""
+
+    def __init__(self, key: str):
+        super().__init__(key)
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: str):
+        self.chunks.append(chunk)
+        self.nbytes += len(chunk.encode('utf-8'))
+        self._changed.set()
+
+    def finish(self, finished: bool = False, error: Optional[BaseException] = None):
+        self.done = True
+        self.finished = finished
+        self.error = error
+        self._changed.set()
+
+    async def _wait_changed(self, timeout: float) -> bool:
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def afollow_batches(self, max_latency: float, max_bytes: int, heartbeat: float,
+                              skip: int = 0) -> AsyncIterator[Optional[str]]:
+        """follow_batches 的异步版本"""
+        loop = asyncio.get_running_loop()
+        index, sent_bytes = 0, 0
+        while True:
+            if index >= len(self.chunks) and not self.done and not await self._wait_changed(heartbeat):
+                yield None
+                continue
+            if index:
+                deadline = loop.time() + max_latency
+                while not self.done and self.nbytes - sent_bytes < max_bytes:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0 or not await self._wait_changed(remaining):
+                        break
+            batch = "".join(self.chunks[index:])
+            index, sent_bytes = len(self.chunks), self.nbytes
+            if skip:
+                batch, skip = batch[skip:], max(0, skip - len(batch))
+            if batch:
+                yield batch
+            if self.done and index >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class SingleFlight:
+    """相同请求（相同缓存键）的合并 - 同一时刻只向上游发起一次生成，其余调用方附着在已有的流上"""
+
+    def __init__(self, flight_class=Flight):
+        self.flight_class = flight_class
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "followers": 0, "resumed": 0, "cancelled": 0}
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """加入同键的进行中生成，返回 (flight, 是否需要由调用方启动生产者)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and not flight.done and not flight.cancelled:
+                flight.subscribers += 1
+                self._stats["followers"] += 1
+                return flight, False
+            flight = self._flights[key] = self.flight_class(key)
+            flight.subscribers = 1
+            self._stats["leaders"] += 1
+            return flight, True
+
+    def attach(self, flight: Flight):
+        """续传请求重新订阅一个已知的生成（可能已经结束，也可能已不在登记表中）"""
+        with self._lock:
+            flight.subscribers += 1
+            self._stats["resumed"] += 1
+
+    def leave(self, flight: Flight, cancel: bool = True) -> bool:
+        """订阅者离开；最后一个订阅者在生成结束前离开时取消生产者，返回是否取消了
+
+        cancel=False 时暂不取消（等待客户端重连），之后由 release() 决定
+        """
+        with self._lock:
+            flight.subscribers -= 1
+        return cancel and self.release(flight)
+
+    def release(self, flight: Flight) -> bool:
+        """没有订阅者且还没生成完时取消生产者，返回是否取消了"""
+        with self._lock:
+            if flight.subscribers > 0 or flight.done or flight.cancelled:
+                return False
+            self._stats["cancelled"] += 1
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.cancel()
+        return True
+
+    def complete(self, flight: Flight):
+        """生产者结束后从登记表移除，之后的相同请求重新生成（或命中回复缓存）"""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights)
+            stats["subscribers"] = sum(f.subscribers for f in self._flights.values())
+        return stats
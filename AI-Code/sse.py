@@ -0,0 +1,86 @@
+import os
+from typing import AsyncIterator, Iterator, Optional
+
+
+# ==================== SSE配置 ====================
+class SSEConfig:
+    """/api/chat/stream 的SSE分帧与批量发送配置"""
+    BATCH_LATENCY = float(os.environ.get("JAVX_SSE_BATCH_MS", "30")) / 1000   # 片段最多攒多久再发送（秒）
+    BATCH_BYTES = int(os.environ.get("JAVX_SSE_BATCH_BYTES", "2048"))         # 攒够多少字节立即发送
+    HEARTBEAT = float(os.environ.get("JAVX_SSE_HEARTBEAT", "15"))             # 空闲多久发送一次心跳注释（秒）
+    RETRY_MS = 3000                                                           # 建议浏览器的重连间隔
+
+
+HEARTBEAT_FRAME = b": ping\n\n"
+
+
+def encode_event(data: str, event: Optional[str] = None, event_id: Optional[str] = None) -> bytes:
+    """编码一个SSE事件；数据中的每一行单独一个 data: 字段，换行不会破坏分帧"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    for line in data.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        lines.append(f"data: {line}")
+    return ("\n".join(lines) + "\n\n").encode('utf-8')
+
+
+class SSEEncoder:
+    """把回复片段流编码成SSE帧：message 事件（带递增id）、心跳注释，以及结尾的 done / error 事件
+
+    片段源产出 str 表示一批回复文本，产出 None 表示空闲心跳。
+    给出 stream_id 时事件id为"流ID:已发送的字符数"，客户端重连时作为 Last-Event-ID 带回，从这个位置续传。
+    """
+
+    def __init__(self, stream_id: Optional[str] = None, offset: int = 0):
+        self.stream_id = stream_id
+        self.offset = offset
+        self.next_id = 0
+
+    def _event_id(self) -> str:
+        return f"{self.stream_id}:{self.offset}" if self.stream_id else str(self.next_id)
+
+    def message(self, text: str) -> bytes:
+        self.next_id += 1
+        self.offset += len(text)
+        return encode_event(text, "message", self._event_id())
+
+    def done(self) -> bytes:
+        self.next_id += 1
+        return encode_event("[DONE]", "done", self._event_id())
+
+    def error(self, error: BaseException) -> bytes:
+        return encode_event(f"API调用错误: {str(error)}. 请检查网络或API密钥。", "error")
+
+    def _frame(self, item: Optional[str]) -> bytes:
+        return HEARTBEAT_FRAME if item is None else self.message(item)
+
+    def stream(self, source: Iterator[Optional[str]]) -> Iterator[bytes]:
+        yield f"retry: {SSEConfig.RETRY_MS}\n\n".encode()
+        try:
+            for item in source:
+                yield self._frame(item)
+        except Exception as e:
+            yield self.error(e)
+            return
+        finally:
+            # 客户端断开时立即关闭数据源（取消上游生成），而不是等垃圾回收
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+        yield self.done()
+
+    async def astream(self, source: AsyncIterator[Optional[str]]) -> AsyncIterator[bytes]:
+        yield f"retry: {SSEConfig.RETRY_MS}\n\n".encode()
+        try:
+            async for item in source:
+                yield self._frame(item)
+        except Exception as e:
+            yield self.error(e)
+            return
+        finally:
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        yield self.done()
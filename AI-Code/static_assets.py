@@ -0,0 +1,142 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli  # 可选：预先生成 br 压缩版本
+except ImportError:
+    brotli = None
+
+
+# ==================== 静态资源配置 ====================
+class StaticConfig:
+    """内存中的静态资源（首页等）配置"""
+    CHECK_INTERVAL = float(os.environ.get("JAVX_STATIC_CHECK", "2"))   # 多久检查一次文件是否有改动（秒，0为只在启动时加载）
+    MIN_COMPRESS_SIZE = 256                                             # 小于这个字节数的文件不压缩
+    GZIP_LEVEL = 9                                                      # 只在加载时压缩一次，用最高压缩率
+    BROTLI_QUALITY = 11
+
+
+# 路径 -> (文件名, Content-Type, Cache-Control)；首页每次都用ETag校验，图标可以缓存一天
+ASSETS = {
+    "/": ("index.html", "text/html; charset=utf-8", "no-cache"),
+    "/favicon.ico": ("favicon.ico", "image/vnd.microsoft.icon", "public, max-age=86400"),
+}
+
+
+class Asset:
+    """一个已加载到内存的文件：原文和压缩版本，每个版本有自己的强ETag"""
+
+    def __init__(self, name: str, content_type: str, cache_control: str, body: bytes, mtime: float):
+        self.name = name
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.mtime = mtime
+        tag = hashlib.sha256(body).hexdigest()[:20]
+        # 不同的 Content-Encoding 是不同的表示，强ETag必须不同
+        self.variants: Dict[str, Tuple[bytes, str]] = {"identity": (body, f'"{tag}"')}
+        if len(body) >= StaticConfig.MIN_COMPRESS_SIZE:
+            compressed = {"gzip": gzip.compress(body, StaticConfig.GZIP_LEVEL, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(body, quality=StaticConfig.BROTLI_QUALITY)
+            for encoding, data in compressed.items():
+                if len(data) < len(body):
+                    self.variants[encoding] = (data, f'"{tag}-{encoding}"')
+
+    def negotiate(self, accept_encoding: str) -> str:
+        """按 Accept-Encoding 选择版本：br 优先，其次 gzip，q=0 表示不接受"""
+        accepted = {}
+        for part in (accept_encoding or "").lower().split(","):
+            coding, _, params = part.strip().partition(";")
+            q = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[coding.strip()] = q
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+        return "identity"
+
+    def not_modified(self, if_none_match: str, encoding: str) -> bool:
+        """If-None-Match 使用弱比较：W/ 前缀忽略，* 匹配任何版本；只和协商出的版本比较，
+        缓存里是 gzip 版本而这次协商出原文（或反过来）时要返回完整的新版本，不能 304"""
+        if not if_none_match:
+            return False
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        if "*" in tags:
+            return True
+        etag = self.variants[encoding][1]
+        return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+
+class StaticAssets:
+    """启动时把静态文件读入内存并预先压缩；请求只查内存，文件改动按 CHECK_INTERVAL 节流检查后重新加载"""
+
+    def __init__(self, folder: str, assets: Dict[str, Tuple[str, str, str]] = ASSETS,
+                 check_interval: float = StaticConfig.CHECK_INTERVAL):
+        self.folder = folder
+        self.assets = assets
+        self.check_interval = check_interval
+        self._loaded: Dict[str, Optional[Asset]] = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "not_modified": 0, "reloads": 0}
+        self.reload()
+
+    def _load(self, path: str, previous: Optional[Asset]) -> Optional[Asset]:
+        name, content_type, cache_control = self.assets[path]
+        filename = os.path.join(self.folder, name)
+        try:
+            mtime = os.stat(filename).st_mtime
+            if previous is not None and previous.mtime == mtime:
+                return previous
+            with open(filename, 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None
+        if previous is not None:
+            self._stats["reloads"] += 1
+        return Asset(name, content_type, cache_control, body, mtime)
+
+    def reload(self):
+        """重新检查所有文件（只有修改时间变了的文件才重新读取和压缩）"""
+        with self._lock:
+            self._loaded = {path: self._load(path, self._loaded.get(path)) for path in self.assets}
+            self._checked = time.monotonic()
+
+    def get(self, path: str) -> Optional[Asset]:
+        if self.check_interval > 0 and time.monotonic() - self._checked >= self.check_interval:
+            self.reload()
+        return self._loaded.get(path)
+
+    def respond(self, path: str, accept_encoding: str = "", if_none_match: str = ""
+                ) -> Optional[Tuple[int, List[Tuple[str, str]], bytes]]:
+        """返回 (状态码, 响应头, 响应体)；文件不存在时返回 None"""
+        asset = self.get(path)
+        if asset is None:
+            return None
+        encoding = asset.negotiate(accept_encoding)
+        body, etag = asset.variants[encoding]
+        headers = [("ETag", etag), ("Cache-Control", asset.cache_control), ("Vary", "Accept-Encoding")]
+        if asset.not_modified(if_none_match, encoding):
+            self._stats["not_modified"] += 1
+            return 304, headers, b""
+        self._stats["hits"] += 1
+        headers.append(("Content-Type", asset.content_type))
+        if encoding != "identity":
+            headers.append(("Content-Encoding", encoding))
+        return 200, headers, body
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats["files"] = {asset.name: {encoding: len(body) for encoding, (body, _) in asset.variants.items()}
+                          for asset in self._loaded.values() if asset is not None}
+        stats["brotli"] = brotli is not None
+        return stats
@@ -0,0 +1,124 @@
+import json
+import threading
+from typing import Dict, List, Optional
+
+try:
+    import orjson  # 可选：更快的JSON解析
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    def _loads(payload: bytes):
+        # json.loads(bytes) 会先用纯Python代码探测编码，直接按UTF-8解码更快
+        return json.loads(payload.decode('utf-8'))
+    JSON_BACKEND = "json"
+
+
+# ==================== 上游流解析 ====================
+class StreamDelta:
+    """一个上游事件中的有效字段"""
+    __slots__ = ("content", "reasoning_content", "finish_reason", "usage")
+
+    def __init__(self, content: str = "", reasoning_content: str = "",
+                 finish_reason: Optional[str] = None, usage: Optional[Dict] = None):
+        self.content = content
+        self.reasoning_content = reasoning_content
+        self.finish_reason = finish_reason
+        self.usage = usage
+
+
+_totals = {"streams": 0, "events": 0, "malformed": 0}
+_totals_lock = threading.Lock()
+
+
+def parser_stats() -> Dict:
+    """进程内所有已结束流的解析统计"""
+    with _totals_lock:
+        stats = dict(_totals)
+    stats["json_backend"] = JSON_BACKEND
+    return stats
+
+
+class StreamParser:
+    """DeepSeek (OpenAI兼容) SSE流的增量解析器 - 直接处理任意切分的原始字节，只对 data: 负载做一次JSON解析
+
+    feed() 返回本次新解析出的事件；收到 data: [DONE] 后 done 为 True。
+    无法解析的事件计入 malformed，而不是被静默丢弃。
+    """
+    __slots__ = ("done", "events", "malformed", "usage", "finish_reason", "_pending", "_closed")
+
+    def __init__(self):
+        self.done = False
+        self.events = 0
+        self.malformed = 0
+        self.usage: Optional[Dict] = None
+        self.finish_reason: Optional[str] = None
+        self._pending = b""
+        self._closed = False
+
+    def feed(self, data: bytes) -> List[StreamDelta]:
+        if self._pending:
+            data = self._pending + data
+        if b"\n" not in data:
+            # 一个事件被拆成多个很小的网络块时，只拼接不切分
+            self._pending = data
+            return []
+        lines = data.split(b"\n")
+        self._pending = lines.pop()
+        deltas = []
+        for line in lines:
+            # 空行、注释（: keep-alive）以及 event:/id: 字段都不携带内容
+            if line[:5] != b"data:":
+                continue
+            delta = self._event(line[5:].strip())
+            if delta is not None:
+                deltas.append(delta)
+            elif self.done:
+                self._pending = b""
+                break
+        return deltas
+
+    def _event(self, payload: bytes) -> Optional[StreamDelta]:
+        if payload == b"[DONE]":
+            self.done = True
+            return None
+        self.events += 1
+        try:
+            event = _loads(payload)
+            choices = event.get("choices")
+            usage = event.get("usage")
+            if not choices:
+                # 开启 include_usage 时最后一个事件只有用量
+                if usage is None:
+                    raise ValueError("no choices")
+                self.usage = usage
+                return StreamDelta(usage=usage)
+            choice = choices[0]
+            delta = choice["delta"]
+            finish_reason = choice.get("finish_reason")
+            content = delta.get("content") or ""
+            reasoning_content = delta.get("reasoning_content") or ""
+        except (ValueError, TypeError, AttributeError, LookupError):
+            self.malformed += 1
+            return None
+        if finish_reason:
+            self.finish_reason = finish_reason
+        if usage:
+            self.usage = usage
+        return StreamDelta(content, reasoning_content, finish_reason, usage)
+
+    def close(self) -> List[StreamDelta]:
+        """流结束：解析没有换行结尾的最后一行，并把本流的计数并入进程统计"""
+        deltas = []
+        line = self._pending
+        if line[:5] == b"data:" and not self.done:
+            delta = self._event(line[5:].strip())
+            if delta is not None:
+                deltas.append(delta)
+        self._pending = b""
+        if not self._closed:
+            self._closed = True
+            with _totals_lock:
+                _totals["streams"] += 1
+                _totals["events"] += self.events
+                _totals["malformed"] += self.malformed
+        return deltas
@@ -0,0 +1,194 @@
+import asyncio
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional, TextIO
+
+from colorama import AnsiToWin32, Style
+from colorama.ansitowin32 import StreamWrapper
+
+from display_width import char_width
+
+
+# ==================== 渲染配置 ====================
+class RenderConfig:
+    """终端版流式回复的输出 - 按固定帧率把新增的字批量写到终端"""
+    FPS = float(os.environ.get("JAVX_CLI_FPS", "60"))       # 每秒最多刷新几帧
+    BACKLOG = int(os.environ.get("JAVX_CLI_BACKLOG", "60"))  # 收到但还没显示的字超过多少时打字机开始加快
+
+
+def terminal_stream() -> TextIO:
+    """选择输出流：标准输出是终端并且能直接显示ANSI颜色时，直接写底层的流，跳过 colorama 对每次写入的解析；
+    需要 colorama 转换（旧版Windows控制台）、去掉颜色（输出重定向）或 sys.stdout 被替换成其他对象时仍写 sys.stdout"""
+    stdout, raw = sys.stdout, sys.__stdout__
+    if raw is None or (stdout is not raw and not isinstance(stdout, StreamWrapper)):
+        return stdout
+    converter = AnsiToWin32(raw)
+    if converter.convert or converter.strip:
+        return stdout
+    return raw
+
+
+# ==================== 流式渲染 ====================
+class StreamRenderer:
+    """流式回复的终端输出：增量维护当前行的宽度，只写新增的字（不再每个字重打整行），
+    写入的内容先放进缓冲区，按帧（默认每秒60帧）批量刷新到终端"""
+
+    def __init__(self, color: str, width: int, indent: str = "  ", fps: float = RenderConfig.FPS,
+                 stream: Optional[TextIO] = None):
+        self.color = color
+        self.width = width
+        self.indent = indent
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.stream = stream or terminal_stream()
+        self.column = 0                 # 当前行已占的列数
+        self.chars = 0
+        self.frames = 0
+        self.started: Optional[float] = None    # 第一个字写入的时间
+        self.flushed = 0.0              # 上一帧刷新的时间
+        self._pending: List[str] = [indent]
+        self._owed = 0.0                # 还没有睡的打字机停顿
+        self._escape: Optional[List[str]] = None    # 正在写入的ANSI转义序列（颜色等），不占列
+
+    def write(self, text: str):
+        """追加一段文字（超过行宽时自动换行）；距离上一帧超过帧间隔时刷新"""
+        if self.started is None:
+            self.started = time.perf_counter()
+        pending = self._pending
+        for char in text:
+            if self._escape is not None or char == '\x1b':
+                self._write_escape(char)
+                continue
+            if char == '\n':
+                pending.append('\n' + self.indent)
+                self.column = 0
+                continue
+            # ASCII字符直接算一列（只比较一次，和以前一样快），其他字符查显示宽度表（全角、emoji两列，组合符号零列）
+            width = 1 if char < '\x7f' else char_width(char)
+            if width and self.column + width > self.width and self.column:
+                pending.append('\n' + self.indent)
+                self.column = 0
+            pending.append(char)
+            self.column += width
+        self.chars += len(text)
+        if time.perf_counter() - self.flushed >= self.interval:
+            self.flush()
+
+    def _write_escape(self, char: str):
+        """转义序列原样写出但不计宽度：ESC [ 参数 结束字符（@ 到 ~），或 ESC 加一个字符；
+        序列结束后并入当前颜色，之后每帧开头重新设置颜色时不会把错误提示等的颜色改回回复的颜色"""
+        if self._escape is None:
+            self._escape = []
+        self._escape.append(char)
+        self._pending.append(char)
+        sequence = self._escape
+        if len(sequence) == 2 and char != '[' or len(sequence) > 2 and '@' <= char <= '~':
+            self.color += "".join(sequence)
+            self._escape = None
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._pending)
+
+    def next_frame(self) -> float:
+        """距离下一帧还有多少秒（有未写出的内容时才有意义）"""
+        return self.flushed + self.interval - time.perf_counter()
+
+    def flush(self):
+        """把缓冲区的内容作为一帧写出（每帧开头重新设置颜色，colorama 的 autoreset 会在每次写入后重置颜色）；
+        转义序列写到一半时等它写完，不能从中间切开"""
+        if not self._pending or self._escape is not None:
+            return
+        self.stream.write(self.color + "".join(self._pending))
+        self.stream.flush()
+        self._pending = []
+        self.frames += 1
+        self.flushed = time.perf_counter()
+
+    async def pace(self, seconds: float):
+        """打字机停顿：累计不足一帧的停顿先不睡，和后面的字合并成同一帧；够一帧时先刷新再一起睡（不阻塞事件循环）"""
+        self._owed += seconds
+        if self._owed >= self.interval:
+            self.flush()
+            await asyncio.sleep(self._owed)
+            self._owed = 0.0
+
+    def finish(self):
+        """写出剩余内容，重置颜色并换行"""
+        self._escape = None
+        self._pending.append(Style.RESET_ALL + '\n')
+        self.flush()
+
+    def stats(self) -> Dict:
+        """输出统计：字数、帧数和持续输出速率（从第一个字到最后一帧）"""
+        elapsed = self.flushed - self.started if self.started is not None else 0.0
+        return {
+            "chars": self.chars,
+            "frames": self.frames,
+            "seconds": round(elapsed, 3),
+            "chars_per_sec": round(self.chars / elapsed, 1) if elapsed > 0 else None
+        }
+
+
+# ==================== 打字机 ====================
+class Typewriter:
+    """打字机效果的生产者/消费者：网络任务用 feed 放入收到的片段（不等待显示），run 按节奏取出显示；
+    积压的字超过 backlog 后按比例缩短停顿，instant 模式不停顿"""
+
+    def __init__(self, renderer: StreamRenderer, delay: Callable[[str], float], instant: bool = False,
+                 backlog: int = RenderConfig.BACKLOG):
+        self.renderer = renderer
+        self.delay = delay              # 每个字之后的停顿（秒）
+        self.instant = instant
+        self.backlog_limit = max(1, backlog)
+        self.backlog = 0                # 收到但还没显示的字数
+        self.max_backlog = 0
+        self._queue = asyncio.Queue()
+        self._shown: List[str] = []
+
+    def feed(self, chunk: str):
+        self.backlog += len(chunk)
+        self.max_backlog = max(self.max_backlog, self.backlog)
+        self._queue.put_nowait(chunk)
+
+    def close(self):
+        """没有更多内容了（run 显示完队列中剩余的字后返回）"""
+        self._queue.put_nowait(None)
+
+    def speedup(self) -> float:
+        """停顿的缩放比例：积压不超过 backlog 个字时为1，超过后按比例缩短，让显示追上网络"""
+        if self.backlog <= self.backlog_limit:
+            return 1.0
+        return self.backlog_limit / self.backlog
+
+    async def run(self):
+        renderer = self.renderer
+        while True:
+            chunk = await self._next_chunk()
+            if chunk is None:
+                return
+            for char in chunk:
+                renderer.write(char)
+                self._shown.append(char)
+                self.backlog -= 1
+                if not self.instant:
+                    await renderer.pace(self.delay(char) * self.speedup())
+
+    async def _next_chunk(self) -> Optional[str]:
+        """取下一段；队列为空时已经写入的字最迟在下一帧显示出来（没有新内容时也不超过帧率）"""
+        if self._queue.empty() and self.renderer.pending:
+            delay = self.renderer.next_frame()
+            if delay > 0:
+                try:
+                    return await asyncio.wait_for(self._queue.get(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            self.renderer.flush()
+        return await self._queue.get()
+
+    def text(self) -> str:
+        """已经显示的内容（中途取消时为显示到的部分）"""
+        return "".join(self._shown)
+
+    def stats(self) -> Dict:
+        return dict(self.renderer.stats(), max_backlog=self.max_backlog, instant=self.instant)
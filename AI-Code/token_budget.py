@@ -0,0 +1,79 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+
+# ==================== 上下文预算配置 ====================
+class BudgetConfig:
+    """每种思考模式可用于历史对话的token预算（可用 JAVX_CONTEXT_BUDGET_<模式> 覆盖）"""
+    CONTEXT_BUDGET = {
+        mode: int(os.environ.get(f"JAVX_CONTEXT_BUDGET_{mode.upper()}", default))
+        for mode, default in (("deep", "6000"), ("creative", "3000"), ("analytical", "4000"))
+    }
+    DEFAULT_BUDGET = 4000
+
+    # 离线估算系数（接近 DeepSeek 分词器在中英混排文本上的平均值）
+    CJK_TOKENS = 0.6        # 每个汉字/假名/韩文
+    ASCII_TOKENS = 0.3      # 每个ASCII字符（约3~4个字母一个token）
+    OTHER_TOKENS = 1.0      # 其他字符（全角标点、表情等）
+    MESSAGE_OVERHEAD = 4    # 每条消息的角色和分隔符开销
+    CACHE_SIZE = int(os.environ.get("JAVX_TOKEN_CACHE", "4096"))  # 缓存多少条消息的估算结果
+
+
+CJK_PATTERN = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+
+# (长度, 哈希) -> token数；只保存两个整数而不是消息正文，缓存不会让已经被会话存储淘汰的消息继续占着内存
+_token_cache: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """离线估算一段中英混排文本的token数（按长度和哈希缓存，同一条消息只计算一次）"""
+    key = (len(text), hash(text))
+    with _token_cache_lock:
+        tokens = _token_cache.get(key)
+        if tokens is not None:
+            _token_cache.move_to_end(key)
+            return tokens
+    tokens = _count_tokens(text)
+    with _token_cache_lock:
+        _token_cache[key] = tokens
+        while len(_token_cache) > BudgetConfig.CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return tokens
+
+
+def _count_tokens(text: str) -> int:
+    """不经过缓存的估算"""
+    ascii_count = len(text.encode('ascii', 'ignore'))
+    cjk_count = len(CJK_PATTERN.findall(text))
+    other_count = len(text) - ascii_count - cjk_count
+    return int(cjk_count * BudgetConfig.CJK_TOKENS + ascii_count * BudgetConfig.ASCII_TOKENS
+               + other_count * BudgetConfig.OTHER_TOKENS + 0.999)
+
+
+def message_tokens(message: Dict) -> int:
+    """单条消息的token数（含消息开销）"""
+    return estimate_tokens(message["content"]) + BudgetConfig.MESSAGE_OVERHEAD
+
+
+def context_budget(thinking_mode: str) -> int:
+    return BudgetConfig.CONTEXT_BUDGET.get(thinking_mode, BudgetConfig.DEFAULT_BUDGET)
+
+
+def select_context(history: List[Dict], budget: int) -> List[Dict]:
+    """从最新的消息开始向前装入预算，返回按时间顺序排列的上下文窗口"""
+    used = 0
+    start = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        used += message_tokens(history[i])
+        if used > budget:
+            break
+        start = i
+    # 窗口不以助手回复开头，避免模型看到没有提问的回答
+    while start < len(history) and history[start]["role"] == "assistant":
+        start += 1
+    return history[start:]
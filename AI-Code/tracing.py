@@ -0,0 +1,308 @@
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+
+# ==================== 追踪配置 ====================
+class TraceConfig:
+    """请求追踪与性能剖析配置 - 默认全部关闭，关闭时每个埋点只多一次 ContextVar 读取"""
+    ENABLED = os.environ.get("JAVX_TRACE", "0") == "1"                  # 记录每个请求各阶段的耗时，结束时写一行日志
+    SLOW_MS = float(os.environ.get("JAVX_TRACE_SLOW_MS", "0"))          # 只记录总耗时超过多少毫秒的请求（0为全部）
+    PROFILE_RATE = float(os.environ.get("JAVX_PROFILE_RATE", "0"))      # 随机抽取多少比例的请求用 cProfile 剖析
+    PROFILE_HEADER = os.environ.get("JAVX_PROFILE_HEADER", "0") == "1"  # 是否允许请求头 X-Javx-Profile: 1 触发剖析
+    PROFILE_DIR = os.environ.get("JAVX_PROFILE_DIR", "profiles")        # 剖析结果（pstats格式）的保存目录
+    LOG_FILE = os.environ.get("JAVX_LOG_FILE", "")                      # 日志文件（默认输出到stderr）
+    LOG_LEVEL = os.environ.get("JAVX_LOG_LEVEL", "INFO")
+
+
+REQUEST_ID_HEADER = "X-Request-ID"
+PROFILE_REQUEST_HEADER = "X-Javx-Profile"
+
+logger = logging.getLogger("javx")
+
+_request_id = contextvars.ContextVar("javx_request_id", default="-")
+_trace = contextvars.ContextVar("javx_trace", default=None)
+
+# cProfile 同一线程只能有一个在运行，ASGI模式下还会计入同一事件循环上的其他请求，所以同时只剖析一个请求
+# （同一请求可以在多个线程中同时剖析）
+_profile_lock = threading.Lock()
+_profiling = {"trace": None, "depth": 0}
+
+_NULL = nullcontext()
+
+
+# ==================== 日志 ====================
+class RequestIdFilter(logging.Filter):
+    """给日志记录加上当前请求的id（线程/协程各自独立）"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+def setup_logging(default_file: str = ""):
+    """配置 javx 日志：每行带请求id；重复调用不会重复添加handler"""
+    if logger.handlers:
+        return
+    filename = TraceConfig.LOG_FILE or default_file
+    # 日志文件在第一次写入时才创建
+    handler = logging.FileHandler(filename, encoding='utf-8', delay=True) if filename else logging.StreamHandler()
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(TraceConfig.LOG_LEVEL)
+    logger.propagate = False
+
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    """沿用上游代理传来的请求id（只接受安全字符），否则生成一个"""
+    if incoming and len(incoming) <= 64 and re.fullmatch(r"[A-Za-z0-9._:-]+", incoming):
+        return incoming
+    return secrets.token_hex(8)
+
+
+def request_id() -> str:
+    return _request_id.get()
+
+
+# ==================== 追踪 ====================
+class Trace:
+    """一个请求的阶段耗时：span 记录一段时间，mark 记录距请求开始的时刻，add 把多次的小段时间累加到一起"""
+    __slots__ = ("name", "request_id", "start", "spans", "marks", "totals", "attrs", "profile", "_profilers")
+
+    def __init__(self, name: str, request_id: str, profile: bool = False):
+        self.name = name
+        self.request_id = request_id
+        self.start = time.perf_counter()
+        self.spans: List[List] = []
+        self.marks: Dict[str, float] = {}
+        self.totals: Dict[str, List] = {}
+        self.attrs: Dict = {}
+        self.profile = profile
+        self._profilers: List[cProfile.Profile] = []
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    def record(self, name: str, started: float, ended: Optional[float] = None):
+        """记录一段从 started 开始的时间（perf_counter）"""
+        ended = time.perf_counter() if ended is None else ended
+        self.spans.append([name, round((started - self.start) * 1000, 2), round((ended - started) * 1000, 2)])
+
+    def mark(self, name: str):
+        """记录某个时刻（只记第一次，例如首字）"""
+        if name not in self.marks:
+            self.marks[name] = round((time.perf_counter() - self.start) * 1000, 2)
+
+    def add(self, name: str, seconds: float):
+        total = self.totals.get(name)
+        if total is None:
+            self.totals[name] = [seconds, 1]
+        else:
+            total[0] += seconds
+            total[1] += 1
+
+    @contextmanager
+    def profiled(self):
+        """在当前线程用 cProfile 剖析这段代码；同一请求在多个线程中的剖析结果最后合并到一个文件"""
+        if not self.profile:
+            yield
+            return
+        with _profile_lock:
+            claimed = _profiling["trace"] in (None, self)
+            if claimed:
+                _profiling["trace"] = self
+                _profiling["depth"] += 1
+        if not claimed:
+            # 另一个请求正在剖析
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            try:
+                profiler.enable()
+            except ValueError:
+                # 这个线程上已经有其他剖析工具在运行
+                yield
+                return
+            try:
+                yield
+            finally:
+                profiler.disable()
+                self._profilers.append(profiler)
+        finally:
+            with _profile_lock:
+                _profiling["depth"] -= 1
+                if _profiling["depth"] == 0:
+                    _profiling["trace"] = None
+
+    def finish(self, **attrs):
+        """请求结束：写一行JSON格式的追踪日志，需要时保存剖析结果"""
+        total_ms = (time.perf_counter() - self.start) * 1000
+        self.attrs.update(attrs)
+        if self.profile:
+            self._dump_profile()
+        if TraceConfig.ENABLED and total_ms >= TraceConfig.SLOW_MS:
+            logger.info("trace %s", json.dumps({
+                "name": self.name,
+                "request_id": self.request_id,
+                "total_ms": round(total_ms, 2),
+                "spans": self.spans,
+                "marks": self.marks,
+                "totals": {name: {"ms": round(seconds * 1000, 2), "count": count}
+                           for name, (seconds, count) in self.totals.items()},
+                **self.attrs
+            }, ensure_ascii=False, default=str))
+
+    def _dump_profile(self):
+        if not self._profilers:
+            return
+        try:
+            os.makedirs(TraceConfig.PROFILE_DIR, exist_ok=True)
+            path = os.path.join(TraceConfig.PROFILE_DIR,
+                                f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}-{self.request_id}.prof")
+            stats = pstats.Stats(self._profilers[0])
+            for profiler in self._profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(path)
+            logger.info("性能剖析已保存: %s（python -m pstats %s 查看）", path, path)
+        except Exception as e:
+            logger.warning("保存性能剖析失败: %s", e)
+
+
+def should_profile(header_value: Optional[str] = None) -> bool:
+    """这个请求是否要剖析：请求头显式要求（需开启 JAVX_PROFILE_HEADER），或按 JAVX_PROFILE_RATE 随机抽中"""
+    if TraceConfig.PROFILE_HEADER and header_value == "1":
+        return True
+    return TraceConfig.PROFILE_RATE > 0 and random.random() < TraceConfig.PROFILE_RATE
+
+
+def start(name: str, req_id: Optional[str] = None, profile: bool = False) -> Optional[Trace]:
+    """开始一个请求：设置当前上下文的请求id；开启追踪或需要剖析时返回 Trace，否则返回 None"""
+    req_id = req_id or new_request_id()
+    _request_id.set(req_id)
+    if not TraceConfig.ENABLED and not profile:
+        _trace.set(None)
+        return None
+    trace = Trace(name, req_id, profile)
+    _trace.set(trace)
+    return trace
+
+
+def end():
+    """请求结束：清除当前上下文的请求id和追踪（WSGI的工作线程会被后续请求复用，不清除的话它们的日志会沿用这个请求id）"""
+    _request_id.set("-")
+    _trace.set(None)
+
+
+def current() -> Optional[Trace]:
+    return _trace.get()
+
+
+def span(name: str):
+    """当前请求的一个阶段（没有开启追踪时返回空的上下文管理器）"""
+    trace = _trace.get()
+    return _NULL if trace is None else trace.span(name)
+
+
+def profiled():
+    trace = _trace.get()
+    return _NULL if trace is None else trace.profiled()
+
+
+def bind(fn):
+    """把函数绑定到当前请求的上下文（请求id、追踪），交给其他线程运行时同样记录日志和剖析"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(_run_profiled, fn, args, kwargs)
+    return run
+
+
+def _run_profiled(fn, args, kwargs):
+    with profiled():
+        return fn(*args, **kwargs)
+
+
+def traced(frames, trace: Trace):
+    """包装响应体生成器：迭代期间剖析，累计服务器写出每一帧的时间，结束（含客户端断开）时写追踪日志"""
+    try:
+        with trace.profiled():
+            for frame in frames:
+                written = time.perf_counter()
+                yield frame
+                trace.add("client_write", time.perf_counter() - written)
+    finally:
+        frames.close()
+        trace.finish()
+
+
+async def atraced(frames, trace: Trace):
+    """traced 的异步版本（ASGI模式下剖析期间同一事件循环上的其他请求也会被计入）"""
+    try:
+        with trace.profiled():
+            async for frame in frames:
+                written = time.perf_counter()
+                yield frame
+                trace.add("client_write", time.perf_counter() - written)
+    finally:
+        await frames.aclose()
+        trace.finish()
+
+
+# ==================== httpx 连接阶段 ====================
+# httpx 的 trace 扩展按阶段回调，记录建立TCP连接、TLS握手和等待响应头的时间（只在开启追踪时传入）
+HTTPX_STAGES = {
+    "connection.connect_tcp": "connect_tcp",
+    "connection.start_tls": "start_tls",
+    "http11.receive_response_headers": "response_headers",
+    "http2.receive_response_headers": "response_headers",
+}
+
+
+def httpx_hook(trace: Trace):
+    started = {}
+
+    def hook(event: str, info: Dict):
+        stage, _, phase = event.rpartition(".")
+        name = HTTPX_STAGES.get(stage)
+        if name is None:
+            return
+        if phase == "started":
+            started[stage] = time.perf_counter()
+        elif stage in started:
+            trace.record(name, started.pop(stage))
+    return hook
+
+
+def httpx_extensions() -> Optional[Dict]:
+    """当前请求开启了追踪时返回 httpx 请求的 extensions（同步客户端用）"""
+    trace = _trace.get()
+    return None if trace is None else {"trace": httpx_hook(trace)}
+
+
+def ahttpx_extensions() -> Optional[Dict]:
+    """同上，异步客户端的回调需要是协程"""
+    trace = _trace.get()
+    if trace is None:
+        return None
+    hook = httpx_hook(trace)
+
+    async def ahook(event: str, info: Dict):
+        hook(event, info)
+    return {"trace": ahook}
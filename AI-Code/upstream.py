@@ -0,0 +1,398 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401  HTTP/2 需要 httpx[http2]
+    HTTP2_AVAILABLE = httpx is not None
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# ==================== 连接池配置 ====================
+class PoolConfig:
+    """上游连接池配置（均可通过环境变量覆盖）"""
+    POOL_SIZE = int(os.environ.get("JAVX_POOL_SIZE", "32"))              # 每个上游主机的最大连接数
+    KEEPALIVE = float(os.environ.get("JAVX_KEEPALIVE", "60"))            # 空闲连接保活时间（秒）
+    HTTP2 = os.environ.get("JAVX_HTTP2", "0") == "1"                     # 是否启用HTTP/2多路复用
+    CONNECT_TIMEOUT = float(os.environ.get("JAVX_CONNECT_TIMEOUT", "10"))
+    READ_TIMEOUT = float(os.environ.get("JAVX_READ_TIMEOUT", "90"))
+    POOL_TIMEOUT = float(os.environ.get("JAVX_POOL_TIMEOUT", "30"))      # 等待空闲连接的最长时间
+    ASYNC_POOL_SIZE = int(os.environ.get("JAVX_ASYNC_POOL_SIZE", "1024"))  # ASGI模式下每个事件循环的最大连接数
+    DRAIN_LIMIT = 64 * 1024                                              # 收到[DONE]后最多读完的剩余字节，读完才能复用连接
+
+
+class PoolTimeout(Exception):
+    """等待连接池空位超时"""
+
+
+# 本地连接池的等待超时：请求还没有发出，和上游端点是否健康无关
+POOL_TIMEOUTS = (PoolTimeout, httpx.PoolTimeout) if httpx is not None else (PoolTimeout,)
+
+
+# ==================== 响应包装 ====================
+class UpstreamResponse:
+    """统一 requests / httpx 两种后端的流式响应接口"""
+
+    def __init__(self, raw, backend: str):
+        self.raw = raw
+        self.backend = backend
+        self.status_code = raw.status_code
+        self.closed = False
+        # 两种后端的字节流都只能迭代一次，保存同一个迭代器，提前结束后还能接着读完剩余部分
+        self._chunks = raw.iter_bytes() if backend == "httpx" else raw.iter_content(chunk_size=None)
+
+    def raise_for_status(self):
+        self.raw.raise_for_status()
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """按网络到达顺序返回原始字节块"""
+        yield from self._chunks
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """逐行返回字节串（不含换行符）"""
+        pending = b""
+        for chunk in self._chunks:
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line.rstrip(b"\r")
+        if pending:
+            yield pending.rstrip(b"\r")
+
+    def close(self):
+        """提前关闭（客户端断开等），之后不再读完剩余部分，连接直接丢弃并让出连接池名额"""
+        self.closed = True
+        self.raw.close()
+
+
+# ==================== 上游客户端 ====================
+class SocketOptionsAdapter(HTTPAdapter):
+    """连接池中每个新建的连接都设置 socket_options（requests 的标准扩展方式：重载 init_poolmanager）"""
+
+    __attrs__ = HTTPAdapter.__attrs__ + ["socket_options"]
+
+    def __init__(self, socket_options: List[Tuple[int, int, int]], **kwargs):
+        self.socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **pool_kwargs):
+        pool_kwargs["socket_options"] = self.socket_options
+        super().init_poolmanager(*args, **pool_kwargs)
+
+
+class UpstreamClient:
+    """进程级上游HTTP客户端 - 连接池 + keep-alive，去掉每轮对话的TCP/TLS握手"""
+
+    def __init__(self, pool_size: int = PoolConfig.POOL_SIZE, keepalive: float = PoolConfig.KEEPALIVE,
+                 http2: bool = PoolConfig.HTTP2, connect_timeout: float = PoolConfig.CONNECT_TIMEOUT,
+                 read_timeout: float = PoolConfig.READ_TIMEOUT, pool_timeout: float = PoolConfig.POOL_TIMEOUT):
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_timeout = pool_timeout
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.backend = "httpx" if self.http2 else "requests"
+        self.pid = os.getpid()
+
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._requests_total = 0
+        self._last_release = time.monotonic()
+
+        if self.http2:
+            self._client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size,
+                    keepalive_expiry=keepalive
+                )
+            )
+        else:
+            self._client = requests.Session()
+            # 开启TCP keepalive，避免空闲连接被中间设备静默断开
+            adapter = SocketOptionsAdapter(self._socket_options(), pool_connections=4, pool_maxsize=pool_size,
+                                           pool_block=True)
+            self._client.mount("https://", adapter)
+            self._client.mount("http://", adapter)
+            self._adapter = adapter
+
+    def _socket_options(self):
+        options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1), (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, max(1, int(self.keepalive))))
+        return options
+
+    def _timeout(self, timeout: Optional[Tuple[float, float]]):
+        connect, read = timeout or (self.connect_timeout, self.read_timeout)
+        if self.http2:
+            return httpx.Timeout(read, connect=connect, pool=self.pool_timeout)
+        return (connect, read)
+
+    def _acquire(self):
+        with self._lock:
+            self._waiting += 1
+        try:
+            if not self._slots.acquire(timeout=self.pool_timeout):
+                raise PoolTimeout(f"等待上游连接超过 {self.pool_timeout} 秒")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        with self._lock:
+            # requests 后端没有空闲过期机制，池完全空闲且超过保活时间时整体回收
+            if not self.http2 and self._in_use == 0 and time.monotonic() - self._last_release > self.keepalive:
+                self._adapter.poolmanager.clear()
+            self._in_use += 1
+            self._requests_total += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_use -= 1
+            self._last_release = time.monotonic()
+        self._slots.release()
+
+    @contextmanager
+    def stream(self, url: str, headers: Dict[str, str], body: bytes,
+               timeout: Optional[Tuple[float, float]] = None) -> Iterator[UpstreamResponse]:
+        """发送流式POST请求，退出上下文时把连接归还连接池"""
+        with tracing.span("pool_wait"):
+            self._acquire()
+        try:
+            if self.http2:
+                with self._client.stream("POST", url, headers=headers, content=body, timeout=self._timeout(timeout),
+                                         extensions=tracing.httpx_extensions()) as raw:
+                    response = UpstreamResponse(raw, "httpx")
+                    yield response
+                    if not response.closed:
+                        self._drain(response._chunks)
+            else:
+                # requests 不区分建立连接和等待响应头，合计为一个阶段
+                with tracing.span("response_headers"):
+                    raw = self._client.post(url, headers=headers, data=body, stream=True,
+                                            timeout=self._timeout(timeout))
+                try:
+                    response = UpstreamResponse(raw, "requests")
+                    yield response
+                    if not response.closed:
+                        self._drain(response._chunks)
+                finally:
+                    raw.close()
+        finally:
+            self._release()
+
+    def status(self, url: str, headers: Dict[str, str], timeout: Optional[Tuple[float, float]] = None) -> int:
+        """发送GET请求并只返回状态码（用于上游健康检查）"""
+        self._acquire()
+        try:
+            response = self._client.get(url, headers=headers, timeout=self._timeout(timeout))
+            response.close()
+            return response.status_code
+        finally:
+            self._release()
+
+    @staticmethod
+    def _drain(chunks: Iterator[bytes]):
+        """读完响应的剩余部分（通常只剩分块结束标记），否则连接会被丢弃而不是归还连接池"""
+        try:
+            received = 0
+            for chunk in chunks:
+                received += len(chunk)
+                if received > PoolConfig.DRAIN_LIMIT:
+                    return
+        except Exception:
+            pass
+
+    def _idle_connections(self) -> int:
+        if self.http2:
+            pool = getattr(self._client._transport, "_pool", None)
+            return sum(1 for conn in getattr(pool, "connections", []) if conn.is_idle())
+        idle = 0
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is not None and pool.pool is not None:
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return idle
+
+    def stats(self) -> Dict:
+        """连接池状态（用于容量规划）"""
+        with self._lock:
+            in_use, waiting, total = self._in_use, self._waiting, self._requests_total
+        return {
+            "backend": self.backend,
+            "http2": self.http2,
+            "pool_size": self.pool_size,
+            "in_use": in_use,
+            "idle": self._idle_connections(),
+            "waiting": waiting,
+            "requests_total": total
+        }
+
+    def close(self):
+        self._client.close()
+
+
+# ==================== 异步上游客户端 ====================
+class AsyncUpstreamResponse:
+    """httpx 异步流式响应的薄包装，与 UpstreamResponse 保持同样的字节接口"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.status_code = raw.status_code
+        # httpx 的字节流只能迭代一次，保存同一个迭代器，提前结束后还能接着读完剩余部分
+        self._chunks = raw.aiter_bytes()
+
+    def raise_for_status(self):
+        self.raw.raise_for_status()
+
+    async def aiter_chunks(self) -> AsyncIterator[bytes]:
+        async for chunk in self._chunks:
+            yield chunk
+
+    async def aiter_lines(self) -> AsyncIterator[bytes]:
+        pending = b""
+        async for chunk in self._chunks:
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line.rstrip(b"\r")
+        if pending:
+            yield pending.rstrip(b"\r")
+
+    async def aclose(self):
+        await self.raw.aclose()
+
+
+class AsyncUpstreamClient:
+    """ASGI模式使用的非阻塞上游客户端（每个事件循环一个）"""
+
+    def __init__(self, pool_size: int = PoolConfig.ASYNC_POOL_SIZE, keepalive: float = PoolConfig.KEEPALIVE,
+                 http2: bool = PoolConfig.HTTP2, connect_timeout: float = PoolConfig.CONNECT_TIMEOUT,
+                 read_timeout: float = PoolConfig.READ_TIMEOUT, pool_timeout: float = PoolConfig.POOL_TIMEOUT):
+        if httpx is None:
+            raise RuntimeError("ASGI模式需要安装 httpx：pip install httpx")
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_timeout = pool_timeout
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._in_use = 0
+        self._waiting = 0
+        self._requests_total = 0
+        self._client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive
+            )
+        )
+
+    @asynccontextmanager
+    async def stream(self, url: str, headers: Dict[str, str], body: bytes,
+                     timeout: Optional[Tuple[float, float]] = None) -> AsyncIterator[AsyncUpstreamResponse]:
+        """发送流式POST请求，退出上下文时把连接归还连接池"""
+        connect, read = timeout or (self.connect_timeout, self.read_timeout)
+        self._requests_total += 1
+        self._waiting += 1
+        waiting = True
+        try:
+            async with self._client.stream("POST", url, headers=headers, content=body,
+                                           timeout=httpx.Timeout(read, connect=connect, pool=self.pool_timeout),
+                                           extensions=tracing.ahttpx_extensions()) as raw:
+                self._waiting -= 1
+                waiting = False
+                self._in_use += 1
+                try:
+                    response = AsyncUpstreamResponse(raw)
+                    yield response
+                    await self._drain(response._chunks)
+                finally:
+                    self._in_use -= 1
+        finally:
+            if waiting:
+                self._waiting -= 1
+
+    @staticmethod
+    async def _drain(chunks: AsyncIterator[bytes]):
+        """读完响应的剩余部分，让连接可以归还连接池"""
+        try:
+            received = 0
+            async for chunk in chunks:
+                received += len(chunk)
+                if received > PoolConfig.DRAIN_LIMIT:
+                    return
+        except Exception:
+            pass
+
+    def stats(self) -> Dict:
+        """连接池状态（单事件循环内访问，无需加锁）"""
+        pool = getattr(self._client._transport, "_pool", None)
+        return {
+            "backend": "httpx-async",
+            "http2": self.http2,
+            "pool_size": self.pool_size,
+            "in_use": self._in_use,
+            "idle": sum(1 for conn in getattr(pool, "connections", []) if conn.is_idle()),
+            "waiting": self._waiting,
+            "requests_total": self._requests_total
+        }
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_client: Optional[UpstreamClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> UpstreamClient:
+    """获取进程级共享客户端（fork后的子进程会重新创建，避免共享套接字）"""
+    global _client
+    if _client is None or _client.pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client.pid != os.getpid():
+                _client = UpstreamClient()
+    return _client
+
+
+# 以事件循环本身为键（弱引用）：循环被回收后客户端随之丢弃，新循环也不会因为复用了旧循环的 id 拿到旧客户端
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncUpstreamClient]" = \
+    weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> AsyncUpstreamClient:
+    """获取当前事件循环的共享异步客户端"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        # 空闲连接的传输对象引用着自己的循环，循环关闭后不会被回收：新建客户端时顺便丢弃已关闭循环的客户端
+        for closed in [other for other in _async_clients.keys() if other.is_closed()]:
+            _async_clients.pop(closed, None)
+        client = _async_clients[loop] = AsyncUpstreamClient()
+    return client
+
+
+async def close_async_client():
+    """关闭并丢弃当前事件循环的异步客户端（ASGI服务关闭时调用）"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
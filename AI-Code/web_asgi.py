@@ -0,0 +1,527 @@
+"""UI-WEB 的 asyncio (ASGI) 服务模式
+
+与 UI-WEB.py 提供相同的路由（/、/api/chat/stream、/api/chat/batch、/api/status、/metrics），但每个流只占用一个协程，
+上千个并发SSE连接可以共享同一个事件循环。启动方式（每核一个工作进程）：
+
+    cd AI-Code
+    uvicorn web_asgi:app --host 0.0.0.0 --port 5000 --workers 4
+
+也可以直接运行 `python web_asgi.py`（单进程）。
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from upstream import close_async_client, get_async_client
+from singleflight import AsyncFlight, SingleFlight
+from admission import AdmissionController, Rejected
+from sse import SSEConfig, SSEEncoder
+from stream_parser import StreamParser, parser_stats
+from metrics import CONTENT_TYPE, StreamMetrics, observe_upstream, registry, reply_lengths, reply_tokens
+from router import NoUpstreamAvailable, endpoint_fault
+from hedging import HedgeConfig, Race, hedging
+from static_assets import StaticAssets
+from chat_core import (build_chat_request, compactor, conversation_store, prompt_cache, response_cache, router,
+                       save_stream_turn, save_turn, streams, validate_prompt_options)
+from resumable import parse_event_id
+import tracing
+from tracing import PROFILE_REQUEST_HEADER, REQUEST_ID_HEADER, logger
+from batch import FORMAT_ERROR, BatchConfig, arun_batch, clamp_concurrency, dump_result, parse_items
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "")
+
+# 日志每行带请求id（JAVX_TRACE=1 时每个请求结束后记录各阶段耗时）；任务创建时复制上下文，请求id自动传到生成任务
+tracing.setup_logging()
+
+# 相同请求合并：同一时刻只向上游发起一次生成
+inflight = SingleFlight(AsyncFlight)
+
+# 准入控制：每客户端限流/并发上限，全局并发满载时有界排队，超限快速返回429
+admission = AdmissionController()
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Content-Type"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+]
+
+
+async def send_response(send, status, body, content_type="application/json", headers=()):
+    """发送一个完整的非流式响应"""
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())]
+                   + list(headers) + CORS_HEADERS
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, data, headers=()):
+    await send_response(send, status, json.dumps(data, ensure_ascii=False), headers=headers)
+
+
+async def read_body(receive):
+    """读取完整的请求体"""
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+# 首页和图标在启动时读入内存并预先压缩（gzip/br），带强ETag，请求时不访问磁盘，也不需要线程池
+static_assets = StaticAssets(STATIC_FOLDER)
+
+
+def request_header(scope, name):
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+async def serve_asset(scope, send, path):
+    """从内存返回静态资源，返回是否找到了文件"""
+    result = static_assets.respond(path, request_header(scope, b"accept-encoding"),
+                                   request_header(scope, b"if-none-match"))
+    if result is None:
+        return False
+    status, headers, body = result
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers]
+                   + [(b"content-length", str(len(body)).encode())] + CORS_HEADERS
+    })
+    await send({"type": "http.response.body", "body": body})
+    return True
+
+
+async def index(scope, receive, send):
+    """访问根路径时，返回index.html"""
+    if not await serve_asset(scope, send, "/"):
+        await send_response(send, 404, "前端文件未找到，请检查index.html是否在static目录下。", "text/html; charset=utf-8")
+
+
+async def favicon(scope, receive, send):
+    """处理网站图标请求"""
+    if not await serve_asset(scope, send, "/favicon.ico"):
+        await send_response(send, 204, b"", "text/plain")
+
+
+async def read_upstream(flight, endpoint, headers, body, race=None, attempt="primary"):
+    """从一个上游端点读取流并发布到 flight，返回解析器；结束时把首字时间和成败报告给路由
+
+    对冲时（传入 race）先认领第一段内容的一方才发布，输掉的一方由获胜方取消任务
+    """
+    parser = StreamParser()
+    trace = tracing.current()
+    started = time.perf_counter()
+    status = "error"
+    ttft = None
+    try:
+        async with get_async_client().stream(endpoint.url, endpoint.headers(headers), body) as response:
+            status = response.status_code
+            observe_upstream(status, time.perf_counter() - started)
+            response.raise_for_status()
+
+            # 直接解析网络到达的原始字节块，同一块里的多个增量合并成一次发布
+            async for data in response.aiter_chunks():
+                handled = time.perf_counter()
+                text = "".join([delta.content for delta in parser.feed(data)])
+                if text:
+                    if ttft is None:
+                        ttft = handled - started
+                        if race is not None and not race.claim(attempt):
+                            raise asyncio.CancelledError()
+                        hedging.observe(ttft)
+                        if trace is not None:
+                            trace.mark("upstream_first_token")
+                            trace.attrs["endpoint"] = endpoint.name
+                    flight.publish(text)
+                if trace is not None:
+                    trace.add("parse_publish", time.perf_counter() - handled)
+                if parser.done:
+                    break
+            else:
+                # 流结束时最后一行没有换行符：由 close 解析出最后的增量
+                text = "".join([delta.content for delta in parser.close()])
+                if text and (race is None or race.claim(attempt)):
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    flight.publish(text)
+    except asyncio.CancelledError:
+        router.report(endpoint, ttft, error=None)
+        raise
+    except Exception as e:
+        if status == "error":
+            observe_upstream(status, time.perf_counter() - started)
+        # 4xx（429除外）是请求本身的问题，不算这个端点的失败
+        router.report(endpoint, ttft, error=True if endpoint_fault(e) else None)
+        logger.warning("上游 %s 请求失败（%s）: %s", endpoint.name, attempt, e)
+        raise
+    finally:
+        parser.close()
+    if race is not None and not race.claim(attempt):
+        router.report(endpoint, ttft, error=None)
+        raise asyncio.CancelledError()
+    router.report(endpoint, ttft, error=not parser.done)
+    return parser
+
+
+async def read_hedged(flight, endpoint, headers, body):
+    """首字超过对冲延迟仍未到达时，向另一个（或同一个）端点发起相同请求，先出字的一方继续，另一方的任务立即取消"""
+    hedging.request()
+    race = Race()
+    primary = asyncio.create_task(read_upstream(flight, endpoint, headers, body, race, "primary"))
+    race.on_cancel("primary", primary.cancel)
+    tasks = [primary]
+    try:
+        await asyncio.wait(tasks, timeout=hedging.delay())
+        if primary.done() or race.winner is not None or not hedging.try_fire():
+            return await primary
+        second = router.choose(exclude=[endpoint]) or router.choose()
+        if second is None:
+            return await primary
+        hedge = asyncio.create_task(read_upstream(flight, second, headers, body, race, "hedge"))
+        race.on_cancel("hedge", hedge.cancel)
+        tasks.append(hedge)
+
+        # 等到有一方出字（另一方随即被取消），或者两个都在出字之前失败
+        await asyncio.wait(tasks, return_when=asyncio.ALL_COMPLETED)
+        if race.winner == "hedge":
+            hedging.won()
+            return hedge.result()
+        return primary.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def generate_into(flight, headers, body, key):
+    """在独立任务中读取上游流，发布给附着在同一请求上的所有客户端"""
+    router.start_health_checks()
+    try:
+        last_error = None
+        for endpoint in router.attempts():
+            try:
+                read = read_hedged if HedgeConfig.ENABLED else read_upstream
+                parser = await read(flight, endpoint, headers, body)
+                break
+            except Exception as e:
+                # 已经发出内容后不能再切换端点（客户端已经看到了部分回复）；
+                # 密钥无效、参数错误等换端点也一样，直接把真实的错误交给用户
+                if flight.chunks or not endpoint_fault(e):
+                    raise
+                last_error = e
+        else:
+            raise last_error or NoUpstreamAvailable("所有上游端点都暂时不可用（熔断中）")
+
+        flight.usage = parser.usage
+        flight.finish(parser.done)
+        if parser.done:
+            response_cache.put(key, "".join(flight.chunks))
+    except asyncio.CancelledError:
+        # 客户端全部断开，上游请求随任务一起取消
+        flight.finish()
+        reply_lengths.cancel(reply_tokens(None, "".join(flight.chunks)))
+    except Exception as e:
+        logger.warning("生成失败: %s", e)
+        flight.finish(error=e)
+    finally:
+        inflight.complete(flight)
+
+
+async def call_deepseek_api_stream(session_id, message, thinking_mode, style, is_humorous, stream_id, resume_from=None):
+    """非阻塞地调用API获取流式响应（带上下文）；按批产出回复文本，空闲时产出None作为心跳，出错时抛出异常
+
+    生成按 stream_id 保留以便断线续传；resume_from 是续传请求的字符偏移，此时附着到已有的流而不是重新生成
+    """
+    stream_metrics = StreamMetrics(thinking_mode, style)
+    trace = tracing.current()
+    outcome, tokens, role = "error", None, "resume"
+    try:
+        if resume_from is None:
+            # 会话存储的读写可能等待数据库（SQLite后端），放到线程里执行，不阻塞同一个事件循环上的其他流
+            headers, body, key = await asyncio.to_thread(
+                build_chat_request, session_id, message, thinking_mode, style, is_humorous)
+
+            # 相同的提问和上下文直接回放缓存的回复
+            with tracing.span("cache_lookup"):
+                cached = response_cache.get(key)
+            if cached is not None:
+                role = "cache"
+                async for chunk in response_cache.areplay(cached):
+                    stream_metrics.chunk()
+                    yield chunk
+                await asyncio.to_thread(save_turn, session_id, message, cached, thinking_mode)
+                outcome, tokens = "cache", reply_tokens(None, cached)
+                return
+
+            # 已有相同请求在生成时直接附着上去，否则由本请求启动生成
+            flight, leader = inflight.join(key)
+            role = "leader" if leader else "follower"
+            if leader:
+                flight.task = asyncio.create_task(generate_into(flight, headers, body, key))
+                flight.on_cancel(flight.task.cancel)
+            stream, offset = streams.register(stream_id, flight, session_id, message, thinking_mode), 0
+        else:
+            # 续传：附着到仍在进行的生成，或回放已经生成完的回复，不再请求上游
+            stream, offset = streams.resume(stream_id), resume_from
+            if stream is None:
+                raise LookupError("要续传的回复已过期，请重新发送")
+            flight = stream.flight
+            inflight.attach(flight)
+
+        full_response, disconnected = "", False
+        try:
+            # 把1~3个字的增量按时间/字节数合并成较大的帧，减少每个流的写入次数
+            async for batch in flight.afollow_batches(SSEConfig.BATCH_LATENCY, SSEConfig.BATCH_BYTES,
+                                                      SSEConfig.HEARTBEAT, skip=offset):
+                if batch is not None:
+                    stream_metrics.chunk()
+                    full_response += batch
+                    if trace is not None:
+                        trace.mark("first_chunk")
+                yield batch
+                if batch is not None:
+                    offset += len(batch)
+        except (GeneratorExit, asyncio.CancelledError):
+            disconnected = True
+            raise
+        finally:
+            leave_stream(stream, offset, disconnected)
+
+        await asyncio.to_thread(save_stream_turn, stream, not flight.finished)
+        outcome = "completed" if flight.finished else "truncated"
+        tokens = reply_tokens(flight.usage, full_response)
+    except (GeneratorExit, asyncio.CancelledError):
+        outcome = "cancelled"
+        raise
+    finally:
+        stream_metrics.finish(outcome, tokens)
+        if trace is not None:
+            trace.attrs.update(outcome=outcome, tokens=tokens, role=role, thinking_mode=thinking_mode)
+
+
+def leave_stream(stream, delivered, disconnected):
+    """客户端离开一个流；中途断开且没有其他客户端时等待宽限期，期间可以续传，之后保存部分回复并取消生成"""
+    last = streams.detach(stream, delivered)
+    if not disconnected or not last:
+        inflight.leave(stream.flight)
+        return
+    inflight.leave(stream.flight, cancel=False)
+    if streams.grace > 0:
+        asyncio.get_running_loop().call_later(streams.grace, abandon_stream, stream)
+    else:
+        abandon_stream(stream)
+
+
+def abandon_stream(stream):
+    """宽限期结束仍没有客户端重连：保存已经发出的部分回复（标记为截断），没有其他订阅者时取消上游生成"""
+    if streams.is_abandoned(stream):
+        asyncio.get_running_loop().run_in_executor(None, save_stream_turn, stream, True)
+        inflight.release(stream.flight)
+
+
+async def send_stream(send, frames):
+    try:
+        async for frame in frames:
+            await send({"type": "http.response.body", "body": frame, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        # 断开时立即关闭帧生成器（连带数据源），不等垃圾回收
+        await frames.aclose()
+
+
+async def wait_disconnect(receive):
+    """请求体读完之后，receive() 只会在客户端断开时返回 http.disconnect"""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def stream_until_disconnect(send, receive, frames):
+    """发送流式响应体；服务器在客户端断开后通常静默丢弃写入，需要单独监听断开事件才能及时取消"""
+    streaming = asyncio.create_task(send_stream(send, frames))
+    disconnect = asyncio.create_task(wait_disconnect(receive))
+    try:
+        await asyncio.wait({streaming, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        streaming.cancel()
+    # 等取消完成（清理工作在帧生成器的 finally 中进行）；正常结束时把发送中的异常抛出来
+    await asyncio.wait({streaming})
+    if not streaming.cancelled():
+        streaming.result()
+
+
+async def chat_stream(scope, receive, send):
+    """流式聊天接口（带上下文支持）"""
+    try:
+        data = json.loads(await read_body(receive) or b"{}")
+    except ValueError:
+        data = {}
+    message = data.get('message', '')
+    thinking_mode = data.get('thinking_mode', 'deep')
+    style = data.get('style', 'casual')
+    is_humorous = data.get('is_humorous', False)
+
+    if not message:
+        return await send_json(send, 400, {"error": "请输入消息内容"})
+
+    # 提前拒绝未知的思考模式/风格，而不是在生成提示词时抛出KeyError
+    error = validate_prompt_options(thinking_mode, style)
+    if error:
+        return await send_json(send, 400, {"error": error})
+
+    # 使用客户端IP作为会话ID（简化处理）
+    session_id = (scope.get("client") or ("unknown",))[0]
+
+    # 请求id写入日志和响应头；开启追踪或抽中剖析时记录这个请求各阶段的耗时
+    req_id = tracing.new_request_id(request_header(scope, REQUEST_ID_HEADER.lower().encode()))
+    trace = tracing.start("chat_stream", req_id,
+                          tracing.should_profile(request_header(scope, PROFILE_REQUEST_HEADER.lower().encode())))
+
+    # 断线重连时带上最后收到的事件id（流ID:字符偏移），从断开的位置继续
+    resume = parse_event_id(request_header(scope, b"last-event-id"))
+    if resume is not None and streams.get(resume[0]) is None:
+        return await send_json(send, 410, {"error": "要续传的回复已过期，请重新发送"})
+    stream_id, resume_from = resume if resume is not None else (streams.new_id(), None)
+
+    try:
+        await admission.aacquire(session_id)
+    except Rejected as rejected:
+        return await send_json(send, 429, {"error": "请求过于频繁或服务繁忙，请稍后再试", "reason": rejected.reason},
+                               headers=[(b"retry-after", str(rejected.retry_after).encode())])
+
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no"), (REQUEST_ID_HEADER.lower().encode(), req_id.encode())]
+                       + CORS_HEADERS
+        })
+        source = call_deepseek_api_stream(session_id, message, thinking_mode, style, is_humorous, stream_id, resume_from)
+        frames = SSEEncoder(stream_id, resume_from or 0).astream(source)
+        if trace is not None:
+            frames = tracing.atraced(frames, trace)
+        # 客户端断开时取消上游生成（部分回复在 call_deepseek_api_stream 中保存）
+        await stream_until_disconnect(send, receive, frames)
+    finally:
+        # 流结束或客户端断开后归还准入名额
+        admission.release(session_id)
+
+
+async def batch_lines(results):
+    """把批量结果编码成JSONL；关闭时连带取消进行中的任务"""
+    try:
+        async for result in results:
+            yield dump_result(result)
+    finally:
+        await results.aclose()
+
+
+async def chat_batch(scope, receive, send):
+    """批量接口：请求体为JSONL（每行一个提问），按完成顺序逐行返回结果"""
+    items = parse_items((await read_body(receive)).decode('utf-8', 'replace').splitlines())
+    if not items:
+        return await send_json(send, 400, {"error": FORMAT_ERROR})
+    if len(items) > BatchConfig.MAX_ITEMS:
+        return await send_json(send, 413, {"error": f"单次最多 {BatchConfig.MAX_ITEMS} 条，请分批提交"})
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    concurrency = clamp_concurrency(query.get("concurrency", [None])[0], admission.client_streams)
+
+    # 整个批量请求占一个准入名额，上游并发由 concurrency 参数限制，并且不超过每个客户端的并发流上限
+    session_id = (scope.get("client") or ("unknown",))[0]
+    try:
+        await admission.aacquire(session_id)
+    except Rejected as rejected:
+        return await send_json(send, 429, {"error": "请求过于频繁或服务繁忙，请稍后再试", "reason": rejected.reason},
+                               headers=[(b"retry-after", str(rejected.retry_after).encode())])
+
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson"), (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no")] + CORS_HEADERS
+        })
+        # 客户端断开时取消剩余任务
+        await stream_until_disconnect(send, receive, batch_lines(arun_batch(items, concurrency)))
+    finally:
+        admission.release(session_id)
+
+
+async def status(scope, receive, send):
+    """服务状态检查"""
+    sessions = await asyncio.to_thread(conversation_store.stats)
+    await send_json(send, 200, {
+        "status": "running",
+        "timestamp": datetime.now().strftime("%H:%M:%S"),
+        "upstream_pool": get_async_client().stats(),
+        "sessions": sessions,
+        "prompt_cache": prompt_cache.stats(),
+        "compaction": compactor.stats(),
+        "response_cache": response_cache.stats(),
+        "inflight": inflight.stats(),
+        "admission": admission.stats(),
+        "stream_parser": parser_stats(),
+        "upstreams": router.stats(),
+        "hedging": hedging.stats(),
+        "cancellation": reply_lengths.stats(),
+        "static_assets": static_assets.stats(),
+        "resumable_streams": streams.stats()
+    })
+
+
+async def prometheus_metrics(scope, receive, send):
+    """Prometheus 指标（每个工作进程各自统计）"""
+    await send_response(send, 200, registry.render(), CONTENT_TYPE)
+
+
+ROUTES = {
+    ("GET", "/"): index,
+    ("GET", "/favicon.ico"): favicon,
+    ("POST", "/api/chat/stream"): chat_stream,
+    ("POST", "/api/chat/batch"): chat_batch,
+    ("GET", "/api/status"): status,
+    ("GET", "/metrics"): prometheus_metrics,
+}
+
+
+async def app(scope, receive, send):
+    """ASGI入口"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_async_client()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    if method == "OPTIONS":
+        return await send_response(send, 204, b"", "text/plain")
+    handler = ROUTES.get((method, path))
+    if handler is None:
+        allowed = any(route_path == path for _, route_path in ROUTES)
+        return await send_json(send, 405 if allowed else 404, {"error": "Method Not Allowed" if allowed else "Not Found"})
+    await handler(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,174 @@
+"""/api/chat/stream 负载测试
+
+以固定并发向 /api/chat/stream 发送一定数量的请求（每个请求的消息不同，不会被合并或命中缓存），统计：
+吞吐量（请求/秒、回复字节/秒）、首字时间(TTFT)和完整耗时的分位数、按状态码/异常分类的失败数，
+以及被测服务进程（含工作子进程）的内存占用(RSS)。
+
+两种用法（在仓库根目录）：
+
+    # 自动启动模拟上游和被测服务（线程模式或ASGI模式）
+    python Benchmarks/load_test.py --spawn asgi --concurrency 200 --requests 2000 --ttft 0.3 --delay 0.02
+    python Benchmarks/load_test.py --spawn threaded --concurrency 64 --requests 500 --error-rate 0.05
+
+    # 压测已经在运行的服务（RSS 需要提供进程号，服务的上游可以用 mock_deepseek.py 单独启动）
+    python Benchmarks/load_test.py --url http://127.0.0.1:5000 --server-pid 12345 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+import httpx
+
+from mock_deepseek import MockOptions, free_port, start as start_mock
+from stream_capacity import start_server, wait_ready
+
+
+# ==================== 进程内存 ====================
+def process_tree(pid):
+    """pid 及其所有子进程（gunicorn/uvicorn 的工作进程）"""
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def rss_mb(pid):
+    """进程树的总RSS（MB，读取 /proc，非Linux系统返回None）"""
+    total = 0
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return round(total / 1024, 1) if total else None
+
+
+async def sample_rss(pid, samples, interval=0.5):
+    while True:
+        value = rss_mb(pid)
+        if value is not None:
+            samples.append(value)
+        await asyncio.sleep(interval)
+
+
+# ==================== 负载 ====================
+async def run_load(base, concurrency, total, timeout):
+    ttfts, latencies, failures = [], [], Counter()
+    received = 0
+    next_index = 0
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency), timeout=timeout) as client:
+        async def one(index):
+            nonlocal received
+            start = time.perf_counter()
+            first = None
+            head = b""
+            try:
+                async with client.stream("POST", base + "/api/chat/stream",
+                                         json={"message": f"压测请求 #{index}"}) as res:
+                    if res.status_code != 200:
+                        await res.aread()
+                        failures[f"http_{res.status_code}"] += 1
+                        return
+                    async for data in res.aiter_bytes():
+                        received += len(data)
+                        if first is None:
+                            head = (head + data)[-4096:]
+                            if b"event: message" in head:
+                                first = time.perf_counter() - start
+                        if b"event: error" in data:
+                            failures["stream_error"] += 1
+                            return
+            except httpx.HTTPError as e:
+                failures[type(e).__name__] += 1
+                return
+            if first is not None:
+                ttfts.append(first)
+            latencies.append(time.perf_counter() - start)
+
+        async def worker():
+            nonlocal next_index
+            while next_index < total:
+                index = next_index
+                next_index += 1
+                await one(index)
+
+        begin = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - begin
+
+    def percentiles(values):
+        values = sorted(values)
+        pick = lambda p: round(values[min(len(values) - 1, int(p * len(values)))], 3) if values else None
+        return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": pick(1.0)}
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "completed": len(latencies),
+        "failures": dict(failures),
+        "wall_time_s": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "received_kib_per_s": round(received / 1024 / elapsed, 1),
+        "ttft_s": percentiles(ttfts),
+        "latency_s": percentiles(latencies),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spawn", choices=["threaded", "asgi"], help="启动模拟上游和被测服务")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="已运行的服务地址（不使用 --spawn 时）")
+    parser.add_argument("--server-pid", type=int, help="已运行服务的进程号（用于统计RSS）")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=32, help="gthread 每个进程的线程数")
+    parser.add_argument("--timeout", type=float, default=300)
+    MockOptions.add_arguments(parser)
+    args = parser.parse_args()
+
+    upstream = proc = None
+    base, pid = args.url.rstrip("/"), args.server_pid
+    if args.spawn:
+        options = MockOptions.from_args(args)
+        upstream, upstream_url = await start_mock(options)
+        port = free_port()
+        proc = start_server(args.spawn, port, upstream_url, args)
+        base, pid = f"http://127.0.0.1:{port}", proc.pid
+
+    samples = []
+    sampler = asyncio.create_task(sample_rss(pid, samples)) if pid else None
+    try:
+        await wait_ready(base)
+        idle_rss = rss_mb(pid) if pid else None
+        result = await run_load(base, args.concurrency, args.requests, args.timeout)
+        result["server"] = args.spawn or base
+        result["server_rss_mb"] = {"idle": idle_rss, "peak": max(samples) if samples else None,
+                                   "end": rss_mb(pid) if pid else None}
+        if upstream is not None:
+            result["upstream"] = options.stats
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    finally:
+        if sampler is not None:
+            sampler.cancel()
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if upstream is not None:
+            upstream.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
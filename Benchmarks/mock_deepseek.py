@@ -0,0 +1,196 @@
+"""本地模拟的 DeepSeek /v1/chat/completions 服务，用于压测和离线调试
+
+支持流式（SSE）和非流式请求，可配置首字时间、token间隔、token数量，并可注入故障：
+按比例返回错误状态码、流到一半断开连接、慢速(slow-loris)逐字节发送。
+
+用法（在仓库根目录）：
+
+    python Benchmarks/mock_deepseek.py --port 8999 --ttft 0.3 --delay 0.03 --tokens 200
+    python Benchmarks/mock_deepseek.py --port 8999 --error-rate 0.1 --disconnect-rate 0.05
+
+然后让网页版或终端版指向它：
+
+    JAVX_API_URL=http://127.0.0.1:8999/v1/chat/completions python AI-Code/UI-WEB.py
+    JAVX_API_URL=http://127.0.0.1:8999/v1/chat/completions python AI-Code/Milcorx.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import time
+
+VOCABULARY = ["你好", "，", "这是", "一段", "模拟", "的", "回复", " mock", " token", "。", "\n"]
+
+
+class MockOptions:
+    """模拟上游的行为参数"""
+
+    def __init__(self, ttft=0.2, delay=0.02, jitter=0.0, tokens=100, error_rate=0.0, error_status=500,
+                 disconnect_rate=0.0, slowloris=False, slowloris_delay=0.05, seed=None):
+        self.ttft = ttft                        # 响应头之后到第一个token的时间（秒）
+        self.delay = delay                      # token间隔（秒）
+        self.jitter = jitter                    # 间隔的随机抖动比例（0.2 表示 ±20%）
+        self.tokens = tokens                    # 每个回复的token数
+        self.error_rate = error_rate            # 直接返回 error_status 的请求比例
+        self.error_status = error_status
+        self.disconnect_rate = disconnect_rate  # 流到一半断开（不发送 [DONE]）的请求比例
+        self.slowloris = slowloris              # 响应头和每个事件都逐字节慢速发送
+        self.slowloris_delay = slowloris_delay
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "disconnects": 0}
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument("--ttft", type=float, default=0.2, help="首字时间（秒）")
+        parser.add_argument("--delay", type=float, default=0.02, help="token间隔（秒）")
+        parser.add_argument("--jitter", type=float, default=0.0, help="间隔随机抖动比例")
+        parser.add_argument("--tokens", type=int, default=100, help="每个回复的token数")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误状态码的请求比例")
+        parser.add_argument("--error-status", type=int, default=500)
+        parser.add_argument("--disconnect-rate", type=float, default=0.0, help="流到一半断开的请求比例")
+        parser.add_argument("--slowloris", action="store_true", help="逐字节慢速发送响应")
+        parser.add_argument("--slowloris-delay", type=float, default=0.05)
+        parser.add_argument("--seed", type=int, default=None)
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.ttft, args.delay, args.jitter, args.tokens, args.error_rate, args.error_status,
+                   args.disconnect_rate, args.slowloris, args.slowloris_delay, args.seed)
+
+    def pause(self, seconds):
+        if self.jitter:
+            seconds *= 1 + self.random.uniform(-self.jitter, self.jitter)
+        return asyncio.sleep(seconds)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def chunk_event(payload):
+    event = b"data: " + json.dumps(payload, ensure_ascii=False).encode('utf-8') + b"\n\n"
+    return b"%x\r\n%s\r\n" % (len(event), event)
+
+
+async def write(writer, data, options):
+    """写出一段数据；slow-loris 模式下逐字节发送"""
+    if not options.slowloris:
+        writer.write(data)
+        return await writer.drain()
+    for i in range(len(data)):
+        writer.write(data[i:i + 1])
+        await writer.drain()
+        await asyncio.sleep(options.slowloris_delay)
+
+
+async def send_json(writer, status, payload, options, reason=b"OK"):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await write(writer, b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s"
+                % (status, reason, len(body), body), options)
+
+
+async def stream_reply(writer, model, options):
+    options.stats["streams"] += 1
+    await write(writer, b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n",
+                options)
+    created = int(time.time())
+    disconnect_at = (options.random.randrange(max(1, options.tokens))
+                     if options.random.random() < options.disconnect_rate else None)
+    await options.pause(options.ttft)
+    for i in range(options.tokens):
+        if i == disconnect_at:
+            options.stats["disconnects"] += 1
+            writer.transport.abort()
+            return False
+        if i:
+            await options.pause(options.delay)
+        await write(writer, chunk_event({
+            "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": {"content": VOCABULARY[i % len(VOCABULARY)]}, "finish_reason": None}]
+        }), options)
+    await write(writer, chunk_event({
+        "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": options.tokens, "total_tokens": options.tokens}
+    }), options)
+    done = b"data: [DONE]\n\n"
+    await write(writer, b"%x\r\n%s\r\n0\r\n\r\n" % (len(done), done), options)
+    return True
+
+
+async def handle(reader, writer, options):
+    """极简的 HTTP/1.1 keep-alive 处理：POST /v1/chat/completions 以外的请求返回404"""
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, *header_lines = head.split(b"\r\n")
+            length = 0
+            for line in header_lines:
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            raw = await reader.readexactly(length)
+            options.stats["requests"] += 1
+            if not request_line.split(b" ")[1].endswith(b"/chat/completions"):
+                await send_json(writer, 404, {"error": {"message": "not found"}}, options, b"Not Found")
+                continue
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                await send_json(writer, 400, {"error": {"message": "invalid json"}}, options, b"Bad Request")
+                continue
+            if options.random.random() < options.error_rate:
+                options.stats["errors"] += 1
+                await send_json(writer, options.error_status,
+                                {"error": {"message": "mock injected error", "type": "server_error"}}, options, b"Error")
+                continue
+            model = body.get("model", "deepseek-chat")
+            if body.get("stream"):
+                if not await stream_reply(writer, model, options):
+                    return
+            else:
+                await options.pause(options.ttft + options.delay * options.tokens)
+                content = "".join(VOCABULARY[i % len(VOCABULARY)] for i in range(options.tokens))
+                await send_json(writer, 200, {
+                    "id": "chatcmpl-mock", "object": "chat.completion", "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": options.tokens, "total_tokens": options.tokens}
+                }, options)
+    except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start(options, host="127.0.0.1", port=0):
+    """在当前事件循环中启动模拟上游，返回 (server, /v1/chat/completions 的URL)"""
+    port = port or free_port()
+    server = await asyncio.start_server(lambda r, w: handle(r, w, options), host, port, backlog=4096)
+    return server, f"http://{host}:{port}/v1/chat/completions"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8999)
+    MockOptions.add_arguments(parser)
+    args = parser.parse_args()
+
+    options = MockOptions.from_args(args)
+    server, url = await start(options, args.host, args.port)
+    print(f"模拟上游已启动: {url}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(json.dumps(options.stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,128 @@
+"""上游SSE解析微基准：旧的逐行解析 vs stream_parser.StreamParser
+
+生成一段模拟的 DeepSeek 流（content 增量 + 结尾的用量事件 + [DONE]），按网络读取的大小切块后分别用
+以下方式解析，输出每秒处理的事件数：
+
+- legacy_web: 原 UI-WEB 的做法（按行切分、逐行 decode/strip、json.loads）
+- legacy_cli: 原终端版的做法（先把字节块解码成文本再切行、json.loads）
+- parser_json / parser_orjson: StreamParser 分别使用标准库 json 和 orjson（未安装时跳过）
+
+用法（在仓库根目录）：
+
+    python Benchmarks/parser_bench.py --events 20000 --chunk 512
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AI-Code"))
+import stream_parser  # noqa: E402
+from stream_parser import StreamParser  # noqa: E402
+
+
+def make_stream(events):
+    parts = []
+    for i in range(events):
+        delta = {"content": "你好" if i % 3 else f"token{i} "}
+        parts.append(b"data: " + json.dumps({
+            "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 1700000000,
+            "model": "deepseek-chat", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]
+        }, ensure_ascii=False).encode('utf-8') + b"\n\n")
+    parts.append(b'data: {"choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": %d}}\n\n' % events)
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def split_chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def legacy_web(chunks):
+    out = []
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line = line.rstrip(b"\r").decode('utf-8').strip()
+            if not line:
+                continue
+            if line.startswith('data: '):
+                line = line[6:]
+            if line == '[DONE]':
+                return out
+            try:
+                out.append(json.loads(line)['choices'][0].get('delta', {}).get('content', '') or "")
+            except Exception:
+                pass
+    return out
+
+
+def legacy_cli(chunks):
+    out = []
+    pending = ""
+    for chunk in chunks:
+        pending += chunk.decode('utf-8', 'ignore')
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            if line.startswith('data: ') and (payload := line[6:].strip()) != '[DONE]':
+                try:
+                    content = json.loads(payload)["choices"][0]["delta"].get("content", "")
+                    if content:
+                        out.append(content)
+                except Exception:
+                    continue
+    return out
+
+
+def shared_parser(chunks):
+    out = []
+    parser = StreamParser()
+    for chunk in chunks:
+        for delta in parser.feed(chunk):
+            if delta.content:
+                out.append(delta.content)
+        if parser.done:
+            break
+    parser.close()
+    return out
+
+
+def measure(fn, chunks, events, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    return round(events / best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--chunk", type=int, default=512, help="每次网络读取的字节数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    chunks = split_chunks(make_stream(args.events), args.chunk)
+    expected = "".join(legacy_web(chunks))
+    results = {}
+    for name, fn in (("legacy_web", legacy_web), ("legacy_cli", legacy_cli)):
+        results[name] = measure(fn, chunks, args.events, args.repeat)
+
+    backends = [("parser_json", lambda payload: json.loads(payload.decode('utf-8')))]
+    if stream_parser.JSON_BACKEND == "orjson":
+        backends.append(("parser_orjson", stream_parser.orjson.loads))
+    for name, loads in backends:
+        stream_parser._loads = loads
+        assert "".join(shared_parser(chunks)) == expected
+        results[name] = measure(shared_parser, chunks, args.events, args.repeat)
+
+    print(json.dumps({"events": args.events, "chunk_bytes": args.chunk, "events_per_second": results},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""并发流容量基准：线程模式(gunicorn gthread) vs asyncio模式(uvicorn)
+
+脚本会启动一个本地的模拟上游（按固定间隔输出SSE token），再以子进程方式启动被测服务，
+让 JAVX_API_URL 指向模拟上游，然后同时打开 N 个 /api/chat/stream 连接并统计：
+完成数、同时处于活跃状态的峰值流数量、首字节时间(TTFT)分位数和总耗时。
+
+用法（在仓库根目录）：
+
+    python Benchmarks/stream_capacity.py --server threaded --concurrency 256
+    python Benchmarks/stream_capacity.py --server asgi --concurrency 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from mock_deepseek import MockOptions, free_port, start as start_mock
+
+CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AI-Code")
+
+
+# ==================== 被测服务 ====================
+def start_server(kind, port, upstream_url, args):
+    """以子进程启动被测服务"""
+    # 所有连接都来自同一个IP，放开准入控制，测的是服务本身的并发流容量
+    env = dict(os.environ, JAVX_API_URL=upstream_url, PYTHONUNBUFFERED="1", JAVX_CLIENT_RATE="1000000",
+               JAVX_CLIENT_BURST="1000000", JAVX_CLIENT_STREAMS="1000000", JAVX_MAX_STREAMS="1000000")
+    if kind == "threaded":
+        cmd = [sys.executable, "-m", "gunicorn", "-k", "gthread", "-w", str(args.workers),
+               "--threads", str(args.threads), "-b", f"127.0.0.1:{port}", "--timeout", "300", "UI-WEB:app"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "web_asgi:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.workers), "--log-level", "warning", "--backlog", "4096"]
+    return subprocess.Popen(cmd, cwd=CODE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(base):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(base + "/api/status")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("被测服务启动失败")
+
+
+# ==================== 负载 ====================
+async def run_load(base, concurrency, timeout):
+    active = 0
+    peak = 0
+    ttfts = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def one():
+            nonlocal active, peak, errors
+            start = time.perf_counter()
+            first = True
+            try:
+                async with client.stream("POST", base + "/api/chat/stream", json={"message": "hi"}) as res:
+                    async for data in res.aiter_bytes():
+                        # 首字时间以第一个 message 事件为准（流开头的 retry 帧不算）
+                        if first and b"event: message" in data:
+                            first = False
+                            ttfts.append(time.perf_counter() - start)
+                            active += 1
+                            peak = max(peak, active)
+                if not first:
+                    active -= 1
+            except httpx.HTTPError:
+                errors += 1
+                if not first:
+                    active -= 1
+
+        begin = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - begin
+
+    ttfts.sort()
+    pct = lambda p: ttfts[min(len(ttfts) - 1, int(p * len(ttfts)))] if ttfts else float("nan")
+    return {
+        "concurrency": concurrency,
+        "completed": len(ttfts),
+        "errors": errors,
+        "peak_active_streams": peak,
+        "ttft_p50_s": round(pct(0.50), 3),
+        "ttft_p99_s": round(pct(0.99), 3),
+        "wall_time_s": round(elapsed, 2)
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["threaded", "asgi"], default="asgi")
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=32, help="gthread 每个进程的线程数")
+    parser.add_argument("--tokens", type=int, default=50, help="每个流的token数")
+    parser.add_argument("--interval", type=float, default=0.04, help="token间隔（秒）")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    port = free_port()
+    upstream, upstream_url = await start_mock(MockOptions(ttft=args.interval, delay=args.interval, tokens=args.tokens))
+    proc = start_server(args.server, port, upstream_url, args)
+    try:
+        base = f"http://127.0.0.1:{port}"
+        await wait_ready(base)
+        result = await run_load(base, args.concurrency, args.timeout)
+        result["server"] = args.server
+        result["stream_duration_s"] = round(args.tokens * args.interval, 2)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    finally:
+        proc.terminate()
+        proc.wait()
+        upstream.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""终端显示宽度微基准：旧的 '\\u4e00' <= c <= '\\u9fff' 比较 vs display_width 宽度表
+
+分别用三种文本（以ASCII为主的代码回复、中文回复、带emoji和全角符号的回复）测量每秒处理的字符数：
+
+- width_legacy: 旧的逐字比较（只认识基本汉字区）
+- width_stream: 流式渲染器的做法（ASCII字符直接算一列，其他字符调用 char_width 查表）
+- width_text: display_width.text_width（整段为ASCII时直接取长度）
+- split_legacy / split_new: 旧的 UI.split_text 和使用宽度表的 UI.split_text（按72列换行）
+
+用法（在仓库根目录）：
+
+    python Benchmarks/width_bench.py --chars 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AI-Code"))
+from display_width import char_width, text_width  # noqa: E402
+from Milcorx import UI  # noqa: E402
+
+SAMPLES = {
+    "ascii": "def handler(request):\n    items = [item.strip() for item in request.args.get('q', '').split(',')]\n"
+             "    return {'status': 'ok', 'count': len(items)}  # 返回结果\n",
+    "cjk": "你好！这是一段模拟的回复，包含中文标点：逗号、句号。还有一些 English words 和数字 123。\n",
+    "emoji": "😜 轻松风格 | 🤓 机智风格 | ✨ 风格升级 ✨ ｈｉ！한국어カタカナ 💡 提示：按 exit 退出～\n",
+}
+
+
+def make_text(sample, chars):
+    return (sample * (chars // len(sample) + 1))[:chars]
+
+
+def width_legacy(text):
+    total = 0
+    for char in text:
+        total += 2 if '\u4e00' <= char <= '\u9fff' else 1
+    return total
+
+
+def width_stream(text):
+    total = 0
+    for char in text:
+        total += 1 if char < '\x7f' else char_width(char)
+    return total
+
+
+def width_text(text):
+    return sum(text_width(line) for line in text.split('\n'))
+
+
+def split_legacy(text, max_length):
+    lines = []
+    for paragraph in text.split('\n'):
+        if not paragraph:
+            lines.append("")
+            continue
+        current_line = ""
+        current_width = 0
+        for char in paragraph:
+            char_width = 2 if '\u4e00' <= char <= '\u9fff' else 1
+            if current_width + char_width > max_length and current_line:
+                lines.append(current_line)
+                current_line = char
+                current_width = char_width
+            else:
+                current_line += char
+                current_width += char_width
+        if current_line:
+            lines.append(current_line)
+    return lines
+
+
+def measure(fn, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return round(len(text) / best)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, default=200000)
+    parser.add_argument("--width", type=int, default=72, help="换行宽度（列）")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for name, sample in SAMPLES.items():
+        text = make_text(sample, args.chars)
+        results[name] = {
+            "width_legacy": measure(width_legacy, text, args.repeat),
+            "width_stream": measure(width_stream, text, args.repeat),
+            "width_text": measure(width_text, text, args.repeat),
+            "split_legacy": measure(lambda t: split_legacy(t, args.width), text, args.repeat),
+            "split_new": measure(lambda t: UI.split_text(t, args.width), text, args.repeat),
+            # 旧算法和宽度表算出的总列数（差值来自全角符号、emoji等旧算法算错的字符）
+            "columns": {"legacy": width_legacy(text.replace('\n', '')), "table": width_text(text)},
+        }
+
+    print(json.dumps({"chars": args.chars, "chars_per_second": results}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()